@@ -1,10 +1,23 @@
-from flask_restx import Api, Resource, fields, Namespace
-from flask import request
-from app import app
+from flask_restx import Api, Resource, fields, Namespace, marshal
+from flask import request, Response, make_response, stream_with_context
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+from app import app, db
 from models import Trip, User
 from chat_advisor import get_chat_response
 from weather import WeatherAPI
 from flask_login import current_user, login_required
+from utils.user_quota import ai_rate_limited
+from utils import fast_json
+from utils.json_patch import JsonPatchConflict
+from utils.db_routing import replica_reads
+from route_optimizer import schedule_route_optimization
+from sqlalchemy.orm.exc import StaleDataError
+from trip_archive import archived_trip_dicts, trip_or_404
+from trip_updates import JSON_PATCH, MERGE_PATCH, patch_trip, update_trip
+from trip_transfer import IMPORT_MAX_BYTES, export_trips, import_trips
+from trip_generator import regenerate_trip_day
+from utils.upstream_governor import UpstreamError
+from trip_sync import CursorExpiredError, changes_since, trip_list_version, trip_version
 
 # Initialize Flask-RESTX
 api = Api(
@@ -15,6 +28,14 @@ api = Api(
     doc='/api/docs'
 )
 
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    """Encode API responses with the fast JSON encoder instead of flask-restx's json.dumps."""
+    body = fast_json.dumps_bytes(data, indent=app.debug) + b'\n'
+    response = make_response(body, code)
+    response.headers.extend(headers or {})
+    return response
+
 # Create namespaces for different API categories
 trips_ns = Namespace('trips', description='Trip operations')
 chat_ns = Namespace('chat', description='AI Chat operations')
@@ -31,7 +52,16 @@ trip_model = api.model('Trip', {
     'travel_type': fields.String(required=True, description='Type of travel'),
     'num_people': fields.Integer(required=True, description='Number of people'),
     'itinerary': fields.Raw(description='Trip itinerary'),
-    'shared_with': fields.Raw(description='Users the trip is shared with')
+    'shared_with': fields.Raw(description='Users the trip is shared with'),
+    'version': fields.Integer(readonly=True, description='Incremented on every change; the ETag is W/"<id>.<version>"'),
+    'updated_at': fields.DateTime(readonly=True, description='Last modification time (UTC)')
+})
+
+trip_sync_model = api.model('TripSync', {
+    'cursor': fields.String(description='Pass as ?cursor= on the next sync'),
+    'created': fields.List(fields.Nested(trip_model), description='Trips created since the cursor'),
+    'updated': fields.List(fields.Nested(trip_model), description='Trips updated since the cursor'),
+    'deleted': fields.List(fields.Integer, description='Ids of trips deleted since the cursor')
 })
 
 chat_request = api.model('ChatRequest', {
@@ -39,6 +69,23 @@ chat_request = api.model('ChatRequest', {
     'context': fields.String(description='Optional context for the conversation')
 })
 
+day_regeneration_request = api.model('DayRegenerationRequest', {
+    'slot': fields.Integer(description='Index of the single activity to replace; omit to replan the whole day'),
+    'instructions': fields.String(description='Optional wishes for the new activities')
+})
+
+weather_batch_item = api.model('WeatherBatchItem', {
+    'location': fields.String(required=True, description='City name'),
+    'num_days': fields.Integer(description='Number of days (1-14)'),
+    'start_date': fields.String(description='Start date (YYYY-MM-DD)'),
+    'end_date': fields.String(description='End date (YYYY-MM-DD)')
+})
+
+weather_batch_request = api.model('WeatherBatchRequest', {
+    'requests': fields.List(fields.Nested(weather_batch_item), required=True,
+                            description='Locations and date ranges to forecast')
+})
+
 weather_params = api.model('WeatherParams', {
     'location': fields.String(required=True, description='City name'),
     'num_days': fields.Integer(description='Number of days (1-14)'),
@@ -46,15 +93,30 @@ weather_params = api.model('WeatherParams', {
     'end_date': fields.Date(description='End date (YYYY-MM-DD)')
 })
 
+def conditional(etag, last_modified, build):
+    """Answer 304 when the client's copy is current, otherwise build the body with validators attached."""
+    headers = {'ETag': quote_etag(etag, weak=True), 'Cache-Control': 'private, no-cache'}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+    return build(), 200, headers
+
 # Trip endpoints
 @trips_ns.route('/')
 class TripList(Resource):
     @trips_ns.doc('list_trips')
-    @trips_ns.marshal_list_with(trip_model)
+    @trips_ns.response(200, 'Success', [trip_model])
+    @trips_ns.response(304, 'Not modified')
     @login_required
+    @replica_reads
     def get(self):
-        """List all trips for the current user"""
-        return Trip.query.filter_by(user_id=current_user.id).all()
+        """List all trips for the current user, archived ones included"""
+        # The validators come from an aggregate, so an unchanged list is never loaded
+        etag, last_modified = trip_list_version(current_user.id)
+        return conditional(etag, last_modified, lambda: [
+            trip.to_dict() for trip in Trip.query.filter_by(user_id=current_user.id).all()
+        ] + archived_trip_dicts(current_user.id))
 
     @trips_ns.doc('create_trip')
     @trips_ns.expect(trip_model)
@@ -73,53 +135,178 @@ class TripList(Resource):
         )
         db.session.add(trip)
         db.session.commit()
+        if trip.itinerary:
+            schedule_route_optimization(trip.id)
         return trip
 
+def writable_trip(id):
+    """The trip, if the current user owns it and the request's If-Match (if any) is its current version."""
+    trip = trip_or_404(id, current_user.id, owner_only=True)
+    if trip.user_id != current_user.id:
+        api.abort(403, "Not authorized to modify this trip")
+    if request.if_match and not request.if_match.contains_weak(trip_version(trip)):
+        api.abort(412, "Trip has changed since it was fetched")
+    return trip
+
+
+def save_trip(trip, changed):
+    # Only the changed columns are written, guarded by the version the request started from
+    if changed:
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            api.abort(409, "Trip was modified concurrently, fetch it again")
+        if 'itinerary' in changed and trip.itinerary:
+            schedule_route_optimization(trip.id)
+    return trip, 200, {'ETag': quote_etag(trip_version(trip), weak=True)}
+
+
 @trips_ns.route('/<int:id>')
 @trips_ns.param('id', 'Trip identifier')
 class TripResource(Resource):
     @trips_ns.doc('get_trip')
-    @trips_ns.marshal_with(trip_model)
+    @trips_ns.response(200, 'Success', trip_model)
+    @trips_ns.response(304, 'Not modified')
     @login_required
+    @replica_reads
     def get(self, id):
         """Get a specific trip"""
-        trip = Trip.query.get_or_404(id)
+        trip = trip_or_404(id, current_user.id)
         if trip.user_id != current_user.id and str(current_user.id) not in (trip.shared_with or []):
             api.abort(403, "Not authorized to view this trip")
-        return trip
+        return conditional(trip_version(trip), trip.updated_at, lambda: marshal(trip, trip_model))
 
     @trips_ns.doc('update_trip')
     @trips_ns.expect(trip_model)
+    @trips_ns.response(400, 'Invalid field value')
+    @trips_ns.response(409, 'Trip was modified concurrently')
+    @trips_ns.response(412, 'If-Match does not match the current version')
     @trips_ns.marshal_with(trip_model)
     @login_required
     def put(self, id):
-        """Update a trip"""
-        trip = Trip.query.get_or_404(id)
-        if trip.user_id != current_user.id:
-            api.abort(403, "Not authorized to modify this trip")
-        data = request.json
-        for key, value in data.items():
-            setattr(trip, key, value)
-        db.session.commit()
-        return trip
+        """Update a trip; read-only fields in the body are ignored"""
+        trip = writable_trip(id)
+        try:
+            changed = update_trip(trip, request.get_json())
+        except ValueError as e:
+            api.abort(400, str(e))
+        return save_trip(trip, changed)
+
+    @trips_ns.doc('patch_trip', consumes=[MERGE_PATCH, JSON_PATCH])
+    @trips_ns.response(400, 'Invalid patch or field value')
+    @trips_ns.response(409, 'Test operation failed or trip was modified concurrently')
+    @trips_ns.response(412, 'If-Match does not match the current version')
+    @trips_ns.marshal_with(trip_model)
+    @login_required
+    def patch(self, id):
+        """Partially update a trip with a JSON Merge Patch or a JSON Patch; send If-Match with the trip's ETag"""
+        trip = writable_trip(id)
+        try:
+            changed = patch_trip(trip, request.get_json(), request.mimetype)
+        except JsonPatchConflict as e:
+            api.abort(409, str(e))
+        except ValueError as e:
+            api.abort(400, str(e))
+        return save_trip(trip, changed)
 
     @trips_ns.doc('delete_trip')
     @login_required
     def delete(self, id):
         """Delete a trip"""
-        trip = Trip.query.get_or_404(id)
+        trip = trip_or_404(id, current_user.id, owner_only=True)
         if trip.user_id != current_user.id:
             api.abort(403, "Not authorized to delete this trip")
         db.session.delete(trip)
         db.session.commit()
         return '', 204
 
+@trips_ns.route('/<int:id>/days/<string:day>/regenerate')
+class TripDayRegeneration(Resource):
+    @trips_ns.doc('regenerate_trip_day')
+    @trips_ns.expect(day_regeneration_request)
+    @trips_ns.response(400, 'Invalid slot')
+    @trips_ns.response(404, 'No such trip or day')
+    @trips_ns.response(409, 'Trip was modified concurrently')
+    @trips_ns.response(412, 'If-Match does not match the current version')
+    @trips_ns.response(429, 'AI request limit reached')
+    @trips_ns.response(502, 'The AI returned no usable activities')
+    @trips_ns.response(503, 'AI service unavailable')
+    @trips_ns.marshal_with(trip_model)
+    @login_required
+    @ai_rate_limited
+    def post(self, id, day):
+        """Replan one day of a trip, or one activity of it, around the other days"""
+        trip = writable_trip(id)
+        activities = (trip.itinerary or {}).get(day)
+        if activities is None:
+            api.abort(404, f"Trip has no day {day}")
+        data = request.get_json(silent=True) or {}
+        slot = data.get('slot')
+        if slot is not None and (isinstance(slot, bool) or not isinstance(slot, int)
+                                 or not 0 <= slot < len(activities)):
+            api.abort(400, f"slot must be an activity index below {len(activities)}")
+        try:
+            itinerary = regenerate_trip_day(trip, day, slot, str(data.get('instructions') or ''))
+        except UpstreamError:
+            api.abort(503, "AI service is busy, please try again shortly")
+        except ValueError as e:
+            api.abort(502, str(e))
+        return save_trip(trip, update_trip(trip, {'itinerary': itinerary}))
+
+trip_import_result_model = api.model('TripImportResult', {
+    'imported': fields.Integer(description='Trips created'),
+    'failed': fields.Integer(description='Lines that could not be imported'),
+    'errors': fields.List(fields.Raw, description='First failures as {line, error}')
+})
+
+@trips_ns.route('/export')
+class TripExport(Resource):
+    @trips_ns.doc('export_trips')
+    @trips_ns.produces(['application/x-ndjson'])
+    @login_required
+    @replica_reads
+    def get(self):
+        """Stream all trips of the current user, archived ones included, as NDJSON"""
+        return Response(stream_with_context(export_trips(current_user.id)), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': 'attachment; filename=trips.ndjson'})
+
+@trips_ns.route('/import')
+class TripImport(Resource):
+    @trips_ns.doc('import_trips', consumes=['application/x-ndjson'])
+    @trips_ns.response(200, 'Success', trip_import_result_model)
+    @login_required
+    def post(self):
+        """Create trips from an NDJSON body, one trip object per line; bad lines are reported, not fatal"""
+        # The body is read line by line, so the usual upload limit does not apply
+        request.max_content_length = IMPORT_MAX_BYTES
+        return import_trips(current_user.id, request.stream)
+
+@trips_ns.route('/sync')
+class TripSync(Resource):
+    @trips_ns.doc('sync_trips', params={'cursor': 'Cursor from the previous sync; omit for a full sync'})
+    @trips_ns.response(400, 'Invalid cursor')
+    @trips_ns.response(410, 'Cursor expired, sync again without a cursor')
+    @trips_ns.response(200, 'Success', trip_sync_model)
+    @login_required
+    @replica_reads
+    def get(self):
+        """Trips created, updated and deleted since the cursor"""
+        try:
+            return changes_since(current_user.id, request.args.get('cursor'))
+        except CursorExpiredError as e:
+            api.abort(410, str(e))
+        except ValueError as e:
+            api.abort(400, str(e))
+
 # Chat endpoints
 @chat_ns.route('/')
 class ChatResource(Resource):
     @chat_ns.doc('chat_with_ai')
     @chat_ns.expect(chat_request)
+    @chat_ns.response(429, 'AI request limit reached')
     @login_required
+    @ai_rate_limited
     def post(self):
         """Get AI chat response"""
         data = request.json
@@ -147,11 +334,37 @@ class WeatherResource(Resource):
         if not location:
             api.abort(400, "Location parameter is required")
             
-        try:
-            if start_date and end_date:
-                forecast = weather_api.get_forecast_by_dates(location, start_date, end_date)
-            else:
-                forecast = weather_api.get_forecast(location, num_days or 7)
-            return forecast
-        except Exception as e:
-            api.abort(500, str(e))
+        result = weather_api.get_weather_batch([{
+            'location': location,
+            'num_days': num_days,
+            'start_date': start_date,
+            'end_date': end_date
+        }])[0]
+        if 'error' in result:
+            # 400 for invalid parameters, 404 for unknown places, 502/503 when OpenWeatherMap fails
+            api.abort(result['status'], result['error'])
+        return result['forecast']
+
+@weather_ns.route('/batch')
+class WeatherBatchResource(Resource):
+    MAX_ITEMS = 50
+    # Each distinct location costs up to three upstream calls (geocode, forecast, alerts)
+    MAX_LOCATIONS = 10
+
+    @weather_ns.doc('get_weather_batch')
+    @weather_ns.expect(weather_batch_request)
+    @login_required
+    def post(self):
+        """Get weather forecasts for many locations and date ranges in one call"""
+        data = request.get_json(silent=True) or {}
+        items = data.get('requests')
+        if not isinstance(items, list) or not items:
+            api.abort(400, "A non-empty 'requests' list is required")
+        if len(items) > self.MAX_ITEMS:
+            api.abort(400, f"At most {self.MAX_ITEMS} requests per batch")
+        if not all(isinstance(item, dict) for item in items):
+            api.abort(400, "Each request must be an object")
+        locations = {' '.join(str(item.get('location') or '').lower().split()) for item in items}
+        if len(locations) > self.MAX_LOCATIONS:
+            api.abort(400, f"At most {self.MAX_LOCATIONS} distinct locations per batch")
+        return {'results': weather_api.get_weather_batch(items)}
@@ -4,6 +4,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from flask_migrate import Migrate
+from utils import fast_json
+from utils.fast_json import FastJSONProvider
+from utils.compression import Compressor
+from utils.static_assets import StaticAssets
+from utils.db_routing import RoutingSession, engine_options, replica_binds
 import logging
 
 # Configure logging
@@ -13,9 +18,11 @@ logger = logging.getLogger(__name__)
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
+static_assets = StaticAssets()
+compressor = Compressor(min_size=int(os.environ.get('COMPRESS_MIN_SIZE', 500)))
 
 def create_app():
     app = Flask(__name__)
@@ -27,15 +34,23 @@ def create_app():
     else:
         app.config['SECRET_KEY'] = os.environ.get("FLASK_SECRET_KEY") or "a secret key"
         app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-            "pool_recycle": 300,
-            "pool_pre_ping": True,
-        }
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(os.environ.get("DATABASE_URL"))
+        app.config["SQLALCHEMY_BINDS"] = replica_binds(os.environ.get("DATABASE_REPLICA_URLS"))
+
+    app.json = FastJSONProvider(app)
+    # JSON columns (itinerary, weather_data, ...) use the same fast encoder, on replicas too
+    all_engine_options = [app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})]
+    all_engine_options += [bind for bind in app.config.get("SQLALCHEMY_BINDS", {}).values() if isinstance(bind, dict)]
+    for options in all_engine_options:
+        options.setdefault("json_serializer", fast_json.dumps)
+        options.setdefault("json_deserializer", fast_json.loads)
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
+    static_assets.init_app(app)
+    compressor.init_app(app)
     login_manager.login_view = 'auth.login'
 
     return app
@@ -45,15 +60,18 @@ app = create_app()
 from models import User
 from populate_templates import populate_templates
 
+from user_cache import load_cached_user
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(user_id)
 
 # Initialize database and populate templates within app context
 with app.app_context():
     try:
         import models
-        db.create_all()
+        # Replicas get their schema from the primary
+        db.create_all(bind_key=None)
         populate_templates()
         logger.info("Database initialized successfully")
     except Exception as e:
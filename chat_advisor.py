@@ -3,8 +3,17 @@ import json
 from openai import OpenAI
 from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
 from typing import Dict, List, Union, Optional
-from functools import lru_cache
+import hashlib
 from app import app, logger
+from utils.upstream_governor import (UpstreamError, estimate_tokens,
+                                     get_openai_governor)
+from utils.semantic_cache import HashingEmbedder, OpenAIEmbedder, SemanticCache
+from utils.cache import ByteSizedCache, ResponseCache, canonical_hash
+from utils.shared_store import get_shared_store
+from utils.structured_output import (SUGGESTIONS_INSTRUCTION, TRIP_SUGGESTIONS_SCHEMA, StructuredOutput,
+                                     format_kwargs, unwrap_suggestions)
+from utils import fast_json
+from trip_prompts import TRIP_FORMAT, TRIP_RULES
 
 
 def initialize_openai_client():
@@ -15,7 +24,8 @@ def initialize_openai_client():
         return None
 
     try:
-        return OpenAI(api_key=api_key)
+        # Retries are owned by the upstream governor, not the SDK
+        return OpenAI(api_key=api_key, max_retries=0)
     except Exception as e:
         logger.error(f"Failed to initialize OpenAI client: {str(e)}")
         return None
@@ -24,30 +34,9 @@ def initialize_openai_client():
 # Initialize OpenAI client
 client = initialize_openai_client()
 
-TRIP_SYSTEM_PROMPT = '''You are an AI travel advisor helping users plan their trips. Always respond with valid JSON following this format:
-{
-    "destination": "City Name, Country",
-    "suggested_duration": 3,
-    "travel_type": "cultural",
-    "recommended_group_size": "2-4",
-    "itinerary": {
-        "1": [
-            "Morning: Visit specific attraction name",
-            "Afternoon: Visit specific location name",
-            "Evening: Dinner at specific restaurant or area name"
-        ]
-    }
-}
-
-For alternative suggestions, return an array of exactly 3 suggestions.
-
-Rules:
-1. Always use valid JSON with proper quotes
-2. Each suggestion must include at least 3 activities per day
-3. Use real, mappable location names
-4. Travel type must be one of: cultural, adventure, relaxation, family, business
-5. Format group size as "X-Y" where X and Y are numbers
-6. Include specific venue/location names for all activities'''
+TRIP_SYSTEM_PROMPT = (f"You are an AI travel advisor helping users plan trips. Reply with JSON only, "
+                      f"one suggestion as {TRIP_FORMAT} or, for alternatives, an array of exactly 3. "
+                      f"{TRIP_RULES} recommended_group_size is \"X-Y\" with numbers.")
 
 CHAT_SYSTEM_PROMPT = '''You are a helpful AI travel advisor. Provide concise but informative responses about:
 - Destination recommendations
@@ -60,6 +49,38 @@ CHAT_SYSTEM_PROMPT = '''You are a helpful AI travel advisor. Provide concise but
 Keep responses friendly and practical. If unsure, acknowledge limitations and suggest alternatives.'''
 
 
+def _create_semantic_cache() -> Optional[SemanticCache]:
+    """Build the chat answer cache; SEMANTIC_CACHE_EMBEDDER selects 'openai' or the local 'hashing' embedder."""
+    if os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    embedder_name = os.environ.get("SEMANTIC_CACHE_EMBEDDER",
+                                   "openai" if client else "hashing")
+    if embedder_name == "openai":
+        embedder = OpenAIEmbedder(
+            get_client=lambda: client,
+            call_upstream=lambda fn: get_openai_governor().call(fn, 100))
+    else:
+        embedder = HashingEmbedder()
+    threshold = os.environ.get("SEMANTIC_CACHE_THRESHOLD")
+    return SemanticCache(
+        embedder,
+        threshold=float(threshold) if threshold else None,
+        ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", 86400)))
+
+
+semantic_cache = _create_semantic_cache()
+
+# Exact-match cache of completions keyed on the full request (retries, double submits)
+response_cache = ResponseCache(
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 600)),
+    shared_store=get_shared_store(),
+    prefix="chat_response")
+
+# OPENAI_STRUCTURED_OUTPUT=json_object|json_schema asks for JSON the parsers accept in one pass
+structured_output = StructuredOutput(os.environ.get("OPENAI_STRUCTURED_OUTPUT", "off"))
+
+
 def check_api_key() -> bool:
     """Check if OpenAI API key is properly configured."""
     return bool(client)
@@ -117,23 +138,49 @@ def extract_json_from_text(content: str) -> str:
         raise ValueError(f"Failed to extract JSON: {str(e)}")
 
 
-@lru_cache(maxsize=100)
+# Parsed suggestions keyed by a hash of the completion, stored serialized
+parsed_suggestion_cache = ByteSizedCache(
+    max_bytes=int(os.environ.get("PARSE_CACHE_MAX_BYTES", 4 * 1024 * 1024)))
+
+
 def parse_trip_suggestion(content: str) -> Optional[List[Dict]]:
-    """Parse and validate trip suggestions from API response."""
+    """
+    Parse and validate trip suggestions from API response.
+    Results are cached; every call returns a fresh copy that callers may mutate.
+    """
+    if not content or not isinstance(content, str):
+        return _parse_trip_suggestion(content)
+
+    key = hashlib.sha256(content.strip().encode('utf-8')).hexdigest()
+    cached = parsed_suggestion_cache.get(key)
+    if cached is not None:
+        return fast_json.loads(cached)
+
+    suggestions = _parse_trip_suggestion(content)
+    parsed_suggestion_cache.set(key, fast_json.dumps_bytes(suggestions))
+    return suggestions
+
+
+def _parse_trip_suggestion(content: str) -> Optional[List[Dict]]:
+    """Parse and validate trip suggestions from API response (uncached)."""
     try:
         if not content or not isinstance(content, str):
             raise ValueError("Invalid content type or empty content")
 
-        # Extract JSON content from the response
         try:
-            json_content = extract_json_from_text(content.strip())
-            data = json.loads(json_content)
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(
-                f"JSON parsing error: {str(e)}\nContent: {content[:200]}...")
-            raise ValueError(f"Invalid JSON format: {str(e)}")
+            # Structured output is bare JSON; free text may wrap it in markdown
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            try:
+                json_content = extract_json_from_text(content.strip())
+                data = json.loads(json_content)
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.error(
+                    f"JSON parsing error: {str(e)}\nContent: {content[:200]}...")
+                raise ValueError(f"Invalid JSON format: {str(e)}")
 
         # Convert single suggestion to list format
+        data = unwrap_suggestions(data)
         suggestions = [data] if isinstance(data, dict) else data
         if not isinstance(suggestions, list):
             raise ValueError(
@@ -262,47 +309,84 @@ def get_chat_response(
             except json.JSONDecodeError:
                 logger.warning("Failed to parse context data")
 
+        completion_params = {
+            "model": "gpt-4o",  # Fixed model name to match trip_generator.py
+            "temperature": 0.7,
+            "max_tokens": 2000,
+            "presence_penalty": 0.6,
+            "frequency_penalty": 0.3
+        }
+        if is_trip_suggestion and structured_output.response_format(
+                completion_params["model"], "trip_suggestions", TRIP_SUGGESTIONS_SCHEMA):
+            messages.append({"role": "system", "content": SUGGESTIONS_INSTRUCTION})
         messages.append({"role": "user", "content": message})
 
-        # Make API call with retries
-        max_retries = 3
-        response = None
-        last_error = None
-
-        for attempt in range(max_retries):
+        cache_key = canonical_hash({
+            "messages": messages,
+            "params": completion_params,
+            "structured": is_trip_suggestion and structured_output.mode
+        })
+        # Whether a fresh completion was structured; None when it came from a cache
+        structured = None
+
+        def complete() -> str:
+            nonlocal structured
+            if not client:
+                raise ValueError("OpenAI client is not initialized")
+
+            def call(response_format: Optional[Dict]):
+                return client.chat.completions.create(
+                    messages=messages, **completion_params, **format_kwargs(response_format))
+
+            # Make API call through the shared governor (rate limits, backoff, circuit breaker)
+            estimated = estimate_tokens(''.join(m["content"] for m in messages), completion_params["max_tokens"])
             try:
-                if not client:
-                    raise ValueError("OpenAI client is not initialized")
-
-                response = client.chat.completions.create(
-                    model=
-                    "gpt-4o",  # Fixed model name to match trip_generator.py
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=2000,
-                    presence_penalty=0.6,
-                    frequency_penalty=0.3)
-                break
-            except Exception as e:
-                last_error = str(e)
-                logger.warning(
-                    f"Retry {attempt + 1} after error: {last_error}")
-                if attempt == max_retries - 1:
-                    raise ValueError(
-                        f"Failed to get response after {max_retries} attempts: {last_error}"
-                    )
-
-        if not response or not response.choices:
-            raise ValueError("No response generated")
-
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("Empty response from API")
+                if is_trip_suggestion:
+                    response, structured = structured_output.create(
+                        lambda response_format: get_openai_governor().call(
+                            lambda: call(response_format), estimated_tokens=estimated),
+                        completion_params["model"], "trip_suggestions", TRIP_SUGGESTIONS_SCHEMA)
+                else:
+                    response = get_openai_governor().call(lambda: call(None), estimated_tokens=estimated)
+            except UpstreamError as e:
+                logger.warning(f"Skipping OpenAI call: {str(e)}")
+                raise ValueError(
+                    "The AI advisor is busy right now. Please try again in a minute")
+
+            if not response or not response.choices:
+                raise ValueError("No response generated")
+
+            content = response.choices[0].message.content
+            if not content:
+                raise ValueError("Empty response from API")
+            return content
+
+        content = response_cache.get(cache_key)
+        if content is None:
+            # Free-text answers are served from the semantic cache when a close
+            # enough question was already answered in the same context
+            cache_partition = cache_vector = None
+            if semantic_cache and not is_trip_suggestion:
+                cache_partition = SemanticCache.partition_key(
+                    *(m["content"] for m in messages[:-1]))
+                cached_answer, cache_vector = semantic_cache.lookup(
+                    message, cache_partition)
+                if cached_answer is not None:
+                    return cached_answer
+
+            # Identical concurrent requests share a single completion
+            content = response_cache.get_or_compute(cache_key, complete)
+            if cache_partition:
+                semantic_cache.put(cache_partition, cache_vector, content)
 
         # Handle trip suggestions
         if is_trip_suggestion:
             suggestions = parse_trip_suggestion(content)
+            if structured is not None:
+                structured_output.record(structured, bool(suggestions))
             if not suggestions:
+                # Do not keep serving a completion that cannot be parsed
+                response_cache.delete(cache_key)
                 raise ValueError("Failed to parse trip suggestions")
             return suggestions
 
@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from utils.db_routing import engine_options, replica_binds
 
 # Load environment variables
 load_dotenv()
@@ -11,6 +12,12 @@ CONFIG = {
     'DATABASE_URL': os.environ.get('DATABASE_URL'),
     'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL'),
     'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    # Sized per worker process; DB_POOL_* environment variables override these
+    'SQLALCHEMY_ENGINE_OPTIONS': engine_options(os.environ.get('DATABASE_URL'), pool_size=10, max_overflow=20,
+                                                pool_timeout=10),
+    # Comma-separated read replica URLs for the GET views marked with @replica_reads
+    'SQLALCHEMY_BINDS': replica_binds(os.environ.get('DATABASE_REPLICA_URLS'), pool_size=10, max_overflow=20,
+                                      pool_timeout=10),
     'SECRET_KEY': os.environ.get('FLASK_SECRET_KEY'),
     'SESSION_COOKIE_SECURE': True,
     'SESSION_COOKIE_HTTPONLY': True,
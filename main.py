@@ -2,6 +2,10 @@ from app import app
 from auth import auth_bp
 import routes
 import api
+import weather_refresher
+import route_optimizer
+import trip_sync
+import trip_archive
 import logging
 import os
 from dotenv import load_dotenv
@@ -44,6 +48,11 @@ if __name__ == "__main__":
         # Set debug mode based on environment
         debug_mode = os.environ.get('FLASK_ENV') != 'production'
         
+        # Optional in-process forecast refresher; otherwise run `flask refresh-weather` from cron
+        if os.environ.get('WEATHER_REFRESH_IN_PROCESS', 'false').lower() == 'true' and \
+                (not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+            weather_refresher.start_weather_refresher()
+
         logger.info(f"Starting Flask server in {'production' if not debug_mode else 'development'} mode...")
         app.run(host="0.0.0.0", port=port, debug=debug_mode)
     except Exception as e:
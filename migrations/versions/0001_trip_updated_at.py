@@ -0,0 +1,50 @@
+"""Trip.updated_at and trip tombstones for delta sync
+
+Revision ID: 0001_trip_updated_at
+Revises:
+Create Date: 2026-10-19 19:10:00.000000
+
+Baseline for databases created with db.create_all(): every step checks
+the live schema first, so it applies cleanly to old and fresh databases.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_trip_updated_at'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'updated_at' not in {c['name'] for c in inspector.get_columns('trip')}:
+        with op.batch_alter_table('trip') as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute("UPDATE trip SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+        with op.batch_alter_table('trip') as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+    if 'ix_trip_user_updated' not in {i['name'] for i in inspector.get_indexes('trip')}:
+        op.create_index('ix_trip_user_updated', 'trip', ['user_id', 'updated_at'])
+
+    if not inspector.has_table('trip_tombstone'):
+        op.create_table(
+            'trip_tombstone',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('trip_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        )
+        op.create_index('ix_trip_tombstone_user_deleted', 'trip_tombstone', ['user_id', 'deleted_at'])
+
+
+def downgrade():
+    op.drop_index('ix_trip_tombstone_user_deleted', table_name='trip_tombstone')
+    op.drop_table('trip_tombstone')
+    op.drop_index('ix_trip_user_updated', table_name='trip')
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,58 @@
+"""Store UserPreference lists as native JSON arrays
+
+Revision ID: 0002_native_preference_arrays
+Revises: 0001_trip_updated_at
+Create Date: 2026-10-19 19:40:00.000000
+
+The list columns used to hold JSON-encoded strings ('["a", "b"]') inside
+JSON columns. Rows are decoded once here; unparseable values become [].
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_native_preference_arrays'
+down_revision = '0001_trip_updated_at'
+branch_labels = None
+depends_on = None
+
+LIST_COLUMNS = ('preferred_travel_types', 'preferred_destinations', 'interests')
+
+user_preference = sa.table(
+    'user_preference',
+    sa.column('id', sa.Integer),
+    *(sa.column(name, sa.JSON) for name in LIST_COLUMNS)
+)
+
+
+def _to_list(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return [item for item in value if isinstance(item, str)] if isinstance(value, list) else []
+
+
+def _to_string(value):
+    return json.dumps(value if isinstance(value, list) else [])
+
+
+def _convert(convert):
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(user_preference)).mappings().all()
+    for row in rows:
+        bind.execute(user_preference.update()
+                     .where(user_preference.c.id == row['id'])
+                     .values({name: convert(row[name]) for name in LIST_COLUMNS}))
+
+
+def upgrade():
+    _convert(_to_list)
+
+
+def downgrade():
+    _convert(_to_string)
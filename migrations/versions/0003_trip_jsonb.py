@@ -0,0 +1,88 @@
+"""JSONB trip documents with GIN indexes on Postgres
+
+Revision ID: 0003_trip_jsonb
+Revises: 0002_native_preference_arrays
+Create Date: 2026-10-19 20:40:00.000000
+
+Trip.shared_with used to hold a JSON-encoded string ('["3", "7"]'); it is
+decoded to a native array on every database. On Postgres the trip JSON
+columns become jsonb and get the GIN indexes used by trip_queries.py.
+Indexes are built CONCURRENTLY so trip writes are not blocked meanwhile.
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_trip_jsonb'
+down_revision = '0002_native_preference_arrays'
+branch_labels = None
+depends_on = None
+
+JSONB_COLUMNS = ('itinerary', 'shared_with', 'weather_data', 'route_data')
+ITINERARY_SEARCH_VECTOR = "jsonb_to_tsvector('simple'::regconfig, itinerary, '[\"string\"]'::jsonb)"
+
+trip = sa.table(
+    'trip',
+    sa.column('id', sa.Integer),
+    sa.column('shared_with', sa.JSON)
+)
+
+
+def _to_list(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return [str(item) for item in value if isinstance(item, (str, int))] if isinstance(value, list) else []
+
+
+def _to_string(value):
+    return json.dumps(value if isinstance(value, list) else [])
+
+
+def _convert_shared_with(convert):
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(trip.c.id, trip.c.shared_with)).all()
+    for trip_id, shared_with in rows:
+        bind.execute(trip.update().where(trip.c.id == trip_id).values(shared_with=convert(shared_with)))
+
+
+def upgrade():
+    _convert_shared_with(_to_list)
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    inspector = sa.inspect(bind)
+    column_types = {c['name']: c['type'] for c in inspector.get_columns('trip')}
+    for name in JSONB_COLUMNS:
+        if not isinstance(column_types[name], postgresql.JSONB):
+            op.alter_column('trip', name, type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                            postgresql_using=f'{name}::jsonb')
+
+    indexes = {i['name'] for i in inspector.get_indexes('trip')}
+    with op.get_context().autocommit_block():
+        if 'ix_trip_shared_with' not in indexes:
+            op.create_index('ix_trip_shared_with', 'trip', ['shared_with'], postgresql_using='gin',
+                            postgresql_ops={'shared_with': 'jsonb_path_ops'}, postgresql_concurrently=True)
+        if 'ix_trip_itinerary_search' not in indexes:
+            op.create_index('ix_trip_itinerary_search', 'trip', [sa.text(ITINERARY_SEARCH_VECTOR)],
+                            postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_trip_itinerary_search', table_name='trip')
+        op.drop_index('ix_trip_shared_with', table_name='trip')
+        for name in JSONB_COLUMNS:
+            op.alter_column('trip', name, type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                            postgresql_using=f'{name}::json')
+
+    _convert_shared_with(_to_string)
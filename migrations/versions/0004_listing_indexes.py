@@ -0,0 +1,39 @@
+"""Composite indexes for trip listings, recommendations and reviews
+
+Revision ID: 0004_listing_indexes
+Revises: 0003_trip_jsonb
+Create Date: 2026-10-19 21:10:00.000000
+
+Each index matches a query in trip_queries.py; tests/test_query_plans.py
+verifies the planner uses them. Built CONCURRENTLY on Postgres.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_listing_indexes'
+down_revision = '0003_trip_jsonb'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_trip_user_created', 'trip', ['user_id', 'created_at']),
+    ('ix_trip_user_type_days', 'trip', ['user_id', 'travel_type', 'num_days']),
+    ('ix_trip_type_days', 'trip', ['travel_type', 'num_days']),
+    ('ix_review_trip_created', 'review', ['trip_id', 'created_at']),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {(table, i['name']) for table in ('trip', 'review') for i in inspector.get_indexes(table)}
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if (table, name) not in existing:
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,42 @@
+"""Compressed archive table for old, untouched trips
+
+Revision ID: 0005_archived_trips
+Revises: 0004_listing_indexes
+Create Date: 2026-10-19 21:40:00.000000
+
+Rows are moved in by `flask archive-trips` and back out when an archived
+trip is opened (see trip_archive.py).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_archived_trips'
+down_revision = '0004_listing_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('archived_trip'):
+        return
+    op.create_table(
+        'archived_trip',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('destination', sa.String(length=200), nullable=False),
+        sa.Column('num_days', sa.Integer(), nullable=False),
+        sa.Column('travel_type', sa.String(length=50), nullable=False),
+        sa.Column('num_people', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+    )
+    op.create_index('ix_archived_trip_user_created', 'archived_trip', ['user_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_archived_trip_user_created', table_name='archived_trip')
+    op.drop_table('archived_trip')
@@ -0,0 +1,27 @@
+"""Trip.version for optimistic concurrency
+
+Revision ID: 0006_trip_version
+Revises: 0005_archived_trips
+Create Date: 2026-10-19 22:10:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_trip_version'
+down_revision = '0005_archived_trips'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'version' in {c['name'] for c in sa.inspect(op.get_bind()).get_columns('trip')}:
+        return
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_column('version')
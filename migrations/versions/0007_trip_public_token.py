@@ -0,0 +1,33 @@
+"""Opt-in public trip links with a random, rotatable token
+
+Revision ID: 0007_trip_public_token
+Revises: 0006_trip_version
+Create Date: 2026-10-20 09:00:00.000000
+
+Public links used to be the trip id signed with SECRET_KEY, shown for every
+trip and impossible to revoke. Existing links stop working; owners enable a
+new one per trip.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_trip_public_token'
+down_revision = '0006_trip_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'public_token' in {c['name'] for c in sa.inspect(op.get_bind()).get_columns('trip')}:
+        return
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.add_column(sa.Column('public_token', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_trip_public_token', ['public_token'])
+
+
+def downgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_constraint('uq_trip_public_token', type_='unique')
+        batch_op.drop_column('public_token')
@@ -1,8 +1,16 @@
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from sqlalchemy import Index, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Index, UniqueConstraint, event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship
+
+# JSONB on Postgres (binary, indexable), plain JSON elsewhere
+JSONDocument = db.JSON().with_variant(JSONB(), 'postgresql')
+
+# Full-text vector over the string values of an itinerary; trip_queries.itinerary_mentions
+# repeats this expression so the planner can use the GIN index
+ITINERARY_SEARCH_VECTOR = "jsonb_to_tsvector('simple'::regconfig, itinerary, '[\"string\"]'::jsonb)"
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,14 +38,52 @@ class Trip(db.Model):
     num_days = db.Column(db.Integer, nullable=False)
     travel_type = db.Column(db.String(50), nullable=False)
     num_people = db.Column(db.Integer, nullable=False)
-    itinerary = db.Column(db.JSON, nullable=False)
+    itinerary = db.Column(JSONDocument, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    shared_with = db.Column(db.JSON, default=lambda: '[]')
-    weather_data = db.Column(db.JSON)
-    route_data = db.Column(db.JSON)
+    # Last client-visible change (set by bump_trip_version), so background weather and route
+    # updates neither show up in delta syncs nor keep the trip out of the archive
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    shared_with = db.Column(JSONDocument, default=list)  # user ids as strings, e.g. ["3", "7"]
+    weather_data = db.Column(JSONDocument)
+    route_data = db.Column(JSONDocument)
     template_id = db.Column(db.Integer, db.ForeignKey('trip_template.id', ondelete='SET NULL'), nullable=True)
+    # Random token of the public /p/<token> link; None while the owner has not made the trip public
+    public_token = db.Column(db.String(64), unique=True, nullable=True)
+    # Bumped when a client-visible field changes (see bump_trip_version); every
+    # UPDATE checks it, so a write based on a stale read fails with StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     reviews = relationship('Review', backref='trip', lazy=True, cascade='all, delete-orphan')
 
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
+    # One index per query shape in trip_queries.py: dashboard listing and its
+    # type/duration filter, recommendations, and delta sync by modification time.
+    # The GIN indexes back the shared-with and itinerary search filters (Postgres only)
+    __table_args__ = (
+        Index('ix_trip_user_created', 'user_id', 'created_at'),
+        Index('ix_trip_user_type_days', 'user_id', 'travel_type', 'num_days'),
+        Index('ix_trip_type_days', 'travel_type', 'num_days'),
+        Index('ix_trip_user_updated', 'user_id', 'updated_at'),
+        Index('ix_trip_shared_with', 'shared_with', postgresql_using='gin',
+              postgresql_ops={'shared_with': 'jsonb_path_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_trip_itinerary_search', db.text(ITINERARY_SEARCH_VECTOR),
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+    def to_dict(self):
+        # Same output as marshalling with the API's trip model, minus the per-field dispatch
+        return {
+            'id': self.id,
+            'destination': self.destination,
+            'num_days': self.num_days,
+            'travel_type': self.travel_type,
+            'num_people': self.num_people,
+            'itinerary': self.itinerary,
+            'shared_with': self.shared_with,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     trip_id = db.Column(db.Integer, db.ForeignKey('trip.id', ondelete='CASCADE'), nullable=False)
@@ -47,6 +93,11 @@ class Review(db.Model):
     photo_path = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Reviews are listed per trip, newest first
+    __table_args__ = (
+        Index('ix_review_trip_created', 'trip_id', 'created_at'),
+    )
+
 class TripTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -62,12 +113,13 @@ class TripTemplate(db.Model):
 class UserPreference(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, unique=True)
-    preferred_travel_types = db.Column(db.JSON, default=lambda: '[]')
-    preferred_destinations = db.Column(db.JSON, default=lambda: '[]')
+    # Lists are stored as native JSON arrays (see user_preferences.py for validation)
+    preferred_travel_types = db.Column(db.JSON, default=list)
+    preferred_destinations = db.Column(db.JSON, default=list)
     preferred_trip_length = db.Column(db.Integer, default=3)  # Set default to 3 days
     preferred_group_size = db.Column(db.Integer, default=2)   # Set default to 2 people
     budget_range = db.Column(db.String(50))
-    interests = db.Column(db.JSON, default=lambda: '[]')
+    interests = db.Column(db.JSON, default=list)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -85,3 +137,57 @@ class ItineraryCache(db.Model):
     __table_args__ = (
         Index('ix_itinerary_cache_query', 'destination', 'num_days', 'travel_type', 'num_people'),
     )
+
+class GeocodeCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    place = db.Column(db.String(400), unique=True, nullable=False)
+    lat = db.Column(db.Float)  # NULL when the place could not be found
+    lon = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Deleted trips, kept so delta-sync clients learn about the deletion
+class TripTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    trip_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index('ix_trip_tombstone_user_deleted', 'user_id', 'deleted_at'),
+    )
+
+# Trips untouched for a long time, moved out of the live table by trip_archive.py.
+# The listing columns stay queryable; itinerary, weather, route and reviews are
+# kept as one zlib-compressed JSON document and restored when the trip is opened.
+class ArchivedTrip(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # the original Trip.id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    destination = db.Column(db.String(200), nullable=False)
+    num_days = db.Column(db.Integer, nullable=False)
+    travel_type = db.Column(db.String(50), nullable=False)
+    num_people = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    payload = deferred(db.Column(db.LargeBinary, nullable=False))
+
+    __table_args__ = (
+        Index('ix_archived_trip_user_created', 'user_id', 'created_at'),
+    )
+
+# Fields clients can read and write through the API; background updates of
+# weather_data or route_data leave the version and updated_at alone
+TRIP_VERSIONED_FIELDS = ('destination', 'num_days', 'travel_type', 'num_people', 'itinerary', 'shared_with')
+
+@event.listens_for(Trip, 'before_update')
+def bump_trip_version(mapper, connection, trip):
+    state = db.inspect(trip)
+    if any(state.attrs[field].history.has_changes() for field in TRIP_VERSIONED_FIELDS):
+        trip.version = (trip.version or 0) + 1
+        trip.updated_at = datetime.utcnow()
+
+@event.listens_for(Trip, 'after_delete')
+def record_trip_tombstone(mapper, connection, trip):
+    # Runs for explicit deletes and for cascades from a deleted user alike
+    connection.execute(TripTombstone.__table__.insert().values(
+        trip_id=trip.id, user_id=trip.user_id, deleted_at=datetime.utcnow()))
@@ -0,0 +1,338 @@
+import os
+import re
+import time
+import zlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import requests
+
+from app import app, db
+from models import GeocodeCache, Trip
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+ROUTE_DATA_VERSION = 2
+
+SLOT_RANKS = {
+    'breakfast': 0, 'morning': 0,
+    'lunch': 1, 'afternoon': 1,
+    'dinner': 2, 'evening': 2, 'night': 2,
+}
+# Meals stay in their part of the day; other stops may move this many parts earlier or later
+MEALS = {'breakfast', 'lunch', 'dinner'}
+SLOT_FLEX = 1
+# Days with more located stops than this are only reordered within each part of the day
+MAX_EXACT_STOPS = 8
+_ACTIVITY_PATTERN = re.compile(r'^\s*([A-Za-z ]+?)\s*:\s*(.+)$')
+_VERB_PREFIX = re.compile(r'^(visit|explore|tour of|tour|see|dinner at|lunch at|breakfast at|walk through|stroll through)\s+',
+                          re.IGNORECASE)
+
+
+def parse_activity(activity: str) -> Tuple[Optional[str], str]:
+    """Split 'Morning: Visit the Louvre' into ('morning', 'Visit the Louvre')."""
+    match = _ACTIVITY_PATTERN.match(activity)
+    if match and match.group(1).lower() in SLOT_RANKS:
+        return match.group(1).lower(), match.group(2).strip()
+    return None, activity.strip()
+
+
+def place_name(description: str) -> str:
+    """Best-effort place name for geocoding: drop a leading verb like 'Visit'."""
+    return _VERB_PREFIX.sub('', description).strip()
+
+
+def haversine_matrix(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km, computed with broadcasting."""
+    lat = np.radians(lat)[:, None]
+    lon = np.radians(lon)[:, None]
+    dlat = lat - lat.T
+    dlon = lon - lon.T
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(order: List[int], dist: np.ndarray) -> float:
+    if len(order) < 2:
+        return 0.0
+    idx = np.asarray(order)
+    return float(dist[idx[:-1], idx[1:]].sum())
+
+
+def is_meal(slot: Optional[str], description: str) -> bool:
+    """'Lunch: ...' or 'Evening: Dinner at ...': tied to its time of day."""
+    first_word = description.split(' ', 1)[0].lower()
+    return slot in MEALS or first_word in MEALS
+
+
+def optimize_order(ranks: List[int], dist: np.ndarray, fixed: Optional[List[bool]] = None) -> List[int]:
+    """
+    Shortest visiting order for stops, as a permutation of positions: the
+    stop placed at position p takes over p's part of the day (ranks[p]).
+    Fixed stops (meals) only go to positions of their own rank, the others
+    to positions at most SLOT_FLEX parts away. Small days are searched
+    exhaustively; the original order wins ties.
+    """
+    n = len(ranks)
+    fixed = fixed or [False] * n
+    if n > MAX_EXACT_STOPS:
+        return _order_within_slots(ranks, dist)
+
+    allowed = [[stop for stop in range(n)
+                if (ranks[stop] == ranks[position] if fixed[stop]
+                    else abs(ranks[stop] - ranks[position]) <= SLOT_FLEX)]
+               for position in range(n)]
+    best_order = list(range(n))
+    best_length = path_length(best_order, dist) - 1e-9
+    order: List[int] = []
+    used = [False] * n
+
+    def search(length: float) -> None:
+        nonlocal best_order, best_length
+        if length >= best_length:
+            return
+        if len(order) == n:
+            best_order, best_length = list(order), length
+            return
+        for stop in allowed[len(order)]:
+            if not used[stop]:
+                step = dist[order[-1], stop] if order else 0.0
+                used[stop] = True
+                order.append(stop)
+                search(length + step)
+                order.pop()
+                used[stop] = False
+
+    search(0.0)
+    return best_order
+
+
+def _order_within_slots(ranks: List[int], dist: np.ndarray) -> List[int]:
+    """
+    Order stops by slot rank, then shorten the path within each slot:
+    nearest neighbour from the previous stop, improved with 2-opt moves that
+    only reverse segments inside one slot so the day's structure is kept.
+    """
+    groups: Dict[int, List[int]] = {}
+    for i, rank in enumerate(ranks):
+        groups.setdefault(rank, []).append(i)
+
+    order: List[int] = []
+    for rank in sorted(groups):
+        remaining = list(groups[rank])
+        while remaining:
+            if order:
+                last = order[-1]
+                nearest = min(remaining, key=lambda j: dist[last, j])
+            else:
+                nearest = remaining[0]  # Keep the first activity of the day as the start
+            order.append(nearest)
+            remaining.remove(nearest)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(order) - 1):
+            for j in range(i + 1, len(order)):
+                if ranks[order[i]] != ranks[order[j]]:
+                    break
+                a, b = order[i - 1], order[i]
+                c = order[j]
+                d = order[j + 1] if j + 1 < len(order) else None
+                before = dist[a, b] + (dist[c, d] if d is not None else 0.0)
+                after = dist[a, c] + (dist[b, d] if d is not None else 0.0)
+                if after + 1e-9 < before:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+    return order
+
+
+def maps_directions_url(places: List[str]) -> str:
+    return 'https://www.google.com/maps/dir/' + '/'.join(quote(p, safe='') for p in places)
+
+
+class LocalGeocoder:
+    """Deterministic offline stand-in: hashes place names to points near the destination."""
+
+    def geocode(self, place: str, destination: str) -> Optional[Tuple[float, float]]:
+        center = zlib.crc32(destination.lower().encode('utf-8'))
+        offset = zlib.crc32(place.lower().encode('utf-8'))
+        lat = (center % 12000) / 100.0 - 60.0 + ((offset & 0xFFFF) / 0xFFFF - 0.5) * 0.1
+        lon = ((center >> 8) % 36000) / 100.0 - 180.0 + ((offset >> 16) / 0xFFFF - 0.5) * 0.1
+        return lat, lon
+
+
+class NominatimGeocoder:
+    """OpenStreetMap Nominatim search, throttled to its one-request-per-second policy."""
+
+    URL = 'https://nominatim.openstreetmap.org/search'
+
+    def __init__(self, user_agent: str = 'AITravelPlanner/1.0'):
+        self.user_agent = user_agent
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def geocode(self, place: str, destination: str) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            wait = 1.0 - (time.monotonic() - self._last_request)
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+        try:
+            response = requests.get(self.URL, params={
+                'q': f"{place}, {destination}",
+                'format': 'json',
+                'limit': 1
+            }, headers={'User-Agent': self.user_agent}, timeout=10)
+            response.raise_for_status()
+            results = response.json()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Geocoding failed for {place}: {str(e)}")
+            raise
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+def get_geocoder():
+    return LocalGeocoder() if os.environ.get('GEOCODER', 'nominatim') == 'local' else NominatimGeocoder()
+
+
+class CachedGeocoder:
+    """Looks places up in the GeocodeCache table first; misses (including 'not found') are stored."""
+
+    def __init__(self, geocoder=None):
+        self.geocoder = geocoder or get_geocoder()
+
+    def geocode_many(self, places: List[str], destination: str) -> Dict[str, Optional[Tuple[float, float]]]:
+        keys = {place: f"{place} | {destination}".lower()[:400] for place in places}
+        rows = GeocodeCache.query.filter(GeocodeCache.place.in_(set(keys.values()))).all()
+        known = {row.place: (row.lat, row.lon) if row.lat is not None else None for row in rows}
+
+        results = {}
+        for place, key in keys.items():
+            if key not in known:
+                try:
+                    known[key] = self.geocoder.geocode(place, destination)
+                except requests.exceptions.RequestException:
+                    results[place] = None  # Transient failure: don't cache
+                    continue
+                coords = known[key]
+                db.session.add(GeocodeCache(place=key,
+                                            lat=coords[0] if coords else None,
+                                            lon=coords[1] if coords else None))
+            results[place] = known[key]
+        db.session.commit()
+        return results
+
+
+def relabel(activity: str, position_activity: str) -> str:
+    """activity moved to position_activity's place in the day, under that part of the day's label."""
+    match = _ACTIVITY_PATTERN.match(position_activity)
+    if not match or parse_activity(position_activity)[0] is None:
+        return activity
+    return f"{match.group(1)}: {parse_activity(activity)[1]}"
+
+
+def optimize_day(activities: List[str], coords: Dict[str, Optional[Tuple[float, float]]]) -> Dict:
+    """
+    Route for one itinerary day. Each position keeps its part of the day and
+    the stops are reordered across them (see optimize_order). Stops that
+    could not be geocoded stay where they are.
+    """
+    parsed = [parse_activity(activity) for activity in activities]
+    ranks = []
+    for i, (slot, _) in enumerate(parsed):
+        ranks.append(SLOT_RANKS[slot] if slot else (ranks[-1] if ranks else 0))
+    places = [place_name(description) for _, description in parsed]
+
+    located = [i for i, place in enumerate(places) if coords.get(place)]
+    located_set = set(located)
+    order = list(range(len(activities)))
+    distance = original_distance = None
+    if len(located) >= 2:
+        lat = np.array([coords[places[i]][0] for i in located])
+        lon = np.array([coords[places[i]][1] for i in located])
+        dist = haversine_matrix(lat, lon)
+        local_order = optimize_order([ranks[i] for i in located], dist,
+                                     [is_meal(*parsed[i]) for i in located])
+        original_distance = path_length(list(range(len(located))), dist)
+        distance = path_length(local_order, dist)
+        # Fill the located positions with the optimized sequence, leave the others in place
+        optimized = iter(located[k] for k in local_order)
+        order = [next(optimized) if i in located_set else i for i in range(len(activities))]
+
+    return {
+        'order': order,
+        'activities': [relabel(activities[i], activities[position]) for position, i in enumerate(order)],
+        'stops': [{
+            'name': places[i],
+            'slot': parsed[position][0] or parsed[i][0],
+            'lat': coords[places[i]][0] if coords.get(places[i]) else None,
+            'lon': coords[places[i]][1] if coords.get(places[i]) else None
+        } for position, i in enumerate(order)],
+        'distance_km': round(distance, 2) if distance is not None else None,
+        'original_distance_km': round(original_distance, 2) if original_distance is not None else None,
+        'maps_url': maps_directions_url([places[i] for i in order])
+    }
+
+
+def build_route_data(trip: Trip, geocoder: Optional[CachedGeocoder] = None) -> Dict:
+    """Geocode every activity once and compute the optimized route for each day."""
+    geocoder = geocoder or CachedGeocoder()
+    itinerary = trip.itinerary or {}
+    places = sorted({place_name(parse_activity(activity)[1])
+                     for activities in itinerary.values() for activity in activities})
+    coords = geocoder.geocode_many(places, trip.destination)
+    return {
+        'version': ROUTE_DATA_VERSION,
+        'computed_at': datetime.utcnow().isoformat(),
+        'days': {str(day): optimize_day(activities, coords) for day, activities in itinerary.items()}
+    }
+
+
+def optimize_trip_route(trip: Trip, geocoder: Optional[CachedGeocoder] = None) -> Dict:
+    trip.route_data = build_route_data(trip, geocoder)
+    db.session.commit()
+    return trip.route_data
+
+
+# Geocoding is slow (rate-limited upstream), so routes are computed off the request path
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='route-optimizer')
+
+
+def schedule_route_optimization(trip_id: int) -> None:
+    """Compute the trip's route in the background after the current request has committed it."""
+    def run():
+        with app.app_context():
+            try:
+                trip = Trip.query.get(trip_id)
+                if trip and trip.itinerary:
+                    optimize_trip_route(trip)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error optimizing route for trip {trip_id}: {str(e)}")
+
+    _executor.submit(run)
+
+
+@app.cli.command('optimize-routes')
+def optimize_routes_command():
+    """Compute route_data for trips that do not have it yet or have it from an older optimizer."""
+    trip_ids = [trip_id for trip_id, route_data in db.session.query(Trip.id, Trip.route_data)
+                if (route_data or {}).get('version') != ROUTE_DATA_VERSION]
+    trips = Trip.query.filter(Trip.id.in_(trip_ids)).all() if trip_ids else []
+    geocoder = CachedGeocoder()
+    for trip in trips:
+        try:
+            optimize_trip_route(trip, geocoder)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error optimizing route for trip {trip.id}: {str(e)}")
+    print(f"Optimized routes for {len(trips)} trips")
@@ -1,24 +1,76 @@
 import os
 import json
+import secrets
+import math
 import requests
 from datetime import datetime, timedelta
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, make_response, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_, text
+from sqlalchemy import text
 from app import app, db
 from models import Trip, User, Review, TripTemplate, UserPreference
 from utils.image_handler import save_image, allowed_file
-from trip_generator import generate_trip_plan
+from trip_generator import generate_trip_plan, regenerate_trip_day
 from chat_advisor import get_chat_response
-from weather import WeatherAPI
+from weather import WeatherAPI, validate_forecast_request
+from weather_alerts import classify_severity
+from weather_refresher import weather_for_display
+from route_optimizer import schedule_route_optimization
+from trip_updates import update_trip
+from utils.upstream_governor import UpstreamError
+from sqlalchemy.orm.exc import StaleDataError
+from trip_archive import archived_trips_query, trip_or_404
+from trip_queries import recommended_trips_query, shared_trips_query, trip_reviews_query, user_trips_query
+from utils.user_quota import ai_rate_limited, check_ai_quota
+from utils.page_cache import PageCache, track_changes
+from user_preferences import apply_to_model, from_form, get_preferences, invalidate_preferences
+from utils.shared_store import get_shared_store
+from utils.db_routing import primary_scope, replica_reads
 
 # Initialize WeatherAPI
 weather_api = WeatherAPI()
 
+# Rendered trip pages, invalidated whenever a trip, its reviews or the user list change
+page_cache = PageCache(maxsize=int(os.environ.get('PAGE_CACHE_SIZE', 512)),
+                       ttl=int(os.environ.get('PAGE_CACHE_TTL', 300)),
+                       shared_store=get_shared_store())
+
+
+def _page_cache_scopes(obj):
+    if isinstance(obj, Trip):
+        return [f"trip:{obj.id}"]
+    if isinstance(obj, Review):
+        return [f"trip:{obj.trip_id}"]
+    if isinstance(obj, User):
+        return ['users']
+    return []
+
+
+track_changes(db.session, page_cache, _page_cache_scopes)
+
+
+def _from_primary(render):
+    """
+    Render a cache miss from the primary: a lagging replica would otherwise
+    store old data under the version that was bumped for the new one.
+    """
+    def wrapper():
+        with primary_scope():
+            return render()
+    return wrapper
+
+
+@app.template_global()
+def public_trip_url(trip):
+    """The trip's public link, or None while the owner has not made it public."""
+    return url_for('public_trip', token=trip.public_token, _external=True) if trip.public_token else None
+
 # Add custom template filter for JSON
 @app.template_filter('fromjson')
 def fromjson_filter(value):
+    if isinstance(value, list):
+        return value
     try:
         return json.loads(value) if value else []
     except (TypeError, json.JSONDecodeError):
@@ -30,6 +82,7 @@ def index():
 
 @app.route('/dashboard')
 @login_required
+@replica_reads
 def dashboard():
     # Get filter parameters
     search = request.args.get('search', '')
@@ -37,60 +90,23 @@ def dashboard():
     duration = request.args.get('duration', '')
     sort = request.args.get('sort', 'newest')
     
-    # Base query
-    query = Trip.query.filter_by(user_id=current_user.id)
-    
-    # Apply filters
-    if search:
-        query = query.filter(Trip.destination.ilike(f'%{search}%'))
-    if travel_type:
-        query = query.filter_by(travel_type=travel_type)
-    if duration:
-        if duration == '1-3':
-            query = query.filter(Trip.num_days.between(1, 3))
-        elif duration == '4-7':
-            query = query.filter(Trip.num_days.between(4, 7))
-        elif duration == '8+':
-            query = query.filter(Trip.num_days >= 8)
-    
-    # Apply sorting
-    if sort == 'oldest':
-        query = query.order_by(Trip.created_at.asc())
-    elif sort == 'destination':
-        query = query.order_by(Trip.destination.asc())
-    else:  # newest
-        query = query.order_by(Trip.created_at.desc())
-    
-    trips = query.all()
+    trips = user_trips_query(current_user.id, search, travel_type, duration, sort).all()
     
     # Get recommended trips based on user preferences
     recommended_trips = []
-    if hasattr(current_user, 'preferences') and current_user.preferences:
-        pref = current_user.preferences
-        try:
-            preferred_types = json.loads(pref.preferred_travel_types) if pref.preferred_travel_types else []
-            if preferred_types and pref.preferred_trip_length:
-                recommended_query = Trip.query.filter(
-                    Trip.user_id != current_user.id,
-                    Trip.travel_type.in_(preferred_types)
-                )
-                if pref.preferred_trip_length:
-                    recommended_query = recommended_query.filter(
-                        Trip.num_days.between(
-                            max(1, pref.preferred_trip_length - 2),
-                            min(30, pref.preferred_trip_length + 2)
-                        )
-                    )
-                recommended_trips = recommended_query.limit(3).all()
-        except (json.JSONDecodeError, TypeError) as e:
-            app.logger.error(f"Error parsing user preferences: {str(e)}")
+    prefs = get_preferences(current_user.id)
+    if prefs and prefs.travel_types and prefs.trip_length:
+        recommended_trips = recommended_trips_query(current_user.id, prefs.travel_types, prefs.trip_length).all()
     
     return render_template('dashboard.html', 
                          trips=trips, 
+                         archived_trips=archived_trips_query(current_user.id).all(),
+                         prefs=prefs,
                          recommended_trips=recommended_trips)
 
 @app.route('/shared_trips')
 @login_required
+@replica_reads
 def shared_trips():
     # Get filter parameters
     search = request.args.get('search', '')
@@ -98,39 +114,7 @@ def shared_trips():
     duration = request.args.get('duration', '')
     sort = request.args.get('sort', 'newest')
     
-    # Get base query for trips shared with current user
-    query = Trip.query.filter(
-        Trip.shared_with.cast(db.String).contains(str(current_user.id))
-    )
-    
-    # Apply filters
-    if search:
-        search_terms = search.split()
-        search_filters = []
-        for term in search_terms:
-            search_filters.append(Trip.destination.ilike(f'%{term}%'))
-        query = query.filter(or_(*search_filters))
-
-    if travel_type:
-        query = query.filter(Trip.travel_type.ilike(f'%{travel_type}%'))
-
-    if duration:
-        if duration == '1-3':
-            query = query.filter(Trip.num_days <= 3)
-        elif duration == '4-7':
-            query = query.filter(Trip.num_days > 3, Trip.num_days <= 7)
-        elif duration == '8+':
-            query = query.filter(Trip.num_days > 7)
-
-    # Apply sorting
-    if sort == 'oldest':
-        query = query.order_by(Trip.created_at.asc())
-    elif sort == 'destination':
-        query = query.order_by(Trip.destination.asc())
-    else:  # newest
-        query = query.order_by(Trip.created_at.desc())
-
-    trips = query.all()
+    trips = shared_trips_query(current_user.id, search, travel_type, duration, sort).all()
     return render_template('shared_trips.html', trips=trips)
 
 @app.route('/preferences', methods=['GET', 'POST'])
@@ -142,29 +126,14 @@ def preferences():
         user_prefs = UserPreference(user_id=current_user.id)
         db.session.add(user_prefs)
         db.session.commit()
+        invalidate_preferences(current_user.id)
     
     if request.method == 'POST':
         try:
-            # Handle travel types (checkboxes)
-            travel_types = request.form.getlist('travel_types')
-            user_prefs.preferred_travel_types = json.dumps(travel_types)
-            
-            # Handle destinations
-            destinations = request.form.get('preferred_destinations', '').split(',')
-            user_prefs.preferred_destinations = json.dumps([d.strip() for d in destinations if d.strip()])
-            
-            # Handle numeric fields
-            user_prefs.preferred_trip_length = int(request.form.get('preferred_trip_length', 1))
-            user_prefs.preferred_group_size = int(request.form.get('preferred_group_size', 1))
-            
-            # Handle budget range
-            user_prefs.budget_range = request.form.get('budget_range')
-            
-            # Handle interests
-            interests = request.form.get('interests', '').split(',')
-            user_prefs.interests = json.dumps([i.strip() for i in interests if i.strip()])
-            
+            # Validates the form and stores the lists as native JSON arrays
+            apply_to_model(from_form(request.form), user_prefs)
             db.session.commit()
+            invalidate_preferences(current_user.id)
             flash('Preferences updated successfully!', 'success')
             return redirect(url_for('dashboard'))
             
@@ -173,12 +142,14 @@ def preferences():
             app.logger.error(f"Error updating preferences: {str(e)}")
             flash('Error updating preferences. Please try again.', 'danger')
     
-    return render_template('preferences.html', user_preferences=user_prefs)
+    return render_template('preferences.html', user_preferences=user_prefs,
+                           prefs=get_preferences(current_user.id))
 
 @app.route('/trip/<int:trip_id>', methods=['GET', 'POST'])
 @login_required
+@replica_reads
 def view_trip(trip_id):
-    trip = Trip.query.get_or_404(trip_id)
+    trip = trip_or_404(trip_id, current_user.id)
     
     # Check if user has permission to view this trip
     if trip.user_id != current_user.id and str(current_user.id) not in (trip.shared_with or []):
@@ -189,13 +160,25 @@ def view_trip(trip_id):
         # Handle sharing trip
         share_user_id = request.form.get('share_user_id')
         unshare = request.form.get('unshare')
+        public_link = request.form.get('public_link')
         
-        if share_user_id and trip.user_id == current_user.id:
+        if public_link in ('enable', 'rotate', 'disable') and trip.user_id == current_user.id:
             try:
-                shared_with = json.loads(trip.shared_with) if trip.shared_with else []
+                # A new random token on every enable/rotate, so old links stop working
+                trip.public_token = None if public_link == 'disable' else secrets.token_urlsafe(32)
+                db.session.commit()
+                flash('Public link disabled.' if public_link == 'disable' else 'New public link created.', 'success')
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error updating public link: {str(e)}")
+                flash('Error updating public link. Please try again.', 'danger')
+
+        elif share_user_id and trip.user_id == current_user.id:
+            try:
+                shared_with = list(trip.shared_with or [])
                 if share_user_id not in shared_with:
                     shared_with.append(share_user_id)
-                    trip.shared_with = json.dumps(shared_with)
+                    trip.shared_with = shared_with
                     db.session.commit()
                     flash('Trip shared successfully!', 'success')
             except Exception as e:
@@ -204,10 +187,10 @@ def view_trip(trip_id):
                 
         elif unshare and trip.user_id == current_user.id:
             try:
-                shared_with = json.loads(trip.shared_with) if trip.shared_with else []
+                shared_with = list(trip.shared_with or [])
                 if unshare in shared_with:
                     shared_with.remove(unshare)
-                    trip.shared_with = json.dumps(shared_with)
+                    trip.shared_with = shared_with
                     db.session.commit()
                     flash('Sharing permission removed.', 'success')
             except Exception as e:
@@ -242,27 +225,70 @@ def view_trip(trip_id):
                 
         return redirect(url_for('view_trip', trip_id=trip.id))
     
-    # Get reviews for the trip
-    reviews = Review.query.filter_by(trip_id=trip.id).order_by(Review.created_at.desc()).all()
-    
-    # Get available users for sharing (exclude owner and already shared users)
-    if trip.user_id == current_user.id:
-        shared_with = json.loads(trip.shared_with) if trip.shared_with else []
-        available_users = User.query.filter(
-            User.id != current_user.id,
-            ~User.id.in_([int(uid) for uid in shared_with])
-        ).all()
-        shared_users = User.query.filter(User.id.in_([int(uid) for uid in shared_with])).all()
-    else:
-        available_users = []
-        shared_users = []
-
-    return render_template('trip_view.html', 
-                         trip=trip,
-                         reviews=reviews,
-                         is_owner=trip.user_id == current_user.id,
-                         available_users=available_users,
-                         shared_users=shared_users)
+    is_owner = trip.user_id == current_user.id
+
+    def render():
+        # The trip may have been read from a replica; the page is cached under the current version
+        db.session.refresh(trip)
+
+        # Get reviews for the trip
+        reviews = trip_reviews_query(trip.id).all()
+        
+        # Get available users for sharing (exclude owner and already shared users)
+        if is_owner:
+            shared_with = trip.shared_with or []
+            available_users = User.query.filter(
+                User.id != current_user.id,
+                ~User.id.in_([int(uid) for uid in shared_with])
+            ).all()
+            shared_users = User.query.filter(User.id.in_([int(uid) for uid in shared_with])).all()
+        else:
+            available_users = []
+            shared_users = []
+
+        weather, weather_stale = weather_for_display(trip)
+
+        return render_template('trip_view.html', 
+                             trip=trip,
+                             reviews=reviews,
+                             is_owner=is_owner,
+                             available_users=available_users,
+                             shared_users=shared_users,
+                             weather=weather,
+                             weather_stale=weather_stale)
+
+    # The owner's page lists every other user for sharing, so it also depends on the user list
+    version = page_cache.version(f"trip:{trip.id}", *(['users'] if is_owner else []))
+    key = f"trip_view:{trip.id}:{current_user.id}:{version}" if version else None
+    return page_cache.response(key, _from_primary(render), 'private, no-cache')
+
+@app.route('/p/<token>')
+@replica_reads
+def public_trip(token):
+    # Only trips whose owner enabled a public link have a token
+    trip_id = db.session.query(Trip.id).filter_by(public_token=token).scalar()
+    if trip_id is None:
+        abort(404)
+
+    def render():
+        trip = db.session.get(Trip, trip_id)
+        if trip is None or trip.public_token != token:
+            abort(404)
+        reviews = trip_reviews_query(trip.id).all()
+        weather, weather_stale = weather_for_display(trip)
+        return render_template('public_trip.html',
+                             trip=trip,
+                             reviews=reviews,
+                             weather=weather,
+                             weather_stale=weather_stale)
+
+    # A cache hit costs only the unique-index token lookup above, which also makes a revoked
+    # link 404 at once; only the navigation differs for logged-in users
+    authenticated = current_user.is_authenticated
+    version = page_cache.version(f"trip:{trip_id}")
+    key = f"public_trip:{token}:{int(authenticated)}:{version}" if version else None
+    cache_control = 'private, no-cache' if authenticated else 'public, max-age=60'
+    return page_cache.response(key, _from_primary(render), cache_control)
 
 @app.route('/create_trip', methods=['GET', 'POST'])
 @login_required
@@ -300,6 +326,12 @@ def create_trip():
             
             # Generate itinerary if not provided or invalid
             if not itinerary:
+                retry_after = check_ai_quota()
+                if retry_after:
+                    flash(f'You have reached the AI generation limit. Please try again in {math.ceil(retry_after)} seconds or provide a manual itinerary.', 'warning')
+                    response = make_response(render_template('trip_create.html'), 429)
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response
                 try:
                     generated_plans = generate_trip_plan(
                         destination=destination,
@@ -329,6 +361,7 @@ def create_trip():
             
             db.session.add(trip)
             db.session.commit()
+            schedule_route_optimization(trip.id)
             
             flash('Trip created successfully!', 'success')
             return redirect(url_for('view_trip', trip_id=trip.id))
@@ -346,7 +379,7 @@ def create_trip():
 @app.route('/trip/<int:trip_id>/delete', methods=['POST'])
 @login_required
 def delete_trip(trip_id):
-    trip = Trip.query.get_or_404(trip_id)
+    trip = trip_or_404(trip_id, current_user.id, owner_only=True)
     
     if trip.user_id != current_user.id:
         flash('You do not have permission to delete this trip.', 'danger')
@@ -363,6 +396,38 @@ def delete_trip(trip_id):
     
     return redirect(url_for('dashboard'))
 
+@app.route('/trip/<int:trip_id>/day/<day>/regenerate', methods=['POST'])
+@login_required
+def replan_day(trip_id, day):
+    trip = trip_or_404(trip_id, current_user.id, owner_only=True)
+
+    if trip.user_id != current_user.id:
+        flash('You do not have permission to modify this trip.', 'danger')
+        return redirect(url_for('dashboard'))
+    if day not in (trip.itinerary or {}):
+        abort(404)
+
+    retry_after = check_ai_quota()
+    if retry_after:
+        flash(f'You have reached the AI generation limit. Please try again in {math.ceil(retry_after)} seconds.', 'warning')
+        return redirect(url_for('view_trip', trip_id=trip.id))
+
+    try:
+        itinerary = regenerate_trip_day(trip, day, instructions=request.form.get('instructions', ''))
+        if update_trip(trip, {'itinerary': itinerary}):
+            db.session.commit()
+            schedule_route_optimization(trip.id)
+        flash(f'Day {day} has been replanned.', 'success')
+    except StaleDataError:
+        db.session.rollback()
+        flash('The trip was changed while replanning. Please try again.', 'warning')
+    except (UpstreamError, ValueError) as e:
+        db.session.rollback()
+        app.logger.error(f"Error regenerating day {day} of trip {trip.id}: {str(e)}")
+        flash('Could not replan this day right now. Please try again.', 'danger')
+
+    return redirect(url_for('view_trip', trip_id=trip.id))
+
 @app.route('/chat_advisor')
 @login_required
 def chat_advisor():
@@ -370,6 +435,7 @@ def chat_advisor():
 
 @app.route('/api/chat', methods=['POST'])
 @login_required
+@ai_rate_limited
 def chat():
     try:
         data = request.get_json()
@@ -389,6 +455,7 @@ def chat():
 
 @app.route('/api/trip_advisor', methods=['POST'])
 @login_required
+@ai_rate_limited
 def get_trip_suggestions():
     try:
         data = request.get_json()
@@ -400,17 +467,10 @@ def get_trip_suggestions():
             return jsonify({'error': 'No description provided'}), 400
         
         # Include user preferences in the request if available
-        if hasattr(current_user, 'preferences') and current_user.preferences:
-            pref = current_user.preferences
-            context = {
-                'preferred_travel_types': json.loads(pref.preferred_travel_types) if pref.preferred_travel_types else [],
-                'preferred_destinations': json.loads(pref.preferred_destinations) if pref.preferred_destinations else [],
-                'preferred_trip_length': pref.preferred_trip_length,
-                'preferred_group_size': pref.preferred_group_size,
-                'budget_range': pref.budget_range,
-                'interests': json.loads(pref.interests) if pref.interests else []
-            }
-            response = get_chat_response(description, context=json.dumps(context), is_trip_suggestion=True)
+        prefs = get_preferences(current_user.id)
+        if prefs:
+            response = get_chat_response(description, context=json.dumps(prefs.to_context()),
+                                         is_trip_suggestion=True)
         else:
             response = get_chat_response(description, is_trip_suggestion=True)
             
@@ -441,24 +501,13 @@ def get_weather():
         if num_days:
             try:
                 num_days = int(num_days)
-                if num_days < 1 or num_days > 14:
-                    return jsonify({'error': 'Number of days must be between 1 and 14'}), 400
             except ValueError:
                 return jsonify({'error': 'Invalid number of days'}), 400
 
-        # Validate date range if provided
-        if start_date and end_date:
-            try:
-                start = datetime.strptime(start_date, '%Y-%m-%d')
-                end = datetime.strptime(end_date, '%Y-%m-%d')
-                if end < start:
-                    return jsonify({'error': 'End date must be after start date'}), 400
-                
-                date_diff = (end - start).days
-                if date_diff > 14:
-                    return jsonify({'error': 'Date range cannot exceed 14 days'}), 400
-            except ValueError:
-                return jsonify({'error': 'Invalid date format'}), 400
+        # Validate day count and date range if provided
+        error = validate_forecast_request(num_days or None, start_date, end_date)
+        if error:
+            return jsonify({'error': error}), 400
 
         # Get weather data
         weather_data = weather_api.get_weather_data(
@@ -478,32 +527,12 @@ def get_weather():
 
 def get_alert_severity(event, description):
     """Determine the severity of a weather alert based on its event type and description."""
-    severe_keywords = ['severe', 'extreme', 'danger', 'warning', 'hurricane', 'tornado']
-    moderate_keywords = ['watch', 'advisory', 'moderate']
-    
-    event_lower = event.lower()
-    desc_lower = description.lower()
-    
-    # Check for severe conditions
-    for keyword in severe_keywords:
-        if keyword in event_lower or keyword in desc_lower:
-            return 'Severe'
-            
-    # Check for moderate conditions
-    for keyword in moderate_keywords:
-        if keyword in event_lower or keyword in desc_lower:
-            return 'Moderate'
-            
-    # Default to mild
-    return 'Mild'
+    return classify_severity(event, description)
 
 def get_active_alerts(alerts, timestamp):
     """Filter alerts that are active at the given timestamp."""
-    active_alerts = []
-    for alert in alerts:
-        if alert['start'] <= timestamp <= alert['end']:
-            active_alerts.append(alert)
-    return active_alerts
+    # One lookup: a linear scan beats building an AlertIndex (that pays off for many lookups, see attach_alerts)
+    return [alert for alert in alerts if alert['start'] <= timestamp <= alert['end']]
 
 @app.errorhandler(404)
 def not_found_error(error):
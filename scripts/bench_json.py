@@ -0,0 +1,112 @@
+"""
+Compare JSON encoding before/after the fast JSON layer on realistic trips.
+
+    python scripts/bench_json.py [--trips 50] [--days 7] [--repeat 200]
+
+Runs without a database or API keys: the payloads mimic what the trip list
+endpoint, jsonify responses and the JSON columns carry.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_restx import fields, marshal
+
+from app import app  # noqa: F401  (models need the app initialized first)
+from models import Trip
+from utils import fast_json
+from utils.fast_json import FastJSONProvider
+
+SLOTS = ['Morning', 'Lunch', 'Afternoon', 'Evening']
+PLACES = ['the Louvre', 'Musée d\'Orsay', 'Montmartre', 'Sainte-Chapelle', 'Le Marais', 'Café de Flore',
+          'Jardin du Luxembourg', 'Seine river cruise', 'Eiffel Tower', 'Père Lachaise Cemetery']
+
+
+def make_trip(trip_id: int, days: int, rng: random.Random) -> dict:
+    itinerary = {str(day): [f"{slot}: Visit {rng.choice(PLACES)} and explore the neighbourhood"
+                            for slot in SLOTS] for day in range(1, days + 1)}
+    start = datetime(2026, 6, 1)
+    forecast = [{
+        'date': (start + timedelta(days=d)).strftime('%Y-%m-%d'),
+        'temperature': round(rng.uniform(10, 30), 1),
+        'temp_min': round(rng.uniform(5, 15), 1),
+        'temp_max': round(rng.uniform(20, 35), 1),
+        'condition': rng.choice(['Clear', 'Clouds', 'Rain']),
+        'precipitation': rng.randint(0, 100),
+        'hourly': [{'time': f"{h:02d}:00", 'dt': 1780000000 + d * 86400 + h * 3600,
+                    'temperature': round(rng.uniform(10, 30), 1), 'condition': 'Clouds',
+                    'precipitation': rng.randint(0, 100)} for h in range(0, 24, 3)]
+    } for d in range(min(days, 5))]
+    return {
+        'id': trip_id,
+        'destination': 'Paris, France',
+        'num_days': days,
+        'travel_type': 'Cultural',
+        'num_people': 2,
+        'itinerary': itinerary,
+        'shared_with': ['3', '7'],
+        'updated_at': datetime(2026, 5, 1, 12, 30),
+        'weather_data': {'fetched_at': start.isoformat(), 'forecast': forecast}
+    }
+
+
+# Same fields as the API's trip model
+TRIP_FIELDS = {
+    'id': fields.Integer, 'destination': fields.String, 'num_days': fields.Integer,
+    'travel_type': fields.String, 'num_people': fields.Integer, 'itinerary': fields.Raw,
+    'shared_with': fields.Raw, 'updated_at': fields.DateTime
+}
+
+
+def bench(label: str, before, after, repeat: int) -> None:
+    t_before = min(timeit.repeat(before, number=repeat, repeat=3)) / repeat
+    t_after = min(timeit.repeat(after, number=repeat, repeat=3)) / repeat
+    print(f"{label:<34} {t_before * 1e6:>10.1f} us {t_after * 1e6:>10.1f} us {t_before / t_after:>7.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trips', type=int, default=50)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    trips = [make_trip(i, args.days, rng) for i in range(1, args.trips + 1)]
+    rows = [SimpleNamespace(**trip) for trip in trips]  # Stand-ins for loaded Trip rows
+    column_value = trips[0]['weather_data']
+    encoded_column = json.dumps(column_value)
+
+    default_app, fast_app = Flask('before'), Flask('after')
+    default_app.json = DefaultJSONProvider(default_app)
+    fast_app.json = FastJSONProvider(fast_app)
+
+    print(f"orjson: {'yes' if fast_json.orjson else 'no (standard library fallback)'}")
+    print(f"{'payload':<34} {'before':>13} {'after':>13} {'speedup':>8}")
+    with default_app.app_context():
+        before_response = lambda: default_app.json.response(trips)
+    with fast_app.app_context():
+        after_response = lambda: fast_app.json.response(trips)
+    bench(f"jsonify {args.trips} trips", before_response, after_response, args.repeat)
+    # Before: restx marshal + json.dumps; after: Trip.to_dict + orjson, as GET /api/trips does now
+    bench(f"API list {args.trips} trips",
+          lambda: (json.dumps(marshal(rows, TRIP_FIELDS)) + "\n").encode('utf-8'),
+          lambda: fast_json.dumps_bytes([Trip.to_dict(row) for row in rows]) + b"\n", args.repeat)
+    bench("JSON column write", lambda: json.dumps(column_value), lambda: fast_json.dumps(column_value),
+          args.repeat * 10)
+    bench("JSON column read", lambda: json.loads(encoded_column), lambda: fast_json.loads(encoded_column),
+          args.repeat * 10)
+
+
+if __name__ == '__main__':
+    main()
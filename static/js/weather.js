@@ -53,6 +53,11 @@ function showError(message) {
     weatherContainer.innerHTML = `<div class="alert alert-warning">${message}</div>`;
 }
 
+function showNoForecast() {
+    const weatherContainer = document.getElementById('weather-container');
+    weatherContainer.innerHTML = '<div class="alert alert-info">No forecast is available for these dates; forecasts reach 5 days ahead.</div>';
+}
+
 function isValidDateRange(start, end) {
     const today = new Date();
     today.setHours(0, 0, 0, 0);
@@ -136,10 +141,11 @@ function updateWeatherDisplay(weatherData) {
         
         // Process each day's data for alerts
         weatherData.forEach(day => {
-            const alerts = detectWeatherAlerts({
+            // Official alerts from the server first, then forecast-derived ones
+            const alerts = (day.alerts || []).concat(detectWeatherAlerts({
                 ...day,
                 temperature: convertToCelsius(day.temperature)
-            });
+            }));
             if (alerts.length > 0) {
                 const dayAlerts = document.createElement('div');
                 dayAlerts.innerHTML = `
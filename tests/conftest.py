@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py reads its configuration at import time, so the scratch database is set up first.
+# TEST_DATABASE_URL may point at an empty PostgreSQL database instead; its tables are dropped
+_scratch_dir = tempfile.TemporaryDirectory()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = (os.environ.get('TEST_DATABASE_URL')
+                              or f"sqlite:///{os.path.join(_scratch_dir.name, 'test.db')}")
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+os.environ.pop('REDIS_URL', None)
+os.environ.setdefault('OPENWEATHERMAP_API_KEY', 'unused')
+
+# Modules like models import app themselves, so it has to be loaded first
+import app  # noqa: E402,F401
+
+
+@pytest.fixture
+def app_context():
+    """An application context on an empty database."""
+    from app import app, db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def user(app_context):
+    from app import db
+    from models import User
+    user = User(username='traveller', email='traveller@example.com')
+    db.session.add(user)
+    db.session.commit()
+    return user
@@ -0,0 +1,198 @@
+import copy
+
+import pytest
+
+from utils.json_patch import (JsonPatchConflict, JsonPatchError, apply_patch, changed_keys, merge_patch,
+                              parse_pointer, resolve)
+
+TRIP = {
+    'destination': 'Lisbon',
+    'itinerary': {
+        '1': ['Morning: Belem Tower', 'Afternoon: LX Factory', 'Evening: Fado'],
+        '2': ['Morning: Sintra', 'Afternoon: Cascais', 'Evening: Time Out Market'],
+    },
+    'shared_with': ['3'],
+    'a/b': 1,
+    'm~n': 2,
+}
+
+
+@pytest.fixture
+def doc():
+    return copy.deepcopy(TRIP)
+
+
+def _apply(doc, *operations):
+    before = copy.deepcopy(doc)
+    result = apply_patch(doc, list(operations))
+    assert doc == before, "the input document must never be modified"
+    return result
+
+
+# Merge patch (RFC 7396)
+
+def test_merge_patch_replaces_merges_and_removes(doc):
+    result = merge_patch(doc, {'destination': 'Porto', 'itinerary': {'2': None, '3': ['Morning: Ribeira']},
+                               'shared_with': ['3', '7']})
+
+    assert result['destination'] == 'Porto'
+    assert result['itinerary'] == {'1': TRIP['itinerary']['1'], '3': ['Morning: Ribeira']}
+    assert result['shared_with'] == ['3', '7']
+    assert doc == TRIP
+
+
+def test_merge_patch_shares_untouched_values(doc):
+    result = merge_patch(doc, {'destination': 'Porto'})
+    assert result['itinerary'] is doc['itinerary']
+
+
+def test_merge_patch_removing_a_missing_key_is_a_no_op(doc):
+    assert merge_patch(doc, {'nope': None}) == TRIP
+
+
+def test_merge_patch_non_object_replaces_the_target(doc):
+    assert merge_patch(doc, ['whole']) == ['whole']
+    assert merge_patch('text', {'a': {'b': 1}}) == {'a': {'b': 1}}
+
+
+# Pointers (RFC 6901)
+
+def test_parse_pointer_unescapes_tokens():
+    assert parse_pointer('') == []
+    assert parse_pointer('/a~1b/m~0n/0') == ['a/b', 'm~n', '0']
+
+
+@pytest.mark.parametrize('pointer', ['itinerary', 5, None, ['/a']])
+def test_parse_pointer_rejects_invalid_pointers(pointer):
+    with pytest.raises(JsonPatchError):
+        parse_pointer(pointer)
+
+
+def test_resolve(doc):
+    assert resolve(doc, '/itinerary/1/2') == 'Evening: Fado'
+    assert resolve(doc, '/a~1b') == 1
+    assert resolve(doc, '/m~0n') == 2
+    assert resolve(doc, '') is doc
+
+
+@pytest.mark.parametrize('pointer', ['/missing', '/itinerary/3', '/itinerary/1/3', '/itinerary/1/01',
+                                     '/itinerary/1/-', '/destination/x'])
+def test_resolve_missing_paths(doc, pointer):
+    with pytest.raises(JsonPatchError):
+        resolve(doc, pointer)
+
+
+# JSON Patch (RFC 6902)
+
+def test_add(doc):
+    result = _apply(doc, {'op': 'add', 'path': '/itinerary/1/1', 'value': 'Noon: Pasteis de Belem'},
+                    {'op': 'add', 'path': '/shared_with/-', 'value': '7'},
+                    {'op': 'add', 'path': '/notes', 'value': 'Bring a jacket'})
+
+    assert result['itinerary']['1'][1] == 'Noon: Pasteis de Belem'
+    assert len(result['itinerary']['1']) == 4
+    assert result['shared_with'] == ['3', '7']
+    assert result['notes'] == 'Bring a jacket'
+
+
+def test_add_at_the_end_index_appends(doc):
+    assert _apply(doc, {'op': 'add', 'path': '/shared_with/1', 'value': '7'})['shared_with'] == ['3', '7']
+
+
+def test_add_replaces_an_existing_key(doc):
+    assert _apply(doc, {'op': 'add', 'path': '/destination', 'value': 'Porto'})['destination'] == 'Porto'
+
+
+def test_remove(doc):
+    result = _apply(doc, {'op': 'remove', 'path': '/itinerary/2'},
+                    {'op': 'remove', 'path': '/itinerary/1/0'})
+
+    assert list(result['itinerary']) == ['1']
+    assert result['itinerary']['1'] == TRIP['itinerary']['1'][1:]
+
+
+def test_replace(doc):
+    result = _apply(doc, {'op': 'replace', 'path': '/itinerary/2/0', 'value': 'Morning: Boat tour'},
+                    {'op': 'replace', 'path': '/a~1b', 'value': 10})
+
+    assert result['itinerary']['2'][0] == 'Morning: Boat tour'
+    assert result['a/b'] == 10
+    # Only the containers on the path are copied
+    assert result['itinerary']['1'] is doc['itinerary']['1']
+
+
+def test_move(doc):
+    result = _apply(doc, {'op': 'move', 'from': '/itinerary/2/0', 'path': '/itinerary/1/0'})
+
+    assert result['itinerary']['1'][0] == 'Morning: Sintra'
+    assert result['itinerary']['2'] == TRIP['itinerary']['2'][1:]
+
+
+def test_move_between_keys(doc):
+    result = _apply(doc, {'op': 'move', 'from': '/itinerary/2', 'path': '/itinerary/3'})
+    assert list(result['itinerary']) == ['1', '3']
+
+
+def test_copy(doc):
+    result = _apply(doc, {'op': 'copy', 'from': '/itinerary/1', 'path': '/itinerary/3'})
+    assert result['itinerary']['3'] == TRIP['itinerary']['1']
+
+
+def test_test_passes_and_fails(doc):
+    assert _apply(doc, {'op': 'test', 'path': '/destination', 'value': 'Lisbon'}) == TRIP
+    with pytest.raises(JsonPatchConflict):
+        _apply(doc, {'op': 'test', 'path': '/destination', 'value': 'Porto'})
+
+
+def test_patch_is_atomic(doc):
+    with pytest.raises(JsonPatchConflict):
+        _apply(doc, {'op': 'replace', 'path': '/destination', 'value': 'Porto'},
+               {'op': 'test', 'path': '/destination', 'value': 'Lisbon'})
+    assert doc == TRIP
+
+
+def test_empty_patch_returns_the_document(doc):
+    assert _apply(doc) == TRIP
+
+
+@pytest.mark.parametrize('operations', [
+    {'op': 'add', 'path': '/x', 'value': 1},
+    [['add', '/x', 1]],
+    [{'op': 'add', 'value': 1}],
+    [{'op': 'add', 'path': '/x'}],
+    [{'op': 'replace', 'path': '/destination'}],
+    [{'op': 'test', 'path': '/destination'}],
+    [{'op': 'move', 'path': '/x'}],
+    [{'op': 'copy', 'path': '/x'}],
+    [{'op': 'frobnicate', 'path': '/x'}],
+    [{'path': '/x', 'value': 1}],
+    [{'op': 'add', 'path': 'x', 'value': 1}],
+    [{'op': 'add', 'path': '', 'value': {}}],
+    [{'op': 'add', 'path': '/missing/x', 'value': 1}],
+    [{'op': 'add', 'path': '/shared_with/5', 'value': '7'}],
+    [{'op': 'add', 'path': '/destination/x', 'value': 1}],
+    [{'op': 'remove', 'path': '/missing'}],
+    [{'op': 'remove', 'path': '/shared_with/1'}],
+    [{'op': 'remove', 'path': '/shared_with/-'}],
+    [{'op': 'replace', 'path': '/missing', 'value': 1}],
+    [{'op': 'replace', 'path': '/itinerary/1/x', 'value': 1}],
+    [{'op': 'move', 'from': '/itinerary', 'path': '/itinerary/1/x'}],
+    [{'op': 'move', 'from': '/missing', 'path': '/x'}],
+    [{'op': 'move', 'from': '/destination', 'path': 5}],
+    [{'op': 'move', 'from': 5, 'path': '/x'}],
+    [{'op': 'move', 'from': 'destination', 'path': '/x'}],
+    [{'op': 'copy', 'from': '/missing', 'path': '/x'}],
+    [{'op': 'copy', 'from': None, 'path': '/x'}],
+    [{'op': 'test', 'path': '/missing', 'value': 1}],
+    [{'op': 'remove', 'path': 7}],
+])
+def test_invalid_operations_raise_patch_errors(doc, operations):
+    with pytest.raises(JsonPatchError):
+        apply_patch(doc, operations)
+    assert doc == TRIP
+
+
+def test_changed_keys():
+    old = {'1': ['a'], '2': ['b'], '3': ['c']}
+    new = {'1': ['a'], '2': ['B'], '4': ['d']}
+    assert sorted(changed_keys(old, new)) == ['2', '3', '4']
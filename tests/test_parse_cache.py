@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from utils.cache import ByteSizedCache
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ByteSizedCache(max_bytes=10)
+    cache.set('a', b'aaaa')
+    cache.set('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'  # b is now the least recently used
+
+    cache.set('c', b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa' and cache.get('c') == b'cccc'
+    assert cache.current_bytes == 8 and len(cache) == 2
+
+
+def test_one_large_value_evicts_several_small_ones():
+    cache = ByteSizedCache(max_bytes=10)
+    for key in 'abcde':
+        cache.set(key, b'xx')
+
+    cache.set('big', b'y' * 9)
+
+    assert len(cache) == 1 and cache.current_bytes == 9
+
+
+def test_value_larger_than_the_cache_is_not_stored():
+    cache = ByteSizedCache(max_bytes=10)
+    cache.set('a', b'aaaa')
+    cache.set('huge', b'z' * 11)
+
+    assert cache.get('huge') is None
+    assert cache.get('a') == b'aaaa'
+
+
+def test_replacing_a_key_recounts_its_size():
+    cache = ByteSizedCache(max_bytes=10)
+    cache.set('a', b'aaaaaaaa')
+    cache.set('a', b'aa')
+
+    assert cache.current_bytes == 2 and len(cache) == 1
+
+
+def test_hit_rate_and_clear():
+    cache = ByteSizedCache()
+    cache.set('a', b'1')
+    cache.get('a')
+    cache.get('missing')
+    assert cache.hit_rate == 0.5
+
+    cache.clear()
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+
+COMPLETION = json.dumps({
+    'destination': 'Kyoto, Japan',
+    'suggested_duration': 2,
+    'travel_type': 'Cultural',
+    'recommended_group_size': '2-4',
+    'itinerary': {
+        '1': ['Morning: Fushimi Inari', 'Afternoon: Gion', 'Evening: Pontocho'],
+        '2': ['Morning: Arashiyama', 'Afternoon: Kinkaku-ji', 'Evening: Nishiki Market'],
+    },
+})
+
+
+@pytest.fixture
+def parse():
+    from chat_advisor import parse_trip_suggestion, parsed_suggestion_cache
+    parsed_suggestion_cache.clear()
+    yield parse_trip_suggestion
+    parsed_suggestion_cache.clear()
+
+
+def test_parsed_suggestions_are_cached(parse):
+    from chat_advisor import parsed_suggestion_cache
+
+    first = parse(COMPLETION)
+    assert first[0]['travel_type'] == 'cultural'
+    assert parse(COMPLETION) == first
+    assert parsed_suggestion_cache.hits == 1
+
+
+def test_cached_suggestions_are_safe_to_mutate(parse):
+    first = parse(COMPLETION)
+    first[0]['destination'] = 'Changed'
+    first[0]['itinerary']['1'].append('Night: extra')
+    first.append({'destination': 'Injected'})
+
+    second = parse(COMPLETION)
+
+    assert len(second) == 1
+    assert second[0]['destination'] == 'Kyoto, Japan'
+    assert len(second[0]['itinerary']['1']) == 3
+    assert second is not first and second[0] is not first[0]
+
+
+def test_invalid_completion_stays_invalid(parse):
+    assert parse('not json at all') is None
+    assert parse('not json at all') is None
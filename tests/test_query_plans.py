@@ -0,0 +1,116 @@
+"""
+Query-plan regression tests for the trip listing queries: every query in
+trip_queries.py is EXPLAINed against a seeded database and fails on a full
+scan of trip or review. On Postgres (TEST_DATABASE_URL) sequential scans are
+disabled first, so a Seq Scan in the plan means no usable index exists.
+"""
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import app, db
+from models import Review, Trip, User
+from trip_queries import recommended_trips_query, shared_trips_query, trip_reviews_query, user_trips_query
+
+USERS = 200
+TRIPS = 5000
+TRAVEL_TYPES = ['adventure', 'relaxation', 'cultural', 'family', 'business']
+DESTINATIONS = ['Paris', 'Rome', 'Tokyo', 'Lisbon', 'Cusco', 'Nairobi', 'Reykjavik', 'Hanoi']
+FULL_SCAN = {
+    'sqlite': re.compile(r'^SCAN (trip|review)\b'),
+    'postgresql': re.compile(r'Seq Scan on (trip|review)\b'),
+}
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN ' if compiler.dialect.name == 'sqlite' else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def seed(users: int, trips: int) -> None:
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    db.session.execute(insert(User), [
+        {'username': f'plan-user-{i}', 'email': f'plan-user-{i}@example.com'} for i in range(users)])
+    user_ids = [row[0] for row in db.session.query(User.id).all()]
+    rows = []
+    for i in range(trips):
+        created = start + timedelta(minutes=rng.randrange(1_000_000))
+        rows.append({
+            'user_id': rng.choice(user_ids),
+            'destination': rng.choice(DESTINATIONS),
+            'num_days': rng.randint(1, 14),
+            'travel_type': rng.choice(TRAVEL_TYPES),
+            'num_people': rng.randint(1, 6),
+            'itinerary': {'1': [f"Visit {rng.choice(DESTINATIONS)} old town"]},
+            'shared_with': [str(rng.choice(user_ids))],
+            'created_at': created,
+            'updated_at': created,
+        })
+    db.session.execute(insert(Trip), rows)
+    trip_ids = [row[0] for row in db.session.query(Trip.id).all()]
+    db.session.execute(insert(Review), [{
+        'trip_id': rng.choice(trip_ids), 'user_id': rng.choice(user_ids), 'rating': rng.randint(1, 5),
+        'comment': 'Seeded review', 'created_at': start + timedelta(minutes=rng.randrange(1_000_000)),
+    } for _ in range(trips // 2)])
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def listing_queries(user_id: int, trip_id: int):
+    yield 'dashboard', user_trips_query(user_id)
+    yield 'dashboard oldest', user_trips_query(user_id, sort='oldest')
+    yield 'dashboard filtered', user_trips_query(user_id, travel_type='cultural', duration='4-7')
+    yield 'dashboard search', user_trips_query(user_id, search='Rome')
+    yield 'recommendations', recommended_trips_query(user_id, ('cultural', 'family'), 5)
+    yield 'trip reviews', trip_reviews_query(trip_id)
+    yield 'api trip list', Trip.query.filter_by(user_id=user_id)
+    if db.engine.dialect.name == 'postgresql':
+        # Substring fallback on other databases; only Postgres has the GIN index
+        yield 'shared trips', shared_trips_query(user_id)
+        yield 'shared trips search', shared_trips_query(user_id, search='old town')
+
+
+@pytest.fixture(scope='module')
+def seeded():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(USERS, TRIPS)
+        user_id = db.session.query(Trip.user_id).first()[0]
+        trip_id = db.session.query(Review.trip_id).first()[0]
+        yield user_id, trip_id
+        db.session.remove()
+
+
+def test_listing_queries_use_an_index(seeded):
+    user_id, trip_id = seeded
+    dialect = db.engine.dialect.name
+    if dialect not in FULL_SCAN:
+        pytest.skip(f"No plan check for {dialect}")
+    if dialect == 'postgresql':
+        db.session.execute(text('SET enable_seqscan = off'))
+
+    full_scans = {}
+    for name, query in listing_queries(user_id, trip_id):
+        plan = [row[-1] for row in db.session.execute(Explain(query.statement))]
+        scans = [line for line in plan if FULL_SCAN[dialect].search(line.strip())]
+        if scans:
+            full_scans[name] = plan
+    db.session.rollback()
+
+    assert not full_scans, f"Listing queries with a full scan: {full_scans}"
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from utils.cache import ResponseCache, SingleFlight, canonical_hash
+from utils.shared_store import InMemoryStore
+
+CALLERS = 8
+
+
+def _run_concurrently(fn, callers: int = CALLERS):
+    """Call fn from several threads released at once; returns results and errors in thread order."""
+    start = threading.Barrier(callers)
+    results, errors = [None] * callers, [None] * callers
+
+    def worker(i):
+        start.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def _slow_upstream(calls, answer='Take the night train.', error=None):
+    lock = threading.Lock()
+
+    def compute():
+        with lock:
+            calls.append(1)
+        # Long enough for every other caller to join the flight
+        time.sleep(0.2)
+        if error is not None:
+            raise error
+        return answer
+    return compute
+
+
+def test_concurrent_identical_calls_make_one_upstream_call():
+    cache, calls = ResponseCache(), []
+    compute = _slow_upstream(calls)
+
+    results, errors = _run_concurrently(lambda: cache.get_or_compute('key', compute))
+
+    assert len(calls) == 1
+    assert results == ['Take the night train.'] * CALLERS
+    assert errors == [None] * CALLERS
+    assert cache.get_or_compute('key', compute) == 'Take the night train.'
+    assert len(calls) == 1
+
+
+def test_different_keys_are_computed_separately():
+    cache, calls = ResponseCache(), []
+    compute = _slow_upstream(calls)
+    counter = iter(range(CALLERS))
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            key = f"key-{next(counter)}"
+        return cache.get_or_compute(key, compute)
+
+    _run_concurrently(call)
+    assert len(calls) == CALLERS
+
+
+def test_upstream_error_reaches_every_waiter_and_is_not_cached():
+    cache, calls = ResponseCache(), []
+    compute = _slow_upstream(calls, error=RuntimeError("rate limited"))
+
+    results, errors = _run_concurrently(lambda: cache.get_or_compute('key', compute))
+
+    assert len(calls) == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert cache.get_or_compute('key', lambda: 'recovered') == 'recovered'
+
+
+def test_empty_result_is_not_cached():
+    cache = ResponseCache()
+    assert cache.get_or_compute('key', lambda: '') == ''
+    assert cache.get('key') is None
+
+
+def test_single_flight_forgets_finished_calls():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+
+
+def test_shared_store_serves_other_workers():
+    store = InMemoryStore()
+    ResponseCache(shared_store=store).set('key', 'cached answer')
+
+    other_worker = ResponseCache(shared_store=store)
+    assert other_worker.get_or_compute('key', pytest.fail) == 'cached answer'
+
+    other_worker.delete('key')
+    assert ResponseCache(shared_store=store).get('key') is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = ResponseCache(ttl=60)
+    cache.set('key', 'answer')
+
+    now[0] += 61
+    assert cache.get('key') is None
+
+
+def test_canonical_hash_ignores_key_order():
+    assert canonical_hash({'a': 1, 'b': [1, 2]}) == canonical_hash({'b': [1, 2], 'a': 1})
+    assert canonical_hash({'a': 1}) != canonical_hash({'a': 2})
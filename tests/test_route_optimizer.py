@@ -0,0 +1,119 @@
+import numpy as np
+
+from app import db
+from models import Trip
+from route_optimizer import (CachedGeocoder, LocalGeocoder, build_route_data, haversine_matrix, optimize_day,
+                             optimize_order, parse_activity, path_length, place_name, relabel)
+
+PARIS_DAY = ['Morning: Visit the Louvre', 'Afternoon: Explore Montmartre', 'Evening: Stroll through Le Marais']
+
+
+def _coords(activities, destination):
+    geocoder = LocalGeocoder()
+    places = [place_name(parse_activity(activity)[1]) for activity in activities]
+    return {place: geocoder.geocode(place, destination) for place in places}
+
+
+def _line(*km):
+    """Points on the equator at the given distances (km) from the origin."""
+    lon = np.degrees(np.asarray(km, dtype=float) / 6371.0088)
+    return haversine_matrix(np.zeros(len(km)), lon)
+
+
+def test_parse_activity_and_place_name():
+    assert parse_activity('Morning: Visit the Louvre') == ('morning', 'Visit the Louvre')
+    assert parse_activity('Free time') == (None, 'Free time')
+    assert place_name('Stroll through Le Marais') == 'Le Marais'
+
+
+def test_local_geocoder_is_deterministic_and_near_the_destination():
+    first = LocalGeocoder().geocode('the Louvre', 'Paris, France')
+    assert first == LocalGeocoder().geocode('the Louvre', 'Paris, France')
+    other = LocalGeocoder().geocode('Montmartre', 'Paris, France')
+    assert abs(first[0] - other[0]) < 0.1 and abs(first[1] - other[1]) < 0.1
+
+
+def test_one_stop_per_part_of_the_day_is_reordered():
+    route = optimize_day(PARIS_DAY, _coords(PARIS_DAY, 'Paris, France'))
+
+    assert route['order'] != [0, 1, 2]
+    assert route['distance_km'] < route['original_distance_km']
+    # The day keeps its morning, afternoon and evening; the places move between them
+    assert [parse_activity(a)[0] for a in route['activities']] == ['morning', 'afternoon', 'evening']
+    assert sorted(parse_activity(a)[1] for a in route['activities']) == \
+        sorted(parse_activity(a)[1] for a in PARIS_DAY)
+    assert [stop['slot'] for stop in route['stops']] == ['morning', 'afternoon', 'evening']
+
+
+def test_stops_move_at_most_one_part_of_the_day():
+    # Visiting 2, 1, 0 would be as short as 0, 1, 2 but needs the evening stop in the morning
+    dist = _line(0, 10, 1)
+    assert optimize_order([0, 1, 2], dist) == [0, 2, 1]
+    for order in (optimize_order([0, 1, 2], _line(a, b, c)) for a, b, c in [(5, 0, 9), (9, 0, 5), (0, 9, 5)]):
+        assert order[0] != 2 and order[2] != 0
+
+
+def test_meals_keep_their_part_of_the_day():
+    # Without the meal at the end, 0, 2, 1 would be shortest
+    assert optimize_order([0, 1, 2], _line(0, 10, 1), fixed=[False, False, True]) == [1, 0, 2]
+
+    day = ['Morning: Visit the Louvre', 'Afternoon: Explore Montmartre', 'Evening: Dinner at Le Marais']
+    route = optimize_day(day, _coords(day, 'Paris, France'))
+    assert route['activities'][2] == 'Evening: Dinner at Le Marais'
+
+
+def test_original_order_wins_ties():
+    assert optimize_order([0, 1, 2], _line(0, 1, 2)) == [0, 1, 2]
+
+
+def test_optimized_order_is_never_longer():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        dist = haversine_matrix(rng.uniform(48.8, 48.9, 6), rng.uniform(2.2, 2.4, 6))
+        ranks = [0, 0, 1, 1, 2, 2]
+        assert path_length(optimize_order(ranks, dist), dist) <= path_length(list(range(6)), dist) + 1e-9
+
+
+def test_long_days_are_reordered_within_each_part():
+    rng = np.random.default_rng(3)
+    ranks = [0] * 4 + [1] * 4 + [2] * 4
+    dist = haversine_matrix(rng.uniform(48.8, 48.9, 12), rng.uniform(2.2, 2.4, 12))
+    order = optimize_order(ranks, dist)
+    assert sorted(order) == list(range(12))
+    assert [ranks[stop] for stop in order] == ranks
+
+
+def test_unlocated_stops_stay_in_place():
+    day = PARIS_DAY + ['Evening: Nowhere to be found']
+    coords = _coords(PARIS_DAY, 'Paris, France')
+    coords['Nowhere to be found'] = None
+
+    route = optimize_day(day, coords)
+    assert route['order'][3] == 3
+    assert route['stops'][3]['lat'] is None
+
+
+def test_relabel():
+    assert relabel('Evening: Explore Montmartre', 'Afternoon: Visit the Louvre') == 'Afternoon: Explore Montmartre'
+    assert relabel('Explore Montmartre', 'Free time') == 'Explore Montmartre'
+
+
+def test_build_route_data_caches_geocodes(app_context, user):
+    trip = Trip(user_id=user.id, destination='Paris, France', num_days=1, travel_type='cultural', num_people=2,
+                itinerary={'1': PARIS_DAY})
+    db.session.add(trip)
+    db.session.commit()
+
+    calls = []
+
+    class CountingGeocoder(LocalGeocoder):
+        def geocode(self, place, destination):
+            calls.append(place)
+            return super().geocode(place, destination)
+
+    route_data = build_route_data(trip, CachedGeocoder(CountingGeocoder()))
+    assert route_data['days']['1']['distance_km'] < route_data['days']['1']['original_distance_km']
+    assert len(calls) == 3
+
+    build_route_data(trip, CachedGeocoder(CountingGeocoder()))
+    assert len(calls) == 3
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from utils import semantic_cache
+from utils.semantic_cache import HashingEmbedder, SemanticCache, normalize_message
+
+QUESTION = "What is the best time of year to visit Kyoto?"
+ANSWER = "Spring and autumn."
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(HashingEmbedder(), ttl=60)
+
+
+def _store(cache: SemanticCache, message: str, answer: str, partition: str = 'p') -> None:
+    value, vector = cache.lookup(message, partition)
+    assert value is None
+    cache.put(partition, vector, answer)
+
+
+def test_normalize_message_ignores_case_punctuation_and_spacing():
+    assert normalize_message("  What's   the BEST time?! ") == "what s the best time"
+
+
+def test_trivial_variant_hits(cache):
+    _store(cache, QUESTION, ANSWER)
+    assert cache.lookup("what is the best time of year to visit kyoto", 'p')[0] == ANSWER
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_unrelated_question_misses(cache):
+    _store(cache, QUESTION, ANSWER)
+    assert cache.lookup("Which vaccines do I need for Kenya?", 'p')[0] is None
+
+
+def test_similarity_below_threshold_misses():
+    embedder = HashingEmbedder()
+    near = "What is the best time of year to visit Kyoto Japan?"
+    score = float(embedder.embed(normalize_message(QUESTION)) @ embedder.embed(normalize_message(near)))
+    assert 0 < score < 1
+
+    strict = SemanticCache(embedder, threshold=score + 0.01)
+    _store(strict, QUESTION, ANSWER)
+    assert strict.lookup(near, 'p')[0] is None
+
+    lenient = SemanticCache(embedder, threshold=score - 0.01)
+    _store(lenient, QUESTION, ANSWER)
+    assert lenient.lookup(near, 'p')[0] == ANSWER
+
+
+def test_threshold_defaults_to_the_embedder(cache):
+    assert cache.threshold == HashingEmbedder.default_threshold
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, 'time', lambda: now[0])
+    _store(cache, QUESTION, ANSWER)
+
+    now[0] += 59
+    assert cache.lookup(QUESTION, 'p')[0] == ANSWER
+    now[0] += 2
+    assert cache.lookup(QUESTION, 'p')[0] is None
+
+
+def test_answers_do_not_cross_partitions(cache):
+    first = SemanticCache.partition_key('system prompt', 'user 1')
+    second = SemanticCache.partition_key('system prompt', 'user 2')
+    assert first != second
+
+    _store(cache, QUESTION, ANSWER, first)
+    assert cache.lookup(QUESTION, second)[0] is None
+    assert cache.lookup(QUESTION, first)[0] == ANSWER
+
+
+def test_oldest_partition_is_dropped_at_the_limit():
+    cache = SemanticCache(HashingEmbedder(), max_partitions=2)
+    for partition in ('a', 'b', 'c'):
+        _store(cache, QUESTION, partition, partition)
+
+    assert cache.lookup(QUESTION, 'a')[0] is None
+    assert cache.lookup(QUESTION, 'b')[0] == 'b'
+    assert cache.lookup(QUESTION, 'c')[0] == 'c'
+
+
+def test_ring_buffer_overwrites_oldest_entry():
+    cache = SemanticCache(HashingEmbedder(), max_entries=2)
+    questions = ["Best beaches in Portugal", "Cheap hostels in Berlin", "Night trains from Vienna"]
+    for question in questions:
+        _store(cache, question, question)
+
+    assert cache.lookup(questions[0], 'p')[0] is None
+    assert [cache.lookup(q, 'p')[0] for q in questions[1:]] == questions[1:]
+
+
+def test_failing_embedder_bypasses_the_cache():
+    class Broken:
+        default_threshold = 0.9
+
+        def embed(self, text):
+            raise RuntimeError("embeddings API down")
+
+    cache = SemanticCache(Broken())
+    assert cache.lookup(QUESTION, 'p') == (None, None)
+    cache.put('p', None, ANSWER)
+    assert cache.hits == 0
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    vector = HashingEmbedder().embed(QUESTION)
+    assert np.allclose(vector, HashingEmbedder().embed(QUESTION))
+    assert np.isclose(np.linalg.norm(vector), 1.0)
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import ArchivedTrip, Trip
+from trip_sync import changes_since, encode_cursor, trip_list_version
+
+
+def _trip(user, **fields) -> Trip:
+    trip = Trip(user_id=user.id, destination='Lisbon', num_days=2, travel_type='cultural', num_people=2,
+                itinerary={'1': ['Morning: Belem Tower'], '2': ['Evening: Fado in Alfama']}, **fields)
+    db.session.add(trip)
+    db.session.commit()
+    return trip
+
+
+def _age(trip: Trip, hours: int = 1) -> None:
+    """Move the trip's creation and last change back in time, out of the sync overlap window."""
+    moment = datetime.utcnow() - timedelta(hours=hours)
+    db.session.execute(Trip.__table__.update().where(Trip.id == trip.id)
+                       .values(created_at=moment, updated_at=moment))
+    db.session.commit()
+    db.session.expire_all()
+
+
+def test_background_writes_are_not_client_changes(user):
+    trip = _trip(user)
+    _age(trip)
+    cursor = encode_cursor(datetime.utcnow())
+    etag, last_modified = trip_list_version(user.id)
+
+    trip.weather_data = {'forecast': [{'temp': 21}]}
+    trip.route_data = {'days': {}}
+    db.session.commit()
+
+    assert trip_list_version(user.id) == (etag, last_modified)
+    changes = changes_since(user.id, cursor)
+    assert changes['created'] == [] and changes['updated'] == []
+
+
+def test_client_visible_change_is_synced(user):
+    trip = _trip(user)
+    _age(trip)
+    cursor = encode_cursor(datetime.utcnow())
+    etag, _ = trip_list_version(user.id)
+
+    trip.itinerary = {'1': ['Morning: Tram 28'], '2': ['Evening: Fado in Alfama']}
+    db.session.commit()
+
+    assert trip_list_version(user.id)[0] != etag
+    assert [t['id'] for t in changes_since(user.id, cursor)['updated']] == [trip.id]
+
+
+def test_archived_trip_change_moves_list_etag(user):
+    old = datetime.utcnow() - timedelta(days=400)
+    db.session.add(ArchivedTrip(id=99, user_id=user.id, destination='Rome', num_days=3, travel_type='cultural',
+                                num_people=2, created_at=old, updated_at=old, payload=b''))
+    db.session.commit()
+    etag, _ = trip_list_version(user.id)
+
+    # Restored and archived again: same counts, later modification time
+    db.session.get(ArchivedTrip, 99).updated_at = old + timedelta(days=1)
+    db.session.commit()
+
+    assert trip_list_version(user.id)[0] != etag
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from utils.upstream_governor import (CircuitBreaker, CircuitOpenError, UpstreamGovernor,
+                                     UpstreamThrottledError)
+
+
+def _half_open_governor(**kwargs) -> UpstreamGovernor:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == 'half_open'
+    return UpstreamGovernor(breaker=breaker, acquire_timeout=0.05, **kwargs)
+
+
+def test_throttled_probe_releases_half_open_circuit():
+    governor = _half_open_governor()
+    # A Retry-After longer than acquire_timeout: the probe never reaches the provider
+    governor._blocked_until = time.monotonic() + 60
+    with pytest.raises(UpstreamThrottledError):
+        governor.call(lambda: 'unused')
+
+    assert governor.breaker.state == 'half_open'
+    assert governor.breaker._probe_in_flight is False
+    governor._blocked_until = 0.0
+    assert governor.call(lambda: 'ok') == 'ok'
+    assert governor.breaker.state == 'closed'
+
+
+def test_probe_without_free_slot_releases_half_open_circuit():
+    governor = _half_open_governor(max_concurrency=1)
+    governor._semaphore.acquire()
+    with pytest.raises(UpstreamThrottledError):
+        governor.call(lambda: 'unused')
+
+    governor._semaphore.release()
+    assert governor.call(lambda: 'ok') == 'ok'
+
+
+def test_only_one_probe_while_half_open():
+    governor = _half_open_governor()
+    assert governor.breaker.allow()
+    # Another thread's release does not hand out a second probe
+    governor.breaker._probe_thread = -1
+    governor.breaker.release_probe()
+    with pytest.raises(CircuitOpenError):
+        governor.call(lambda: 'ok')
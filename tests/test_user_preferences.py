@@ -0,0 +1,48 @@
+import pytest
+
+import user_preferences
+from app import db
+from models import UserPreference
+from user_preferences import get_preferences, invalidate_preferences
+from utils.shared_store import InMemoryStore
+
+
+def _save(user, length: int) -> None:
+    """Write preferences directly, as another worker handling the user's POST would."""
+    pref = UserPreference.query.filter_by(user_id=user.id).first() or UserPreference(user_id=user.id)
+    pref.preferred_trip_length = length
+    db.session.add(pref)
+    db.session.commit()
+
+
+@pytest.fixture
+def shared_store(monkeypatch):
+    store = InMemoryStore()
+    monkeypatch.setattr(user_preferences, 'get_shared_store', lambda: store)
+    return store
+
+
+def test_without_shared_store_changes_from_other_workers_are_seen(app_context, user, monkeypatch):
+    monkeypatch.setattr(user_preferences, 'get_shared_store', lambda: None)
+    assert get_preferences(user.id) is None
+
+    _save(user, 5)
+    assert get_preferences(user.id).trip_length == 5
+    _save(user, 7)
+    assert get_preferences(user.id).trip_length == 7
+
+
+def test_shared_store_caches_until_invalidated(app_context, user, shared_store):
+    _save(user, 5)
+    assert get_preferences(user.id).trip_length == 5
+
+    _save(user, 7)
+    assert get_preferences(user.id).trip_length == 5
+    invalidate_preferences(user.id)
+    assert get_preferences(user.id).trip_length == 7
+
+
+def test_missing_preferences_are_cached(app_context, user, shared_store):
+    assert get_preferences(user.id) is None
+    assert shared_store.get(f"preferences:{user.id}") == 'none'
+    assert get_preferences(user.id) is None
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from utils.shared_store import InMemoryStore
+from utils.user_quota import SlidingWindowLimiter, UserQuota
+
+
+class SlowStore(InMemoryStore):
+    """Shared store with network-like latency, so concurrent requests interleave."""
+
+    def get(self, key):
+        time.sleep(0.01)
+        return super().get(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        time.sleep(0.01)
+        return super().incr(key, amount, ttl)
+
+
+def _quota(store, requests_per_window=5):
+    return UserQuota(requests_per_window=requests_per_window, request_window=60,
+                     tokens_per_window=1000, token_window=3600, store=store)
+
+
+def test_concurrent_requests_across_workers_stay_within_the_quota():
+    store = SlowStore()
+    # One quota object per worker process, sharing the store
+    workers = [_quota(store) for _ in range(20)]
+    start = threading.Barrier(len(workers))
+    waits = [None] * len(workers)
+
+    def request(i):
+        start.wait()
+        waits[i] = workers[i].acquire(user_id=1)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    allowed = sum(1 for wait in waits if wait == 0)
+    assert allowed == 5
+    assert workers[0].requests.usage(1) == allowed
+
+
+def test_rejected_request_is_not_counted_and_gets_retry_after():
+    quota = _quota(InMemoryStore(), requests_per_window=2)
+    assert quota.acquire(1) == 0
+    assert quota.acquire(1) == 0
+
+    wait = quota.acquire(1)
+    assert 0 < wait <= 120
+    assert quota.requests.usage(1) == 2
+    assert quota.acquire(2) == 0
+
+
+def test_token_quota_blocks_without_counting_a_request():
+    quota = _quota(InMemoryStore())
+    quota.record_tokens(1, 1001)
+
+    assert quota.acquire(1) > 0
+    assert quota.requests.usage(1) == 0
+
+
+def test_sliding_window_weights_the_previous_window():
+    limiter = SlidingWindowLimiter('req', 10, 60, InMemoryStore())
+    limiter.add(1, 10, now=30)
+
+    assert limiter.try_add(1, 1, now=61) > 0
+    # Halfway through the next window half of the previous count still applies
+    assert limiter.usage(1, now=90) == 5
+    assert limiter.try_add(1, 5, now=90) == 0
+    assert limiter.try_add(1, 1, now=90) > 0
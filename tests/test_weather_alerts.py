@@ -0,0 +1,57 @@
+from weather_alerts import SLOT_SECONDS, AlertIndex, WeatherAlertService, classify_severity
+
+HOUR = 3600
+
+
+def _alert(event, start, end):
+    return {'event': event, 'description': '', 'sender': '', 'start': start, 'end': end, 'severity': 'Mild'}
+
+
+def _day(*slot_starts):
+    return {'hourly': [{'dt': dt} for dt in slot_starts]}
+
+
+def test_alert_starting_mid_slot_is_attached_to_the_slot():
+    storm = _alert('Storm warning', 4 * HOUR, 5 * HOUR)
+    days = WeatherAlertService.attach_alerts([_day(0, 3 * HOUR, 6 * HOUR)], [storm])
+
+    assert [slot['alerts'] for slot in days[0]['hourly']] == [[], ['Storm warning'], []]
+    assert days[0]['alerts'] == [storm]
+
+
+def test_slot_is_half_open():
+    at_next_slot = _alert('Fog advisory', 3 * HOUR, 4 * HOUR)
+    days = WeatherAlertService.attach_alerts([_day(0, 3 * HOUR)], [at_next_slot])
+
+    assert [slot['alerts'] for slot in days[0]['hourly']] == [[], ['Fog advisory']]
+
+
+def test_alert_spanning_several_slots():
+    heat = _alert('Heat advisory', HOUR, 7 * HOUR)
+    days = WeatherAlertService.attach_alerts([_day(0, 3 * HOUR, 6 * HOUR, 9 * HOUR)], [heat])
+
+    assert [slot['alerts'] for slot in days[0]['hourly']] == [['Heat advisory']] * 3 + [[]]
+
+
+def test_no_alerts():
+    days = WeatherAlertService.attach_alerts([_day(0, 3 * HOUR)], [])
+    assert days[0]['alerts'] == [] and all(slot['alerts'] == [] for slot in days[0]['hourly'])
+
+
+def test_active_during_matches_a_linear_scan():
+    alerts = [_alert(f"a{i}", start, start + length)
+              for i, (start, length) in enumerate([(0, 5), (2, 1), (4, 10), (7, 0), (9, 3), (15, 2)])]
+    index = AlertIndex(alerts)
+    for start in range(-2, 20):
+        expected = [a for a in alerts if a['start'] < start + SLOT_SECONDS and a['end'] >= start]
+        assert sorted(a['event'] for a in index.active_during(start, start + SLOT_SECONDS)) == \
+            sorted(a['event'] for a in expected)
+        short = [a for a in alerts if a['start'] < start + 2 and a['end'] >= start]
+        assert sorted(a['event'] for a in index.active_during(start, start + 2)) == \
+            sorted(a['event'] for a in short)
+
+
+def test_classify_severity():
+    assert classify_severity('Tornado Warning', '') == 'Severe'
+    assert classify_severity('Flood Watch', 'moderate flooding') == 'Moderate'
+    assert classify_severity('Special statement', 'light rain') == 'Mild'
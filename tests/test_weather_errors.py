@@ -0,0 +1,51 @@
+import pytest
+import requests
+
+from weather import LocationNotFoundError, WeatherAPI, error_status
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize('error, status', [
+    (LocationNotFoundError('Invalid location: Atlantis'), 404),
+    (requests.exceptions.JSONDecodeError('Expecting value', '<html>', 0), 502),
+    (ValueError('Unexpected error: boom'), 502),
+    (KeyError('coord'), 502),
+    (requests.ConnectionError('connection reset'), 502),
+    (_http_error(500), 502),
+    (_http_error(401), 503),
+    (_http_error(403), 503),
+    (_http_error(429), 503),
+])
+def test_error_status(error, status):
+    assert error_status(error) == status
+
+
+@pytest.fixture
+def weather_api():
+    return WeatherAPI()
+
+
+def test_batch_reports_unknown_location_as_404(weather_api, monkeypatch):
+    monkeypatch.setattr(weather_api, 'validate_location', lambda location: None)
+    [result] = weather_api.get_weather_batch([{'location': 'Atlantis'}], include_alerts=False)
+    assert result['status'] == 404
+
+
+def test_batch_reports_malformed_upstream_response_as_502(weather_api, monkeypatch):
+    def malformed(location):
+        raise requests.exceptions.JSONDecodeError('Expecting value', '<html>', 0)
+
+    monkeypatch.setattr(weather_api, 'validate_location', malformed)
+    [result] = weather_api.get_weather_batch([{'location': 'Lisbon'}], include_alerts=False)
+    assert result['status'] == 502
+
+
+def test_get_weather_data_keeps_location_not_found(weather_api, monkeypatch):
+    monkeypatch.setattr(weather_api, 'validate_location', lambda location: None)
+    with pytest.raises(LocationNotFoundError):
+        weather_api.get_weather_data('Atlantis', include_alerts=False)
@@ -0,0 +1,214 @@
+import os
+import zlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import click
+from flask import abort
+from sqlalchemy import String, cast, delete, or_
+from sqlalchemy.orm import undefer
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import ArchivedTrip, Review, Trip, TripTemplate, User
+from utils import fast_json
+from utils.db_routing import primary_scope
+
+logger = logging.getLogger(__name__)
+
+# Trips not modified for this long leave the live table
+ARCHIVE_AFTER = timedelta(days=int(os.environ.get('TRIP_ARCHIVE_AFTER_DAYS', 365)))
+ARCHIVE_BATCH_SIZE = 200
+
+
+def _isoformat(moment: Optional[datetime]) -> Optional[str]:
+    return moment.isoformat() if moment else None
+
+
+def _parse(moment: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(moment) if moment else None
+
+
+def pack_trip(trip: Trip, reviews: List[Review]) -> bytes:
+    """The trip's document columns and reviews as compressed JSON."""
+    return zlib.compress(fast_json.dumps_bytes({
+        'itinerary': trip.itinerary,
+        'shared_with': trip.shared_with,
+        'weather_data': trip.weather_data,
+        'route_data': trip.route_data,
+        'template_id': trip.template_id,
+        'version': trip.version,
+        'reviews': [{
+            'id': review.id,
+            'user_id': review.user_id,
+            'rating': review.rating,
+            'comment': review.comment,
+            'photo_path': review.photo_path,
+            'created_at': _isoformat(review.created_at)
+        } for review in reviews]
+    }), 6)
+
+
+def unpack_trip(archived: ArchivedTrip) -> Dict:
+    """An archived trip in the shape of Trip.to_dict(), without restoring it."""
+    data = fast_json.loads(zlib.decompress(archived.payload))
+    return {
+        'id': archived.id,
+        'destination': archived.destination,
+        'num_days': archived.num_days,
+        'travel_type': archived.travel_type,
+        'num_people': archived.num_people,
+        'itinerary': data.get('itinerary') or {},
+        'shared_with': data.get('shared_with') or [],
+        'version': data.get('version', 1),
+        'updated_at': _isoformat(archived.updated_at)
+    }
+
+
+def archive_trips(older_than: timedelta = ARCHIVE_AFTER, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move trips not updated for older_than, with their reviews, into the
+    archive. Rows are removed with bulk deletes, so no sync tombstones are
+    written: clients keep their copy, full syncs and the API's trip list
+    still include it, and the trip returns when opened. Trips shared with
+    other users or with a public link stay live, so shared lists and public
+    links keep working.
+    """
+    cutoff = datetime.utcnow() - older_than
+    archived = 0
+    while True:
+        trips = Trip.query.filter(
+            Trip.updated_at < cutoff,
+            Trip.public_token.is_(None),
+            or_(Trip.shared_with.is_(None), cast(Trip.shared_with, String).in_(('[]', 'null')))
+        ).order_by(Trip.id).limit(batch_size).all()
+        if not trips:
+            return archived
+        trip_ids = [trip.id for trip in trips]
+        reviews: Dict[int, List[Review]] = {}
+        for review in Review.query.filter(Review.trip_id.in_(trip_ids)).all():
+            reviews.setdefault(review.trip_id, []).append(review)
+
+        try:
+            db.session.add_all([ArchivedTrip(
+                id=trip.id,
+                user_id=trip.user_id,
+                destination=trip.destination,
+                num_days=trip.num_days,
+                travel_type=trip.travel_type,
+                num_people=trip.num_people,
+                created_at=trip.created_at,
+                updated_at=trip.updated_at,
+                payload=pack_trip(trip, reviews.get(trip.id, []))
+            ) for trip in trips])
+            db.session.execute(delete(Review).where(Review.trip_id.in_(trip_ids)),
+                               execution_options={'synchronize_session': False})
+            db.session.execute(delete(Trip).where(Trip.id.in_(trip_ids)),
+                               execution_options={'synchronize_session': False})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.expunge_all()
+        archived += len(trip_ids)
+        logger.info(f"Archived {archived} trips so far")
+
+
+def may_open(archived: ArchivedTrip, user_id: int, owner_only: bool = False) -> bool:
+    """Whether user_id may open the archived trip: its owner, or unless owner_only a user it is shared with."""
+    if archived.user_id == user_id:
+        return True
+    return not owner_only and str(user_id) in unpack_trip(archived)['shared_with']
+
+
+def restore_trip(trip_id: int, user_id: Optional[int] = None, owner_only: bool = False) -> Optional[Trip]:
+    """
+    Move an archived trip and its reviews back into the live tables. None if
+    it is not archived, or if user_id is given and may not open it; nothing
+    is written then.
+    """
+    archived = db.session.get(ArchivedTrip, trip_id)
+    if archived is None or (user_id is not None and not may_open(archived, user_id, owner_only)):
+        return None
+    data = fast_json.loads(zlib.decompress(archived.payload))
+
+    template_id = data.get('template_id')
+    if template_id and db.session.get(TripTemplate, template_id) is None:
+        template_id = None
+    review_data = data.get('reviews', [])
+    # Reviews of users deleted since archiving are dropped, as their live reviews would have been
+    reviewers = {user_id for (user_id,) in db.session.query(User.id).filter(
+        User.id.in_({review['user_id'] for review in review_data}))}
+
+    trip = Trip(
+        id=archived.id,
+        user_id=archived.user_id,
+        destination=archived.destination,
+        num_days=archived.num_days,
+        travel_type=archived.travel_type,
+        num_people=archived.num_people,
+        itinerary=data.get('itinerary') or {},
+        shared_with=data.get('shared_with') or [],
+        weather_data=data.get('weather_data'),
+        route_data=data.get('route_data'),
+        template_id=template_id,
+        created_at=archived.created_at,
+        # Opening counts as a touch, so the next archive run leaves it alone
+        updated_at=datetime.utcnow(),
+        version=data.get('version', 1) + 1
+    )
+    db.session.add(trip)
+    db.session.add_all([Review(
+        id=review['id'],
+        trip_id=trip.id,
+        user_id=review['user_id'],
+        rating=review['rating'],
+        comment=review['comment'],
+        photo_path=review['photo_path'],
+        created_at=_parse(review['created_at'])
+    ) for review in review_data if review['user_id'] in reviewers])
+    db.session.delete(archived)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request restored it first
+        db.session.rollback()
+        return db.session.get(Trip, trip_id)
+    logger.info(f"Restored archived trip {trip_id}")
+    return trip
+
+
+def trip_or_404(trip_id: int, user_id: int, owner_only: bool = False) -> Trip:
+    """
+    Trip.query.get_or_404 that transparently restores archived trips, but
+    only for users who may open them (see may_open). Live trips are returned
+    as before and callers check access themselves.
+    """
+    trip = db.session.get(Trip, trip_id)
+    if trip is None:
+        # Restoring writes, so the archive is read from the primary even in replica-read views
+        with primary_scope():
+            trip = db.session.get(Trip, trip_id) or restore_trip(trip_id, user_id, owner_only)
+    if trip is None:
+        abort(404)
+    return trip
+
+
+def archived_trips_query(user_id: int):
+    """A user's archived trips, newest first; the compressed payload is not loaded."""
+    return ArchivedTrip.query.filter_by(user_id=user_id).order_by(ArchivedTrip.created_at.desc())
+
+
+def archived_trip_dicts(user_id: int) -> List[Dict]:
+    """A user's archived trips in the shape of Trip.to_dict(), for listings that include them."""
+    return [unpack_trip(archived) for archived in
+            archived_trips_query(user_id).options(undefer(ArchivedTrip.payload))]
+
+
+@app.cli.command('archive-trips')
+@click.option('--days', type=int, default=ARCHIVE_AFTER.days, show_default=True,
+              help='Archive trips not updated for this many days')
+def archive_trips_command(days):
+    """Move old, untouched trips into the compressed archive (run daily from cron)."""
+    print(f"Archived {archive_trips(timedelta(days=days))} trips")
@@ -6,9 +6,29 @@ import logging
 from models import TripTemplate
 from app import db
 import random
+from utils.upstream_governor import (UpstreamError, estimate_tokens,
+                                     get_openai_governor)
+from utils.db_routing import replica_scope
+from utils.cache import canonical_hash
+from chat_advisor import extract_json_from_text, parse_trip_suggestion, response_cache, structured_output
+from utils.token_budget import TokenBudget
+from trip_prompts import build_trip_prompt, trip_units
+from utils.structured_output import (ACTIVITY_SCHEMA, DAY_SCHEMA, TRIP_SUGGESTION_SCHEMA,
+                                     TRIP_SUGGESTIONS_SCHEMA, format_kwargs)
 
 logger = logging.getLogger(__name__)
 
+SLOT_LABELS = ('Morning', 'Afternoon', 'Evening')
+# One day of three activities, versus 2000 for a whole itinerary
+DAY_MAX_TOKENS = 300
+CONTEXT_ACTIVITY_CHARS = 60
+
+# max_tokens of trip plans per day of each suggestion, learned from reported usage
+trip_token_budget = TokenBudget(
+    'trip_plan',
+    tokens_per_unit=float(os.environ.get('TRIP_TOKENS_PER_DAY', 80)),
+    max_tokens=int(os.environ.get('OPENAI_MAX_COMPLETION_TOKENS', 16384)))
+
 
 def initialize_openai_client():
     """Initialize OpenAI client with proper error handling."""
@@ -18,7 +38,8 @@ def initialize_openai_client():
         return None
 
     try:
-        return OpenAI(api_key=api_key)
+        # Retries are owned by the upstream governor, not the SDK
+        return OpenAI(api_key=api_key, max_retries=0)
     except Exception as e:
         logger.error(f"Failed to initialize OpenAI client: {str(e)}")
         return None
@@ -28,26 +49,28 @@ def get_fallback_template(destination: str, num_days: int,
                           travel_type: str) -> Optional[Dict]:
     """Get a suitable template based on parameters."""
     try:
-        # Try to find a template with exact match
-        template = TripTemplate.query.filter(
-            TripTemplate.travel_type == travel_type,
-            TripTemplate.num_days == num_days).first()
-
-        # If no exact match, try to find a template with similar duration
-        if not template:
+        # Templates are reference data, so a replica can serve them
+        with replica_scope():
+            # Try to find a template with exact match
             template = TripTemplate.query.filter(
-                TripTemplate.travel_type == travel_type, TripTemplate.num_days
-                <= num_days + 2, TripTemplate.num_days
-                >= max(1, num_days - 2)).first()
+                TripTemplate.travel_type == travel_type,
+                TripTemplate.num_days == num_days).first()
 
-        # If still no template, get any template with matching travel type
-        if not template:
-            template = TripTemplate.query.filter_by(
-                travel_type=travel_type).first()
+            # If no exact match, try to find a template with similar duration
+            if not template:
+                template = TripTemplate.query.filter(
+                    TripTemplate.travel_type == travel_type, TripTemplate.num_days
+                    <= num_days + 2, TripTemplate.num_days
+                    >= max(1, num_days - 2)).first()
 
-        # If no matching template at all, get any template
-        if not template:
-            template = TripTemplate.query.first()
+            # If still no template, get any template with matching travel type
+            if not template:
+                template = TripTemplate.query.filter_by(
+                    travel_type=travel_type).first()
+
+            # If no matching template at all, get any template
+            if not template:
+                template = TripTemplate.query.first()
 
         if not template:
             return None
@@ -122,68 +145,40 @@ def generate_trip_plan(destination: str,
         if not client:
             raise ValueError("OpenAI client initialization failed")
 
-        if alternatives:
-            prompt = f'''Create exactly 3 alternative trip suggestions similar to {destination}. For each alternative:
-1. Choose a different but related destination (nearby city, similar cultural experience, or comparable attraction type)
-2. Include a detailed {num_days}-day itinerary with specific locations
-3. Maintain the {travel_type} travel style but vary the experiences
-4. Accommodate {num_people} people
-
-Format each suggestion as valid JSON:
-{{
-    "destination": "City Name, Country",
-    "suggested_duration": {num_days},
-    "travel_type": "{travel_type}",
-    "recommended_group_size": "X-Y",
-    "itinerary": {{
-        "1": [
-            "Morning: [Specific activity/location]",
-            "Afternoon: [Specific activity/location]",
-            "Evening: [Specific activity/location]"
-        ],
-        ... (repeat for each day)
-    }}
-}}
-
-Return an array of exactly 3 alternatives.'''
-        else:
-            prompt = f'''Create a detailed {num_days}-day trip itinerary for {destination} for {num_people} people. Travel type: {travel_type}.
-
-Format as JSON with this exact structure:
-{{
-    "destination": "City Name, Country",
-    "suggested_duration": days,
-    "travel_type": "type",
-    "recommended_group_size": "X-Y",
-    "itinerary": {{
-        "1": [
-            "Morning: [Specific activity/location]",
-            "Afternoon: [Specific activity/location]",
-            "Evening: [Specific activity/location]"
-        ]
-    }}
-}}
-
-Rules:
-1. Always use valid JSON with proper quotes
-2. Each day must have exactly 3 activities (morning, afternoon, evening)
-3. Use real, mappable location names
-4. Travel type must be one of: cultural, adventure, relaxation, family, business
-5. Include specific venue/location names'''
+        # Sized to the plan: a 1-day trip needs a fraction of what 3 alternatives of 20 days do
+        units = trip_units(num_days, alternatives)
+        max_tokens = trip_token_budget.max_tokens(units)
 
         max_retries = 3
         last_error = None
-
-        for attempt in range(max_retries):
-            try:
-                response = client.chat.completions.create(
+        governor = get_openai_governor()
+        schema_name, schema = (("trip_suggestions", TRIP_SUGGESTIONS_SCHEMA) if alternatives
+                               else ("trip_suggestion", TRIP_SUGGESTION_SCHEMA))
+
+        def call(response_format: Optional[Dict]):
+            # Transport errors and throttling are retried inside the governor
+            content = build_trip_prompt(destination, num_days, travel_type, num_people, alternatives,
+                                        wrapped=bool(response_format))
+            return governor.call(
+                lambda: client.chat.completions.create(
                     model="gpt-4o",  # Fixed model name
                     messages=[{
                         "role": "user",
-                        "content": prompt
+                        "content": content
                     }],
                     temperature=0.7,
-                    max_tokens=2000)
+                    max_tokens=max_tokens,
+                    **format_kwargs(response_format)),
+                estimated_tokens=estimate_tokens(content, max_tokens))
+
+        for attempt in range(max_retries):
+            try:
+                # This loop only retries responses that could not be used
+                response, structured = structured_output.create(call, "gpt-4o", schema_name, schema)
+                trip_token_budget.record(units, response, max_tokens)
+                if response and response.choices and getattr(response.choices[0], 'finish_reason', None) == 'length':
+                    # Retrying with the same budget would be cut off again
+                    max_tokens = min(trip_token_budget.max_tokens_limit, max_tokens * 2)
 
                 if not response or not response.choices:
                     raise ValueError("No response generated")
@@ -192,6 +187,17 @@ Rules:
                 if not content:
                     raise ValueError("Empty response from API")
 
+                if structured:
+                    # Parsed and validated in one pass; no markdown to dig through
+                    data = parse_trip_suggestion(content) or []
+                    usable = len(data) >= (3 if alternatives else 1)
+                    structured_output.record(True, usable)
+                    if not usable:
+                        last_error = f"Structured response had {len(data)} valid suggestions"
+                        logger.warning(last_error)
+                        continue
+                    return data if alternatives else data[:1]
+
                 try:
                     data = json.loads(content)
                     # Validate and normalize the response
@@ -199,20 +205,29 @@ Rules:
                         if not isinstance(data, list):
                             data = [data]
                         if len(data) < 3:
+                            structured_output.record(False, False)
                             logger.warning(
                                 f"Got {len(data)} suggestions, expected 3")
                             continue
+                        structured_output.record(False, True)
                         return data[:
                                     3]  # Ensure we return exactly 3 alternatives
+                    structured_output.record(False, True)
                     return [data]  # Return single suggestion as a list
 
                 except json.JSONDecodeError as e:
+                    structured_output.record(False, False)
                     last_error = f"Invalid JSON response: {str(e)}"
                     logger.warning(last_error)
                     if attempt < max_retries - 1:  # Only continue if we have more retries
                         continue
                     raise ValueError(last_error)
 
+            except UpstreamError as e:
+                # Upstream is throttled or down: go straight to the template fallback
+                last_error = str(e)
+                logger.warning(f"Skipping AI generation: {last_error}")
+                break
             except Exception as e:
                 last_error = str(e)
                 logger.warning(
@@ -259,3 +274,106 @@ Rules:
                 ]
             }
         }]
+
+
+def _day_order(day: str):
+    return (0, int(day)) if day.isdigit() else (1, day)
+
+
+def _compact_day(activities: List[str]) -> str:
+    """Activities without their time-of-day prefix, shortened: enough context, few tokens."""
+    return '; '.join(str(activity).split(': ', 1)[-1][:CONTEXT_ACTIVITY_CHARS] for activity in activities)
+
+
+def regenerate_day(destination: str, travel_type: str, num_people: int, itinerary: Dict, day: str,
+                   slot: Optional[int] = None, instructions: str = '') -> List[str]:
+    """
+    New activities for one day of an itinerary, or for one slot of it when
+    slot is given, planned around the other days. Returns the whole day.
+    Raises UpstreamError when the AI is unavailable and ValueError when it
+    returned nothing usable.
+    """
+    current = list(itinerary.get(day) or [])
+    other_days = '\n'.join(f"Day {other}: {_compact_day(itinerary[other])}"
+                           for other in sorted(itinerary, key=_day_order) if other != day)
+    if slot is None:
+        task = f"Plan day {day} again with 3 new activities: morning, afternoon and evening."
+        shape = '{"activities": ["Morning: ...", "Afternoon: ...", "Evening: ..."]}'
+    else:
+        if not 0 <= slot < len(current):
+            raise ValueError(f"Day {day} has no activity {slot}")
+        keep = [activity for i, activity in enumerate(current) if i != slot]
+        task = (f"Replace only this activity of day {day}: {current[slot]}. "
+                f"It must fit with the rest of the day: {_compact_day(keep)}.")
+        shape = f'{{"activity": "{SLOT_LABELS[slot] if slot < len(SLOT_LABELS) else "Activity"}: ..."}}'
+
+    prompt = f"""Trip to {destination}, {travel_type} travel, {num_people} people.
+Other days (do not repeat these places):
+{other_days or 'none'}
+Current day {day}: {_compact_day(current) or 'empty'}
+{task}"""
+    if instructions:
+        prompt += f"\nTraveller's request: {instructions[:300]}"
+    prompt += f"\nUse real, mappable venue names. Reply with JSON only: {shape}"
+
+    messages = [{"role": "user", "content": prompt}]
+    params = {"model": "gpt-4o", "temperature": 0.7, "max_tokens": DAY_MAX_TOKENS}
+    cache_key = canonical_hash({"messages": messages, "params": params, "structured": structured_output.mode})
+    schema_name, schema = ("itinerary_day", DAY_SCHEMA) if slot is None else ("itinerary_activity", ACTIVITY_SCHEMA)
+    # Whether a fresh completion was structured; None when it came from the cache
+    structured = None
+
+    def complete() -> str:
+        nonlocal structured
+        client = initialize_openai_client()
+        if not client:
+            raise ValueError("OpenAI client initialization failed")
+        response, structured = structured_output.create(
+            lambda response_format: get_openai_governor().call(
+                lambda: client.chat.completions.create(messages=messages, **params,
+                                                       **format_kwargs(response_format)),
+                estimated_tokens=estimate_tokens(prompt, DAY_MAX_TOKENS)),
+            params["model"], schema_name, schema)
+        if not response or not response.choices or not response.choices[0].message.content:
+            raise ValueError("Empty response from API")
+        return response.choices[0].message.content
+
+    # A retried or double-submitted edit reuses the first completion
+    content = response_cache.get_or_compute(cache_key, complete)
+    try:
+        try:
+            # Structured output is bare JSON; free text may wrap it in markdown
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            data = json.loads(extract_json_from_text(content))
+        if slot is None:
+            activities = [a.strip() for a in data["activities"] if isinstance(a, str) and a.strip()][:3]
+            if len(activities) < 3:
+                raise ValueError("Expected 3 activities")
+            result = activities
+        else:
+            activity = data["activity"]
+            if not isinstance(activity, str) or not activity.strip():
+                raise ValueError("Expected an activity")
+            current[slot] = activity.strip()
+            result = current
+        if structured is not None:
+            structured_output.record(structured, True)
+        return result
+    except (ValueError, KeyError, TypeError) as e:
+        if structured is not None:
+            structured_output.record(structured, False)
+        # Do not keep serving a completion that cannot be used
+        response_cache.delete(cache_key)
+        logger.warning(f"Unusable day regeneration for {destination} day {day}: {str(e)}")
+        raise ValueError("Could not generate new activities, please try again")
+
+
+def regenerate_trip_day(trip, day: str, slot: Optional[int] = None, instructions: str = '') -> Dict:
+    """The trip's itinerary with one day (or one slot of it) regenerated; the trip itself is not modified."""
+    itinerary = trip.itinerary or {}
+    if day not in itinerary:
+        raise KeyError(day)
+    activities = regenerate_day(trip.destination, trip.travel_type, trip.num_people,
+                                itinerary, day, slot, instructions)
+    return {**itinerary, day: activities}
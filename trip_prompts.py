@@ -0,0 +1,32 @@
+from utils.structured_output import TRAVEL_TYPES
+
+# One example day is enough for the model to repeat the shape; spelled-out
+# rules and a pretty-printed example cost tokens on every call
+TRIP_FORMAT = ('{"destination":"City, Country","suggested_duration":N,"travel_type":"...",'
+               '"recommended_group_size":"X-Y","itinerary":{"1":["Morning: ...","Afternoon: ...",'
+               '"Evening: ..."]}}')
+TRIP_RULES = (f"Every day has exactly 3 activities (morning, afternoon, evening) at real, mappable, "
+              f"named venues. travel_type is one of {', '.join(TRAVEL_TYPES)}.")
+
+
+def build_trip_prompt(destination: str, num_days: int, travel_type: str, num_people: int,
+                      alternatives: bool = False, wrapped: bool = False) -> str:
+    """
+    The user prompt for a trip plan, or for 3 alternative destinations when
+    alternatives is set; wrapped asks for them as {"suggestions": [...]},
+    since structured output only returns objects.
+    """
+    if alternatives:
+        task = (f"Suggest 3 alternatives to {destination}: different but related destinations (nearby or "
+                f"comparable), each with a {num_days}-day {travel_type} itinerary for {num_people} people.")
+        reply = (f'a JSON object {{"suggestions":[3 objects like {TRIP_FORMAT}]}}' if wrapped
+                 else f"a JSON array of 3 objects like {TRIP_FORMAT}")
+    else:
+        task = f"Plan a {num_days}-day {travel_type} trip to {destination} for {num_people} people."
+        reply = f"JSON only: {TRIP_FORMAT}"
+    return f"{task}\n{TRIP_RULES}\nReply with {reply}"
+
+
+def trip_units(num_days: int, alternatives: bool = False) -> int:
+    """Size of a trip plan completion in day-sized units; each suggestion's header counts as one more day."""
+    return (3 if alternatives else 1) * (num_days + 1)
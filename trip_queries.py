@@ -0,0 +1,101 @@
+import logging
+from typing import Sequence
+
+from sqlalchemy import String, cast, func, literal_column, or_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app import db
+from models import Review, Trip
+
+logger = logging.getLogger(__name__)
+
+# Same text search configuration and value filter as ix_trip_itinerary_search
+_SEARCH_CONFIG = literal_column("'simple'::regconfig")
+_STRING_VALUES = literal_column("'[\"string\"]'::jsonb")
+
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+
+def shared_with_user(user_id: int):
+    """Filter for trips shared with a user; a jsonb containment check backed by ix_trip_shared_with."""
+    if _is_postgres():
+        return type_coerce(Trip.shared_with, JSONB).contains([str(user_id)])
+    # Quoted so that user 1 does not match a trip shared with user 11
+    return cast(Trip.shared_with, String).contains(f'"{user_id}"', autoescape=True)
+
+
+def itinerary_mentions(text: str):
+    """
+    Filter for trips whose itinerary activities contain all words of text.
+    On Postgres this is a full-text match on ix_trip_itinerary_search (whole
+    words); other databases fall back to a case-insensitive substring scan.
+    """
+    if _is_postgres():
+        vector = func.jsonb_to_tsvector(_SEARCH_CONFIG, Trip.itinerary, _STRING_VALUES)
+        return vector.bool_op('@@')(func.plainto_tsquery(_SEARCH_CONFIG, text))
+    return func.lower(cast(Trip.itinerary, String)).contains(text.lower(), autoescape=True)
+
+
+# Listing queries. Each matches a composite index on Trip or Review; tests/test_query_plans.py
+# EXPLAINs them against a seeded database and fails on a full table scan.
+
+def _order(query, sort: str):
+    if sort == 'oldest':
+        return query.order_by(Trip.created_at.asc())
+    if sort == 'destination':
+        return query.order_by(Trip.destination.asc())
+    return query.order_by(Trip.created_at.desc())  # newest
+
+
+def user_trips_query(user_id: int, search: str = '', travel_type: str = '', duration: str = '',
+                     sort: str = 'newest'):
+    """A user's own trips for the dashboard (ix_trip_user_created / ix_trip_user_type_days)."""
+    query = Trip.query.filter_by(user_id=user_id)
+    if search:
+        query = query.filter(or_(Trip.destination.ilike(f'%{search}%'), itinerary_mentions(search)))
+    if travel_type:
+        query = query.filter_by(travel_type=travel_type)
+    if duration == '1-3':
+        query = query.filter(Trip.num_days.between(1, 3))
+    elif duration == '4-7':
+        query = query.filter(Trip.num_days.between(4, 7))
+    elif duration == '8+':
+        query = query.filter(Trip.num_days >= 8)
+    return _order(query, sort)
+
+
+def shared_trips_query(user_id: int, search: str = '', travel_type: str = '', duration: str = '',
+                       sort: str = 'newest'):
+    """Trips other users shared with user_id (ix_trip_shared_with)."""
+    query = Trip.query.filter(shared_with_user(user_id))
+    if search:
+        search_filters = []
+        for term in search.split():
+            search_filters.append(Trip.destination.ilike(f'%{term}%'))
+            search_filters.append(itinerary_mentions(term))
+        query = query.filter(or_(*search_filters))
+    if travel_type:
+        query = query.filter(Trip.travel_type.ilike(f'%{travel_type}%'))
+    if duration == '1-3':
+        query = query.filter(Trip.num_days <= 3)
+    elif duration == '4-7':
+        query = query.filter(Trip.num_days > 3, Trip.num_days <= 7)
+    elif duration == '8+':
+        query = query.filter(Trip.num_days > 7)
+    return _order(query, sort)
+
+
+def recommended_trips_query(user_id: int, travel_types: Sequence[str], trip_length: int, limit: int = 3):
+    """Other users' trips of a preferred type and similar length (ix_trip_type_days)."""
+    return Trip.query.filter(
+        Trip.user_id != user_id,
+        Trip.travel_type.in_(travel_types),
+        Trip.num_days.between(max(1, trip_length - 2), min(30, trip_length + 2))
+    ).limit(limit)
+
+
+def trip_reviews_query(trip_id: int):
+    """Reviews of a trip, newest first (ix_review_trip_created)."""
+    return Review.query.filter_by(trip_id=trip_id).order_by(Review.created_at.desc())
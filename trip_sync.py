@@ -0,0 +1,103 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from app import app, db
+from models import ArchivedTrip, Trip, TripTombstone
+from trip_archive import archived_trip_dicts
+
+logger = logging.getLogger(__name__)
+
+# updated_at is stamped at flush time but becomes visible at commit, so every
+# sync re-reads a short window before the cursor instead of risking a gap
+SYNC_OVERLAP = timedelta(seconds=30)
+TOMBSTONE_RETENTION = timedelta(days=int(os.environ.get('TRIP_TOMBSTONE_RETENTION_DAYS', 30)))
+
+
+class CursorExpiredError(ValueError):
+    """The cursor predates the kept tombstones; the client has to do a full sync."""
+
+
+def encode_cursor(moment: datetime) -> str:
+    return str(int((moment - datetime(1970, 1, 1)).total_seconds() * 1_000_000))
+
+
+def decode_cursor(cursor: str) -> datetime:
+    try:
+        return datetime(1970, 1, 1) + timedelta(microseconds=int(cursor))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Invalid sync cursor")
+
+
+def trip_list_version(user_id: int) -> Tuple[str, Optional[datetime]]:
+    """ETag and Last-Modified for a user's trip list, archived trips included, from index-only aggregates."""
+    count, last_modified = db.session.query(func.count(Trip.id), func.max(Trip.updated_at)) \
+        .filter(Trip.user_id == user_id).one()
+    archived_count, archived_modified = db.session.query(
+        func.count(ArchivedTrip.id), func.max(ArchivedTrip.updated_at)) \
+        .filter(ArchivedTrip.user_id == user_id).one()
+    # Deletions lower the count, archiving and restoring move trips between the counts;
+    # creations and updates move the max
+    etag = hashlib.sha256(f"{user_id}:{count}:{archived_count}:{last_modified}:{archived_modified}"
+                          .encode('utf-8')).hexdigest()[:32]
+    return etag, max(filter(None, (last_modified, archived_modified)), default=None)
+
+
+def trip_version(trip: Trip) -> str:
+    """ETag of a single trip; clients holding a synced copy can rebuild it from id and version."""
+    return f"{trip.id}.{trip.version}"
+
+
+def changes_since(user_id: int, cursor: Optional[str]) -> Dict:
+    """
+    Trips of the user created or updated after the cursor, as dicts, plus
+    ids of trips deleted since. Without a cursor every trip is returned as
+    created, archived ones included; archiving writes no tombstone, so
+    incremental syncs leave the client's copy of an archived trip alone.
+    """
+    now = datetime.utcnow()
+    since = decode_cursor(cursor) if cursor else None
+    if since is not None and now - since > TOMBSTONE_RETENTION:
+        raise CursorExpiredError("Sync cursor expired, a full sync is required")
+
+    query = Trip.query.filter(Trip.user_id == user_id)
+    deleted = []
+    if since is not None:
+        window_start = since - SYNC_OVERLAP
+        query = query.filter(Trip.updated_at > window_start)
+        deleted = [trip_id for (trip_id,) in db.session.query(TripTombstone.trip_id).filter(
+            TripTombstone.user_id == user_id,
+            TripTombstone.deleted_at > window_start
+        ).distinct()]
+
+    created, updated = [], []
+    for trip in query.order_by(Trip.updated_at).all():
+        is_new = since is None or trip.created_at is None or trip.created_at > since - SYNC_OVERLAP
+        (created if is_new else updated).append(trip.to_dict())
+    if since is None:
+        created.extend(archived_trip_dicts(user_id))
+
+    return {
+        'cursor': encode_cursor(now),
+        'created': created,
+        'updated': updated,
+        'deleted': deleted
+    }
+
+
+def purge_tombstones(retention: timedelta = TOMBSTONE_RETENTION) -> int:
+    deleted = TripTombstone.query.filter(
+        TripTombstone.deleted_at < datetime.utcnow() - retention
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+@app.cli.command('purge-trip-tombstones')
+def purge_tombstones_command():
+    """Delete tombstones older than the sync retention (run daily from cron)."""
+    print(f"Purged {purge_tombstones()} trip tombstones")
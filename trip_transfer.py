@@ -0,0 +1,117 @@
+import os
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import undefer
+
+from app import db
+from models import ArchivedTrip, Trip
+from trip_archive import unpack_trip
+from trip_updates import WRITABLE_FIELDS, validate_trip_fields
+from utils import fast_json
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = int(os.environ.get('TRIP_IMPORT_BATCH_SIZE', 1000))
+# The import body is streamed, so this only bounds the total upload
+IMPORT_MAX_BYTES = int(os.environ.get('TRIP_IMPORT_MAX_BYTES', 1024 * 1024 * 1024))
+MAX_REPORTED_ERRORS = 100
+MAX_LINE_BYTES = 1024 * 1024
+
+
+def export_trips(user_id: int) -> Iterator[bytes]:
+    """
+    A user's trips as NDJSON lines, live ones first, then archived ones.
+    Rows are fetched yield_per at a time through a server-side cursor where
+    the database supports one, so memory stays flat however many trips
+    there are.
+    """
+    trips = db.session.scalars(select(Trip).where(Trip.user_id == user_id).order_by(Trip.id)
+                               .execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for trip in trips:
+        yield fast_json.dumps_bytes(trip.to_dict()) + b"\n"
+
+    archived = db.session.scalars(select(ArchivedTrip).where(ArchivedTrip.user_id == user_id)
+                                  .order_by(ArchivedTrip.id).options(undefer(ArchivedTrip.payload))
+                                  .execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for trip in archived:
+        yield fast_json.dumps_bytes(unpack_trip(trip)) + b"\n"
+
+
+def parse_trip_line(line: bytes, user_id: int, now: datetime) -> Dict:
+    """One NDJSON line as a row for Trip's table. Raises ValueError with a client-facing message."""
+    if len(line) > MAX_LINE_BYTES:
+        raise ValueError("line too long")
+    try:
+        data = fast_json.loads(line)
+    except ValueError:
+        raise ValueError("invalid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+
+    row = validate_trip_fields({field: data.get(field) for field in WRITABLE_FIELDS})
+    row.update(user_id=user_id, created_at=now, updated_at=now)
+    return row
+
+
+def _insert_batch(batch: List[Tuple[int, Dict]], errors: List[Dict]) -> int:
+    """Insert a batch with one executemany; on failure retry row by row to find the bad lines."""
+    try:
+        db.session.execute(insert(Trip), [row for _, row in batch])
+        db.session.commit()
+        return len(batch)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning(f"Trip import batch failed, retrying row by row: {str(e)}")
+
+    inserted = 0
+    for line_number, row in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Trip), [row])
+            inserted += 1
+        except SQLAlchemyError as e:
+            errors.append({'line': line_number, 'error': str(e.orig if hasattr(e, 'orig') else e)})
+    db.session.commit()
+    return inserted
+
+
+def import_trips(user_id: int, lines: Iterable[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Create trips for user_id from NDJSON lines (the export format; id and
+    updated_at are ignored). Valid lines are inserted batch_size at a time
+    and committed per batch. Invalid lines are skipped and reported by line
+    number.
+    """
+    now = datetime.utcnow()
+    imported = 0
+    failed = 0
+    errors: List[Dict] = []
+    batch: List[Tuple[int, Dict]] = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            batch.append((line_number, parse_trip_line(line, user_id, now)))
+        except ValueError as e:
+            failed += 1
+            errors.append({'line': line_number, 'error': str(e)})
+        if len(batch) >= batch_size:
+            before = len(errors)
+            imported += _insert_batch(batch, errors)
+            failed += len(errors) - before
+            batch = []
+        # Only the first errors are reported; the count covers all of them
+        del errors[MAX_REPORTED_ERRORS:]
+    if batch:
+        before = len(errors)
+        imported += _insert_batch(batch, errors)
+        failed += len(errors) - before
+        del errors[MAX_REPORTED_ERRORS:]
+
+    logger.info(f"Imported {imported} trips for user {user_id}, {failed} lines failed")
+    return {'imported': imported, 'failed': failed, 'errors': errors}
@@ -0,0 +1,130 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Text, func, literal, null
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+
+from app import db
+from models import TRIP_VERSIONED_FIELDS, Trip
+from utils.json_patch import JsonPatchError, apply_patch, changed_keys, merge_patch
+
+logger = logging.getLogger(__name__)
+
+MERGE_PATCH = 'application/merge-patch+json'
+JSON_PATCH = 'application/json-patch+json'
+WRITABLE_FIELDS = TRIP_VERSIONED_FIELDS
+
+
+def _positive_int(value, name: str, high: Optional[int] = None) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1 or (high and value > high):
+        raise ValueError(f"{name} must be an integer between 1 and {high}" if high
+                         else f"{name} must be a positive integer")
+    return value
+
+
+def _text(value, name: str, max_length: int) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"{name} is required")
+    if len(value) > max_length:
+        raise ValueError(f"{name} is longer than {max_length} characters")
+    return value.strip()
+
+
+def _itinerary(value, name: str) -> Dict:
+    if value is None:
+        return {}
+    if not isinstance(value, dict) or not all(isinstance(day, list) for day in value.values()):
+        raise ValueError(f"{name} must be an object of day lists")
+    return value
+
+
+def _user_ids(value, name: str) -> List[str]:
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(str(uid).isdigit() for uid in value):
+        raise ValueError(f"{name} must be a list of user ids")
+    return [str(uid) for uid in value]
+
+
+_VALIDATORS = {
+    'destination': lambda value: _text(value, 'destination', 200),
+    'num_days': lambda value: _positive_int(value, 'num_days', 30),
+    'travel_type': lambda value: _text(value, 'travel_type', 50),
+    'num_people': lambda value: _positive_int(value, 'num_people'),
+    'itinerary': lambda value: _itinerary(value, 'itinerary'),
+    'shared_with': lambda value: _user_ids(value, 'shared_with'),
+}
+
+
+def validate_trip_fields(data: Dict) -> Dict:
+    """Validated copies of the writable trip fields in data. Raises ValueError with a client-facing message."""
+    return {field: _VALIDATORS[field](value) for field, value in data.items() if field in _VALIDATORS}
+
+
+def trip_document(trip: Trip) -> Dict[str, Any]:
+    """The writable fields of a trip, the document PATCH requests apply to."""
+    document = {field: getattr(trip, field) for field in WRITABLE_FIELDS}
+    document['itinerary'] = document['itinerary'] or {}
+    document['shared_with'] = document['shared_with'] or []
+    return document
+
+
+def _itinerary_update(old: Dict, new: Dict):
+    """
+    On Postgres, an expression rewriting only the changed days with
+    jsonb_set, so the UPDATE carries the edit rather than the whole
+    itinerary. Elsewhere, or when most days changed, the new value itself.
+    """
+    days = changed_keys(old, new)
+    if db.engine.dialect.name != 'postgresql' or len(days) * 2 > len(new):
+        return new
+    expression = Trip.__table__.c.itinerary
+    for day in days:
+        if day in new:
+            expression = func.jsonb_set(expression, literal([day], ARRAY(Text)), literal(new[day], JSONB), True)
+        else:
+            expression = expression.op('-')(literal(day, Text))
+    return expression
+
+
+def update_trip(trip: Trip, updates: Dict) -> List[str]:
+    """
+    Assign the writable fields of updates that differ from the stored
+    values; other keys (id, version, ...) are ignored. Returns the names of
+    the changed fields. Raises ValueError for invalid values.
+    """
+    document = trip_document(trip)
+    values = validate_trip_fields(updates)
+    changed = [field for field in WRITABLE_FIELDS if field in values and values[field] != document[field]]
+    for field in changed:
+        if field == 'itinerary':
+            trip.itinerary = _itinerary_update(document['itinerary'], values['itinerary'])
+            # SQL NULL (not JSON null) so the stale route is picked up for recomputation
+            trip.route_data = null()
+        else:
+            setattr(trip, field, values[field])
+    return changed
+
+
+def patch_trip(trip: Trip, body: Any, content_type: str) -> List[str]:
+    """
+    Apply a JSON Patch (application/json-patch+json) or JSON Merge Patch
+    (any other JSON type) to the trip's writable fields, e.g. replace one
+    activity with {"op": "replace", "path": "/itinerary/2/0", "value": ...}
+    or one day with {"itinerary": {"2": [...]}}. Returns the changed fields.
+    """
+    document = trip_document(trip)
+    if content_type == JSON_PATCH:
+        patched = apply_patch(document, body)
+    elif isinstance(body, dict):
+        patched = merge_patch(document, body)
+    else:
+        raise JsonPatchError("A merge patch must be a JSON object")
+
+    extra = sorted(set(patched) - set(WRITABLE_FIELDS))
+    if extra:
+        raise JsonPatchError(f"Read-only or unknown fields: {', '.join(extra)}")
+    missing = sorted(set(WRITABLE_FIELDS) - set(patched))
+    if missing:
+        raise JsonPatchError(f"Fields cannot be removed: {', '.join(missing)}")
+    return update_trip(trip, patched)
@@ -0,0 +1,71 @@
+import os
+import logging
+from datetime import datetime
+from typing import Optional
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from app import db
+from models import User
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 4096))
+# Bounds how long a change made through another worker process can go unnoticed
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+
+class CachedUser(UserMixin):
+    """
+    Detached, read-only snapshot of a User for current_user. Holds the
+    columns request handlers read; anything else (relationships such as
+    trips or preferences) loads the real row on first access.
+    """
+
+    def __init__(self, id: int, username: str, email: str, created_at: Optional[datetime]):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.created_at = created_at
+        self._row = None
+
+    def __getattr__(self, name):
+        # Only reached for attributes the snapshot does not carry
+        if name.startswith('__') or name == '_row':
+            raise AttributeError(name)
+        if self._row is None:
+            self._row = db.session.get(User, self.id)
+            if self._row is None:
+                raise AttributeError(name)
+        return getattr(self._row, name)
+
+    def __repr__(self) -> str:
+        return f"<CachedUser {self.id}>"
+
+
+# Plain column tuples; every request gets its own CachedUser so no ORM state is shared
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def load_cached_user(user_id) -> Optional[CachedUser]:
+    """Login manager user loader that skips the primary-key query while the snapshot is fresh."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    columns = user_cache.get(user_id)
+    if columns is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        columns = (user.id, user.username, user.email, user.created_at)
+        user_cache.set(user_id, columns)
+    return CachedUser(*columns)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, user):
+    user_cache.delete(user.id)
@@ -0,0 +1,176 @@
+import os
+import json
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from flask import g, has_request_context
+
+from models import UserPreference
+from utils import fast_json
+from utils.shared_store import get_shared_store
+
+logger = logging.getLogger(__name__)
+
+TRAVEL_TYPES = ('adventure', 'relaxation', 'cultural', 'family', 'business')
+BUDGET_RANGES = ('budget', 'mid-range', 'luxury')
+MAX_LIST_ITEMS = 20
+MAX_ITEM_LENGTH = 100
+PREFERENCE_CACHE_TTL = int(os.environ.get('PREFERENCE_CACHE_TTL', 600))
+
+
+class Preferences(NamedTuple):
+    """A user's travel preferences, parsed and validated once."""
+    travel_types: Tuple[str, ...] = ()
+    destinations: Tuple[str, ...] = ()
+    trip_length: Optional[int] = None
+    group_size: Optional[int] = None
+    budget_range: Optional[str] = None
+    interests: Tuple[str, ...] = ()
+
+    def to_context(self) -> Dict:
+        """Preferences in the shape the AI advisor prompt expects."""
+        return {
+            'preferred_travel_types': list(self.travel_types),
+            'preferred_destinations': list(self.destinations),
+            'preferred_trip_length': self.trip_length,
+            'preferred_group_size': self.group_size,
+            'budget_range': self.budget_range,
+            'interests': list(self.interests)
+        }
+
+
+def clean_list(value, allowed: Optional[Tuple[str, ...]] = None) -> Tuple[str, ...]:
+    """
+    Normalize a list preference. Accepts native lists, legacy JSON-encoded
+    strings and comma-separated text; drops blanks, duplicates and values
+    outside allowed.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip().startswith('[') else value.split(',')
+        except json.JSONDecodeError:
+            value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        return ()
+    items = []
+    for item in value:
+        if not isinstance(item, str):
+            continue
+        item = item.strip()[:MAX_ITEM_LENGTH]
+        if allowed is not None:
+            item = item.lower()
+            if item not in allowed:
+                continue
+        if item and item not in items:
+            items.append(item)
+    return tuple(items[:MAX_LIST_ITEMS])
+
+
+def clean_int(value, low: int, high: int) -> Optional[int]:
+    try:
+        return min(high, max(low, int(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def from_model(pref: Optional[UserPreference]) -> Optional[Preferences]:
+    if pref is None:
+        return None
+    return Preferences(
+        travel_types=clean_list(pref.preferred_travel_types, TRAVEL_TYPES),
+        destinations=clean_list(pref.preferred_destinations),
+        trip_length=clean_int(pref.preferred_trip_length, 1, 30),
+        group_size=clean_int(pref.preferred_group_size, 1, 20),
+        budget_range=pref.budget_range if pref.budget_range in BUDGET_RANGES else None,
+        interests=clean_list(pref.interests)
+    )
+
+
+def from_form(form) -> Preferences:
+    """Validate the /preferences form. Raises ValueError on non-numeric lengths or sizes."""
+    return Preferences(
+        travel_types=clean_list(form.getlist('travel_types'), TRAVEL_TYPES),
+        destinations=clean_list(form.get('preferred_destinations', '').split(',')),
+        trip_length=min(30, max(1, int(form.get('preferred_trip_length', 1)))),
+        group_size=min(20, max(1, int(form.get('preferred_group_size', 1)))),
+        budget_range=form.get('budget_range') if form.get('budget_range') in BUDGET_RANGES else None,
+        interests=clean_list(form.get('interests', '').split(','))
+    )
+
+
+def apply_to_model(prefs: Preferences, pref: UserPreference) -> None:
+    """Store preferences on the row, lists as native JSON arrays."""
+    pref.preferred_travel_types = list(prefs.travel_types)
+    pref.preferred_destinations = list(prefs.destinations)
+    pref.preferred_trip_length = prefs.trip_length
+    pref.preferred_group_size = prefs.group_size
+    pref.budget_range = prefs.budget_range
+    pref.interests = list(prefs.interests)
+
+
+# Preferences are only cached across requests in the shared store: a process-local
+# copy could not be invalidated in the other workers when a user saves new ones
+_MISSING_PREFERENCES = 'none'
+
+
+def _cache_key(user_id: int) -> str:
+    return f"preferences:{user_id}"
+
+
+def _cache_get(user_id: int):
+    store = get_shared_store()
+    if store is None:
+        return None
+    try:
+        raw = store.get(_cache_key(user_id))
+    except Exception as e:
+        logger.warning(f"Preference cache unavailable: {str(e)}")
+        return None
+    if raw is None or raw == _MISSING_PREFERENCES:
+        return raw
+    data = fast_json.loads(raw)
+    return Preferences(**{field: tuple(value) if isinstance(value, list) else value
+                          for field, value in data.items()})
+
+
+def _cache_set(user_id: int, prefs: Optional[Preferences]) -> None:
+    store = get_shared_store()
+    if store is None:
+        return
+    try:
+        encoded = fast_json.dumps(prefs._asdict()) if prefs is not None else _MISSING_PREFERENCES
+        store.set(_cache_key(user_id), encoded, ttl=PREFERENCE_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Preference cache unavailable: {str(e)}")
+
+
+def get_preferences(user_id: int) -> Optional[Preferences]:
+    """
+    Typed preferences of a user, or None when they have not set any.
+    Memoized for the request and, with a shared store, cached per user until
+    invalidated.
+    """
+    memo = g.setdefault('_preferences', {}) if has_request_context() else {}
+    if user_id in memo:
+        return memo[user_id]
+
+    cached = _cache_get(user_id)
+    if cached is None:
+        prefs = from_model(UserPreference.query.filter_by(user_id=user_id).first())
+        _cache_set(user_id, prefs)
+    else:
+        prefs = None if cached == _MISSING_PREFERENCES else cached
+    memo[user_id] = prefs
+    return prefs
+
+
+def invalidate_preferences(user_id: int) -> None:
+    if has_request_context():
+        g.setdefault('_preferences', {}).pop(user_id, None)
+    store = get_shared_store()
+    if store is None:
+        return
+    try:
+        store.delete(_cache_key(user_id))
+    except Exception as e:
+        logger.warning(f"Preference cache unavailable: {str(e)}")
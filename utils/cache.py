@@ -0,0 +1,209 @@
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from utils.fast_json import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+def canonical_hash(data: Any) -> str:
+    """Stable SHA-256 of JSON-serializable data, independent of dict key order."""
+    return hashlib.sha256(dumps_bytes(data, default=str, sort_keys=True)).hexdigest()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a fixed entry limit and per-entry expiry."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ByteSizedCache:
+    """
+    Thread-safe LRU of bytes values bounded by total size rather than entry
+    count, with hit/miss counters. Callers store serialized values, so every
+    hit decodes into a fresh object that is safe to mutate.
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._data[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution whose result all callers share."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class ResponseCache:
+    """
+    Exact-match cache for string responses: an in-process LRU in front of an
+    optional shared store, with single-flight de-duplication so concurrent
+    identical requests cost one upstream call.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600, shared_store=None,
+                 prefix: str = 'response'):
+        self.local = TTLCache(maxsize, ttl)
+        self.ttl = ttl
+        self.shared_store = shared_store
+        self.prefix = prefix
+        self._flight = SingleFlight()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is not None or not self.shared_store:
+            return value
+        try:
+            value = self.shared_store.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            logger.warning(f"Shared response cache unavailable: {str(e)}")
+            return None
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.local.set(key, value)
+        if self.shared_store:
+            try:
+                self.shared_store.set(f"{self.prefix}:{key}", value, ttl=self.ttl)
+            except Exception as e:
+                logger.warning(f"Shared response cache unavailable: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self.shared_store:
+            try:
+                self.shared_store.delete(f"{self.prefix}:{key}")
+            except Exception as e:
+                logger.warning(f"Shared response cache unavailable: {str(e)}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """Return the cached value or compute it once, even under concurrent identical calls."""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def load() -> str:
+            # Another caller may have filled the cache while we waited for the flight lock
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            result = compute()
+            if result:
+                self.set(key, result)
+            return result
+
+        return self._flight.do(key, load)
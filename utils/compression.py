@@ -0,0 +1,106 @@
+import os
+import gzip
+import logging
+from typing import Optional
+
+from flask import request
+from werkzeug.security import safe_join
+
+from utils.cache import ByteSizedCache
+
+try:
+    import brotli
+except ImportError:  # Optional dependency: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+    'application/json', 'application/xml', 'image/svg+xml'
+}
+
+
+class Compressor:
+    """
+    Compresses responses with brotli or gzip, whichever the client prefers.
+
+    Dynamic responses under min_size bytes are left alone. Static files are
+    compressed once per file version and the compressed bytes are kept in
+    memory, so serving them costs no more than the uncompressed file.
+    """
+
+    def __init__(self, app=None, min_size: int = 500, gzip_level: int = 6, brotli_quality: int = 5,
+                 static_cache_bytes: int = 16 * 1024 * 1024):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.static_variants = ByteSizedCache(static_cache_bytes)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.static_folder = app.static_folder
+        app.after_request(self.after_request)
+
+    @property
+    def encodings(self):
+        return ['br', 'gzip'] if brotli else ['gzip']
+
+    def compress(self, data: bytes, encoding: str, static: bool = False) -> bytes:
+        if encoding == 'br':
+            # Static variants are built once, so they get the best ratio
+            return brotli.compress(data, quality=11 if static else self.brotli_quality)
+        return gzip.compress(data, compresslevel=9 if static else self.gzip_level, mtime=0)
+
+    def _static_variant(self, filename: str, encoding: str) -> Optional[bytes]:
+        path = safe_join(self.static_folder, filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = f"{encoding}:{path}:{stat.st_mtime_ns}:{stat.st_size}"
+        variant = self.static_variants.get(key)
+        if variant is None:
+            with open(path, 'rb') as f:
+                variant = self.compress(f.read(), encoding, static=True)
+            self.static_variants.set(key, variant)
+        return variant
+
+    def after_request(self, response):
+        if (response.status_code != 200 or (response.is_streamed and not response.direct_passthrough)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if not encoding:
+            return response
+
+        try:
+            if request.endpoint == 'static':
+                body = self._static_variant(request.view_args.get('filename', ''), encoding)
+                if body is None:
+                    return response
+                # Drop the open file of the identity response
+                if hasattr(response.response, 'close'):
+                    response.response.close()
+                response.direct_passthrough = False
+            else:
+                data = response.get_data()
+                if len(data) < self.min_size:
+                    return response
+                body = self.compress(data, encoding)
+        except Exception as e:
+            logger.warning(f"Response compression failed: {str(e)}")
+            return response
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity representation
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
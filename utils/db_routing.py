@@ -0,0 +1,178 @@
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional
+
+import sqlalchemy as sa
+from flask import g, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = 'replica_'
+# Requests from a client that just wrote read from the primary for this long
+REPLICA_STICKY_SECONDS = float(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+# A replica that failed to connect is skipped for this long
+REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', 30))
+_STICKY_KEY = '_db_primary_until'
+
+
+def engine_options(url: Optional[str], pool_size: int = 5, max_overflow: int = 10,
+                   pool_timeout: int = 30, pool_recycle: int = 300) -> Dict:
+    """
+    Engine options with pool sizing from DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT and DB_POOL_RECYCLE, falling back to the given
+    per-environment defaults. SQLite keeps its own pool.
+    """
+    options = {
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', pool_recycle)),
+        'pool_pre_ping': True,
+    }
+    if url and not url.startswith('sqlite'):
+        options.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', pool_size)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', max_overflow)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', pool_timeout)),
+        })
+    return options
+
+
+def replica_binds(urls: Optional[str], **pool_defaults) -> Dict[str, Dict]:
+    """SQLALCHEMY_BINDS entries for a comma-separated list of replica URLs."""
+    binds = {}
+    for i, url in enumerate(u.strip() for u in (urls or '').split(',')):
+        if url:
+            binds[f"{REPLICA_BIND_PREFIX}{i}"] = {'url': url, **engine_options(url, **pool_defaults)}
+    return binds
+
+
+class ReplicaHealth:
+    """Remembers replicas that recently failed so they are skipped until the retry delay passes."""
+
+    def __init__(self, retry_seconds: float = REPLICA_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self._down_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def available(self, keys: List[str]) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [key for key in keys if self._down_until.get(key, 0) <= now]
+
+    def mark_down(self, key: str) -> None:
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry_seconds
+
+
+replica_health = ReplicaHealth()
+
+
+def replica_reads(view):
+    """
+    Let a view's queries go to a read replica. Only GET/HEAD requests are
+    routed, and not while the client is sticky to the primary after a write.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.db_replica_reads = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def replica_scope():
+    """Send the reads inside the block to a replica, e.g. reference data looked up by a write request."""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_replica_reads', False)
+    g.db_replica_reads = True
+    try:
+        yield
+    finally:
+        g.db_replica_reads = previous
+
+
+@contextmanager
+def primary_scope():
+    """Send the reads inside the block to the primary, e.g. data about to be cached under a fresh version."""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_replica_reads', False)
+    g.db_replica_reads = False
+    try:
+        yield
+    finally:
+        g.db_replica_reads = previous
+
+
+def _replica_reads_enabled() -> bool:
+    if not has_request_context() or not g.get('db_replica_reads'):
+        return False
+    return flask_session.get(_STICKY_KEY, 0) <= time.time()
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads of replica-enabled requests to a replica and
+    everything else to the primary. Flushes, DML and any read after this
+    transaction wrote go to the primary. A replica that cannot be reached
+    is skipped and the primary serves the read.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not self.info.get('db_wrote')
+                and not isinstance(clause, sa.UpdateBase) and _replica_reads_enabled()):
+            engine = self._replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        engines = self._db.engines
+        key = self.info.get('db_replica')
+        if key is not None and key in engines:
+            return engines[key]
+
+        candidates = replica_health.available(
+            [k for k in engines if isinstance(k, str) and k.startswith(REPLICA_BIND_PREFIX)])
+        random.shuffle(candidates)
+        for key in candidates:
+            engine = engines[key]
+            try:
+                # Checks the replica out once per transaction; later reads reuse this connection
+                self.connection(bind_arguments={'bind': engine})
+            except exc.DBAPIError as e:
+                logger.warning(f"Read replica {key} unavailable, using primary: {str(e)}")
+                replica_health.mark_down(key)
+                continue
+            self.info['db_replica'] = key
+            return engine
+        return None
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(db_session, flush_context):
+    db_session.info['db_wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    wrote = db_session.info.pop('db_wrote', False)
+    db_session.info.pop('db_replica', None)
+    if wrote and has_request_context():
+        # Read-your-writes: the client's next requests skip replicas that may lag
+        flask_session[_STICKY_KEY] = time.time() + REPLICA_STICKY_SECONDS
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _reset_routing(db_session):
+    db_session.info.pop('db_wrote', None)
+    db_session.info.pop('db_replica', None)
@@ -0,0 +1,74 @@
+import json
+import logging
+from typing import Any, Callable, Optional
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional dependency: the standard library is used instead
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Dates go through the caller's default so the output matches Flask's (RFC 822 dates)
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+def dumps_bytes(obj: Any, default: Optional[Callable[[Any], Any]] = None,
+                sort_keys: bool = False, indent: bool = False) -> bytes:
+    """Compact UTF-8 JSON, via orjson when it is installed."""
+    if orjson is not None:
+        option = _ORJSON_OPTIONS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits; the standard library copes with those
+            pass
+    return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False,
+                      indent=2 if indent else None,
+                      separators=(',', ': ') if indent else (',', ':')).encode('utf-8')
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None, sort_keys: bool = False) -> str:
+    return dumps_bytes(obj, default=default, sort_keys=sort_keys).decode('utf-8')
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, with the same output types as the
+    default provider. Calls with options orjson cannot express (custom
+    encoder classes, other indents) fall back to the standard library.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        indent = kwargs.pop('indent', None)
+        separators = kwargs.pop('separators', None)
+        default = kwargs.pop('default', self.default)
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        kwargs.pop('ensure_ascii', None)  # orjson always emits UTF-8, which is valid JSON either way
+        if kwargs or indent not in (None, 2) or separators not in (None, (',', ':')):
+            return super().dumps(obj, indent=indent, separators=separators, default=default,
+                                 sort_keys=sort_keys, **kwargs)
+        return dumps_bytes(obj, default=default, sort_keys=sort_keys, indent=indent == 2).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = dumps_bytes(obj, default=self.default, sort_keys=self.sort_keys, indent=indent)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,161 @@
+import re
+from typing import Any, Callable, Dict, List
+
+# RFC 6901 array index: no sign, no leading zeros
+_INDEX = re.compile(r'^(0|[1-9][0-9]*)$')
+
+
+class JsonPatchError(ValueError):
+    """The patch document is malformed or cannot be applied."""
+
+
+class JsonPatchConflict(JsonPatchError):
+    """A JSON Patch test operation did not match the current document."""
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """
+    Apply an RFC 7396 JSON Merge Patch. Objects are merged key by key, null
+    removes a key, anything else (arrays included) replaces the value.
+    Untouched parts of target are shared with the result, never modified.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def parse_pointer(pointer: Any) -> List[str]:
+    """Reference tokens of an RFC 6901 JSON Pointer; '' is the whole document."""
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _child_key(node: Any, token: str, pointer: str, allow_end: bool = False):
+    if isinstance(node, dict):
+        return token
+    if isinstance(node, list):
+        if allow_end and token == '-':
+            return len(node)
+        if not _INDEX.match(token) or int(token) > len(node) - (0 if allow_end else 1):
+            raise JsonPatchError(f"Index out of range: {pointer}")
+        return int(token)
+    raise JsonPatchError(f"Path does not exist: {pointer}")
+
+
+def resolve(doc: Any, pointer: str) -> Any:
+    node = doc
+    for token in parse_pointer(pointer):
+        key = _child_key(node, token, pointer)
+        if isinstance(node, dict) and key not in node:
+            raise JsonPatchError(f"Path does not exist: {pointer}")
+        node = node[key]
+    return node
+
+
+def _edit(doc: Any, pointer: str, edit: Callable[[Any, str], None]) -> Any:
+    """Copy of doc with edit(parent, last_token) applied; only the containers on the path are copied."""
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise JsonPatchError("Operations on the whole document are not supported")
+
+    def walk(node: Any, depth: int) -> Any:
+        if isinstance(node, dict):
+            node = dict(node)
+        elif isinstance(node, list):
+            node = list(node)
+        else:
+            raise JsonPatchError(f"Path does not exist: {pointer}")
+        if depth == len(tokens) - 1:
+            edit(node, tokens[depth])
+        else:
+            key = _child_key(node, tokens[depth], pointer)
+            if isinstance(node, dict) and key not in node:
+                raise JsonPatchError(f"Path does not exist: {pointer}")
+            node[key] = walk(node[key], depth + 1)
+        return node
+
+    return walk(doc, 0)
+
+
+def _add(doc: Any, pointer: str, value: Any) -> Any:
+    def edit(parent, token):
+        key = _child_key(parent, token, pointer, allow_end=True)
+        if isinstance(parent, list):
+            parent.insert(key, value)
+        else:
+            parent[key] = value
+    return _edit(doc, pointer, edit)
+
+
+def _remove(doc: Any, pointer: str) -> Any:
+    def edit(parent, token):
+        key = _child_key(parent, token, pointer)
+        if isinstance(parent, dict) and key not in parent:
+            raise JsonPatchError(f"Path does not exist: {pointer}")
+        del parent[key]
+    return _edit(doc, pointer, edit)
+
+
+def _replace(doc: Any, pointer: str, value: Any) -> Any:
+    def edit(parent, token):
+        key = _child_key(parent, token, pointer)
+        if isinstance(parent, dict) and key not in parent:
+            raise JsonPatchError(f"Path does not exist: {pointer}")
+        parent[key] = value
+    return _edit(doc, pointer, edit)
+
+
+def apply_patch(doc: Any, operations: Any) -> Any:
+    """
+    Apply an RFC 6902 JSON Patch (add, remove, replace, move, copy, test)
+    atomically: either every operation applies or JsonPatchError is raised
+    and doc is left as it was.
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A JSON Patch must be an array of operations")
+    for operation in operations:
+        if not isinstance(operation, dict) or 'path' not in operation:
+            raise JsonPatchError("Each operation needs an 'op' and a 'path'")
+        op, path = operation.get('op'), operation['path']
+        # Malformed pointers are a 400 however the operation would use them
+        parse_pointer(path)
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f"'{op}' needs a 'value'")
+        if op in ('move', 'copy') and 'from' not in operation:
+            raise JsonPatchError(f"'{op}' needs a 'from'")
+
+        if op == 'add':
+            doc = _add(doc, path, operation['value'])
+        elif op == 'remove':
+            doc = _remove(doc, path)
+        elif op == 'replace':
+            doc = _replace(doc, path, operation['value'])
+        elif op == 'move':
+            source = operation['from']
+            parse_pointer(source)
+            if path.startswith(source + '/'):
+                raise JsonPatchError(f"Cannot move {source} into itself")
+            value = resolve(doc, source)
+            doc = _add(_remove(doc, source), path, value)
+        elif op == 'copy':
+            doc = _add(doc, path, resolve(doc, operation['from']))
+        elif op == 'test':
+            if resolve(doc, path) != operation['value']:
+                raise JsonPatchConflict(f"Test failed at {path}")
+        else:
+            raise JsonPatchError(f"Unsupported operation: {op!r}")
+    return doc
+
+
+def changed_keys(old: Dict, new: Dict) -> List[str]:
+    """Top-level keys whose values differ between two objects, removed keys included."""
+    return [key for key in set(old) | set(new) if key not in old or key not in new or old[key] != new[key]]
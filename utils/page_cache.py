@@ -0,0 +1,109 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from flask import make_response, request, session
+from sqlalchemy import event
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+class PageCache:
+    """
+    Rendered pages keyed by a caller-chosen key plus the version stamps of the
+    data they show. Writes bump a scope's version (e.g. 'trip:42'), so stale
+    pages are never looked up again and simply age out of the LRU.
+
+    Versions live in the shared store, so a change in one worker invalidates
+    the pages cached by every worker. Without a shared store a worker could
+    not see the others' writes, so the cache is disabled and every page is
+    rendered fresh.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300, shared_store=None,
+                 prefix: str = 'page'):
+        self.pages = TTLCache(maxsize, ttl)
+        self.store = shared_store
+        self.prefix = prefix
+
+    def version(self, *scopes: str) -> Optional[str]:
+        """Combined version stamp of the scopes, or None when the store is unavailable."""
+        if self.store is None:
+            return None
+        try:
+            return '.'.join(str(self.store.get(f"{self.prefix}:v:{scope}") or 0) for scope in scopes)
+        except Exception as e:
+            logger.warning(f"Page cache versions unavailable: {str(e)}")
+            return None
+
+    def bump(self, scope: str) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.incr(f"{self.prefix}:v:{scope}")
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached pages for {scope}: {str(e)}")
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        return self.pages.get(key)
+
+    def set(self, key: str, body: str) -> CachedPage:
+        encoded = body.encode('utf-8')
+        page = CachedPage(body=encoded,
+                          etag=hashlib.sha256(encoded).hexdigest()[:32],
+                          last_modified=datetime.now(timezone.utc).replace(microsecond=0))
+        self.pages.set(key, page)
+        return page
+
+    def response(self, key: Optional[str], render: Callable[[], str], cache_control: str):
+        """
+        Serve the page for key, rendering it on a miss, with a strong ETag and
+        Last-Modified so conditional requests get a 304. Pages with pending
+        flash messages are rendered fresh and never cached.
+        """
+        if key is None or session.get('_flashes'):
+            response = make_response(render())
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        page = self.get(key)
+        if page is None:
+            page = self.set(key, render())
+        response = make_response(page.body)
+        response.set_etag(page.etag)
+        response.last_modified = page.last_modified
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+
+def track_changes(session_factory, page_cache: PageCache,
+                  scopes_for: Callable[[object], Iterable[str]]) -> None:
+    """
+    Bump page versions for every object written through the session, once the
+    transaction commits. scopes_for maps an instance to the scopes it affects.
+    """
+    def collect(db_session, flush_context):
+        scopes = db_session.info.setdefault('page_cache_scopes', set())
+        for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+            scopes.update(scopes_for(obj) or ())
+
+    def publish(db_session):
+        for scope in db_session.info.pop('page_cache_scopes', ()):
+            page_cache.bump(scope)
+
+    def discard(db_session):
+        db_session.info.pop('page_cache_scopes', None)
+
+    event.listen(session_factory, 'after_flush', collect)
+    event.listen(session_factory, 'after_commit', publish)
+    event.listen(session_factory, 'after_rollback', discard)
@@ -0,0 +1,176 @@
+import re
+import time
+import zlib
+import hashlib
+import threading
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants embed identically."""
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder: word unigrams/bigrams and character
+    trigrams hashed into a fixed number of signed buckets. Needs no network
+    and gives stable vectors across processes, so it serves as the stand-in
+    for tests and deployments without an embeddings API.
+    """
+
+    default_threshold = 0.85
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = text.split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        padded = f" {text} "
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class OpenAIEmbedder:
+    """Embeds text with the OpenAI embeddings API; call_upstream wraps the request (e.g. the governor)."""
+
+    default_threshold = 0.9
+
+    def __init__(self, get_client: Callable, call_upstream: Callable,
+                 model: str = 'text-embedding-3-small'):
+        self.get_client = get_client
+        self.call_upstream = call_upstream
+        self.model = model
+
+    def embed(self, text: str) -> np.ndarray:
+        client = self.get_client()
+        if not client:
+            raise ValueError("OpenAI client is not initialized")
+        response = self.call_upstream(
+            lambda: client.embeddings.create(model=self.model, input=text))
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Ring buffer of unit vectors with per-entry expiry, grown by doubling up
+    to max_entries. A lookup is one matrix-vector product over the entries.
+    """
+
+    def __init__(self, dim: int, max_entries: int, initial_capacity: int = 32):
+        capacity = min(initial_capacity, max_entries)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.values: List[Optional[str]] = [None] * capacity
+        self.max_entries = max_entries
+        self.size = 0
+        self.next = 0
+
+    def _grow(self) -> None:
+        capacity = min(self.vectors.shape[0] * 2, self.max_entries)
+        self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+        self.expires_at = np.resize(self.expires_at, capacity)
+        self.values.extend([None] * (capacity - len(self.values)))
+
+    def add(self, vector: np.ndarray, value: str, expires_at: float) -> None:
+        if self.size == self.vectors.shape[0] and self.size < self.max_entries:
+            self._grow()
+        slot = self.next
+        self.vectors[slot] = vector
+        self.expires_at[slot] = expires_at
+        self.values[slot] = value
+        self.size = min(self.size + 1, self.vectors.shape[0])
+        self.next = (slot + 1) % self.vectors.shape[0] if self.size == self.max_entries else self.size
+
+    def search(self, vector: np.ndarray, now: float) -> Tuple[Optional[str], float]:
+        """Return the closest live value and its cosine similarity."""
+        if not self.size:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        scores[self.expires_at[:self.size] <= now] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return None, 0.0
+        return self.values[best], float(scores[best])
+
+
+class SemanticCache:
+    """
+    Answers keyed by meaning rather than exact text. Entries are partitioned
+    (e.g. by system prompt and user context) so answers never cross contexts.
+    """
+
+    def __init__(self, embedder, threshold: Optional[float] = None,
+                 ttl: float = 86400, max_entries: int = 1024, max_partitions: int = 256):
+        self.embedder = embedder
+        self.threshold = threshold if threshold is not None else embedder.default_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_partitions = max_partitions
+        self._partitions: Dict[str, VectorIndex] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def partition_key(*parts: Optional[str]) -> str:
+        return hashlib.sha256('\x1f'.join(p or '' for p in parts).encode('utf-8')).hexdigest()
+
+    def embed(self, message: str) -> Optional[np.ndarray]:
+        try:
+            return self.embedder.embed(normalize_message(message))
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    def lookup(self, message: str, partition: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached answer or None, embedding of the message for a later put)."""
+        vector = self.embed(message)
+        if vector is None:
+            return None, None
+        with self._lock:
+            index = self._partitions.get(partition)
+            value, score = index.search(vector, time.time()) if index else (None, 0.0)
+            if value is not None and score >= self.threshold:
+                self.hits += 1
+                return value, vector
+            self.misses += 1
+        return None, vector
+
+    def put(self, partition: str, vector: Optional[np.ndarray], answer: str) -> None:
+        if vector is None:
+            return
+        with self._lock:
+            index = self._partitions.get(partition)
+            if index is None:
+                if len(self._partitions) >= self.max_partitions:
+                    # Drop the oldest partition (dicts keep insertion order)
+                    self._partitions.pop(next(iter(self._partitions)))
+                index = VectorIndex(vector.shape[0], self.max_entries)
+                self._partitions[partition] = index
+            index.add(vector, answer, time.time() + self.ttl)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
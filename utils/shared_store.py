@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Number = Union[int, float]
+
+
+class InMemoryStore:
+    """
+    Process-local key/value store with per-key expiry.
+    Mirrors the small subset of Redis used by the limiters and caches, so it
+    doubles as a stand-in for Redis in development and tests.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[object, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[object]:
+        with self._lock:
+            entry = self._live(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: object, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            expires_at = time.time() + ttl if ttl else None
+            self._data[key] = (value, expires_at)
+
+    def incr(self, key: str, amount: Number = 1, ttl: Optional[float] = None) -> Number:
+        """Add amount to a counter, setting the expiry when the key is created."""
+        with self._lock:
+            now = time.time()
+            entry = self._live(key, now)
+            if entry is None:
+                expires_at = now + ttl if ttl else None
+                value = amount
+            else:
+                value = entry[0] + amount
+                expires_at = entry[1]
+            self._data[key] = (value, expires_at)
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisStore:
+    """Key/value store backed by Redis, shared by every worker process."""
+
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed when REDIS_URL is set
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[object]:
+        value = self._client.get(key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key: str, value: object, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self._client.set(key, value, px=int(ttl * 1000))
+        else:
+            self._client.set(key, value)
+
+    def incr(self, key: str, amount: Number = 1, ttl: Optional[float] = None) -> Number:
+        pipe = self._client.pipeline()
+        if isinstance(amount, float):
+            pipe.incrbyfloat(key, amount)
+        else:
+            pipe.incrby(key, amount)
+        if ttl:
+            # NX keeps the expiry of an existing window instead of extending it
+            pipe.pexpire(key, int(ttl * 1000), nx=True)
+        value = pipe.execute()[0]
+        return float(value) if isinstance(value, (bytes, str)) else value
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+
+_shared_store = None
+_shared_store_loaded = False
+
+
+def get_shared_store():
+    """
+    Return the store shared across worker processes, or None when not configured.
+    REDIS_URL selects Redis; REDIS_URL=memory:// selects the in-memory stand-in.
+    """
+    global _shared_store, _shared_store_loaded
+    if _shared_store_loaded:
+        return _shared_store
+
+    url = os.environ.get('REDIS_URL')
+    if url == 'memory://':
+        _shared_store = InMemoryStore()
+    elif url:
+        try:
+            _shared_store = RedisStore(url)
+        except Exception as e:
+            logger.error(f"Failed to connect shared store, using process-local limits: {str(e)}")
+            _shared_store = None
+    _shared_store_loaded = True
+    return _shared_store
@@ -0,0 +1,70 @@
+import os
+import hashlib
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+
+from flask import request
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class StaticAssets:
+    """
+    Content-hashed static URLs: url_for('static', filename=...) gets a ?v=
+    parameter derived from the file contents, and requests carrying the
+    current hash are served with a far-future immutable Cache-Control.
+    Editing a file changes its URL, so browsers never see a stale copy.
+    """
+
+    def __init__(self, app=None, hash_length: int = 12):
+        self.hash_length = hash_length
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.static_folder = app.static_folder
+        app.url_defaults(self._add_fingerprint)
+        app.after_request(self._cache_headers)
+
+    def fingerprint(self, filename: str) -> Optional[str]:
+        """Hash of the file's contents, recomputed only when its mtime or size changes."""
+        path = safe_join(self.static_folder, filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()[:self.hash_length]
+        with self._lock:
+            self._hashes[path] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+        return fingerprint
+
+    def _add_fingerprint(self, endpoint, values) -> None:
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = self.fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    def _cache_headers(self, response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        version = request.args.get('v')
+        if version and version == self.fingerprint(request.view_args.get('filename', '')):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
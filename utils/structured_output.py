@@ -0,0 +1,155 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OFF = 'off'
+JSON_OBJECT = 'json_object'
+JSON_SCHEMA = 'json_schema'
+MODES = (OFF, JSON_OBJECT, JSON_SCHEMA)
+
+TRAVEL_TYPES = ["cultural", "adventure", "relaxation", "family", "business"]
+
+# Log the counters every this many completions
+STATS_LOG_INTERVAL = 100
+
+
+def _strict_object(properties: Dict) -> Dict:
+    return {"type": "object", "properties": properties, "required": list(properties),
+            "additionalProperties": False}
+
+
+# Strict schemas cannot have free-form keys, so the itinerary is a list of days (day 1 first)
+TRIP_SUGGESTION_SCHEMA = _strict_object({
+    "destination": {"type": "string"},
+    "suggested_duration": {"type": "integer"},
+    "travel_type": {"type": "string", "enum": TRAVEL_TYPES},
+    "recommended_group_size": {"type": "string", "description": "X-Y"},
+    "itinerary": {
+        "type": "array",
+        "description": "One entry per day: the morning, afternoon and evening activity",
+        "items": {"type": "array", "items": {"type": "string"}}
+    }
+})
+TRIP_SUGGESTIONS_SCHEMA = _strict_object({
+    "suggestions": {"type": "array", "items": TRIP_SUGGESTION_SCHEMA}
+})
+DAY_SCHEMA = _strict_object({"activities": {"type": "array", "items": {"type": "string"}}})
+ACTIVITY_SCHEMA = _strict_object({"activity": {"type": "string"}})
+
+# JSON mode only returns objects, so several suggestions come wrapped
+SUGGESTIONS_INSTRUCTION = 'Wrap the suggestions in a JSON object: {"suggestions": [...]}.'
+
+
+def format_kwargs(response_format: Optional[Dict]) -> Dict:
+    """Keyword arguments for chat.completions.create; none when structured output is not used."""
+    return {"response_format": response_format} if response_format else {}
+
+
+def unwrap_suggestions(data: Any) -> Any:
+    """
+    Trip suggestions in the shape the free-text prompts produce: the
+    {"suggestions": [...]} wrapper removed and list itineraries turned into
+    {"1": [...], "2": [...]}.
+    """
+    if isinstance(data, dict) and isinstance(data.get("suggestions"), list):
+        data = data["suggestions"]
+    for suggestion in data if isinstance(data, list) else [data]:
+        if isinstance(suggestion, dict) and isinstance(suggestion.get("itinerary"), list):
+            suggestion["itinerary"] = {str(day): activities
+                                       for day, activities in enumerate(suggestion["itinerary"], 1)}
+    return data
+
+
+def _is_unsupported(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 400 and 'response_format' in str(error)
+
+
+class StructuredOutput:
+    """
+    Opt-in structured outputs for OpenAI calls. In json_object mode the API
+    returns valid JSON, in json_schema mode JSON matching the given schema,
+    so a completion parses and validates in one pass instead of being dug out
+    of markdown and retried. Models that reject response_format are
+    remembered and served free text for the existing parsers.
+    """
+
+    def __init__(self, mode: str = OFF):
+        if mode not in MODES:
+            logger.warning(f"Unknown structured output mode {mode!r}, using {OFF!r}")
+            mode = OFF
+        self.mode = mode
+        self._unsupported = set()
+        self._lock = threading.Lock()
+        self.structured_completions = 0
+        self.structured_failures = 0
+        self.text_completions = 0
+        self.text_failures = 0
+        self.fallbacks = 0
+
+    def response_format(self, model: str, name: str, schema: Dict) -> Optional[Dict]:
+        """The response_format to request from model, or None for free text."""
+        if self.mode == OFF or model in self._unsupported:
+            return None
+        if self.mode == JSON_OBJECT:
+            return {"type": "json_object"}
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+    def create(self, call: Callable[[Optional[Dict]], Any], model: str, name: str,
+               schema: Dict) -> Tuple[Any, bool]:
+        """
+        call(response_format) structured where enabled, repeated as free text
+        (call(None)) if the model does not support it. Returns the response
+        and whether it is structured.
+        """
+        response_format = self.response_format(model, name, schema)
+        if response_format is None:
+            return call(None), False
+        try:
+            return call(response_format), True
+        except Exception as e:
+            if not _is_unsupported(e):
+                raise
+            with self._lock:
+                self._unsupported.add(model)
+                self.fallbacks += 1
+            logger.warning(f"{model} does not support structured output, using free text: {str(e)}")
+            return call(None), False
+
+    def record(self, structured: bool, ok: bool) -> None:
+        """Count a completion and whether it could be used or had to be thrown away."""
+        with self._lock:
+            if structured:
+                self.structured_completions += 1
+                self.structured_failures += not ok
+            else:
+                self.text_completions += 1
+                self.text_failures += not ok
+            total = self.structured_completions + self.text_completions
+        if total % STATS_LOG_INTERVAL == 0:
+            logger.info(f"Structured output stats: {self.stats()}")
+
+    @property
+    def retries_avoided(self) -> int:
+        """
+        Estimated completions saved: structured completions times the share
+        of free-text completions that had to be retried, less the structured
+        ones that failed anyway.
+        """
+        if not self.text_completions:
+            return 0
+        failure_rate = self.text_failures / self.text_completions
+        return max(0, round(self.structured_completions * failure_rate) - self.structured_failures)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "structured_completions": self.structured_completions,
+            "structured_failures": self.structured_failures,
+            "text_completions": self.text_completions,
+            "text_failures": self.text_failures,
+            "fallbacks": self.fallbacks,
+            "retries_avoided": self.retries_avoided,
+            "unsupported_models": sorted(self._unsupported)
+        }
@@ -0,0 +1,112 @@
+import math
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency: token counts are estimated from characters instead
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Log the counters every this many recorded completions
+STATS_LOG_INTERVAL = 100
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def count_tokens(text: str, model: str = 'gpt-4o') -> int:
+    """Tokens of text for model, via tiktoken when it is installed (about 4 characters per token otherwise)."""
+    if tiktoken is None:
+        return len(text) // 4
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+class TokenBudget:
+    """
+    max_tokens for completions whose size grows with a number of units (e.g.
+    itinerary days times suggestions). Starts from tokens_per_unit and, once
+    enough completions were seen, follows the 95th percentile of the tokens
+    per unit they actually used, plus headroom. A truncated completion sets a
+    floor above what it was given for the next window completions, so the
+    budget grows after it however many small completions follow.
+    """
+
+    def __init__(self, name: str, tokens_per_unit: float, base_tokens: int = 0,
+                 headroom: float = 1.25, min_tokens: int = 256, max_tokens: int = 16384,
+                 min_samples: int = 20, window: int = 200):
+        self.name = name
+        self.tokens_per_unit = tokens_per_unit
+        self.base_tokens = base_tokens
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.max_tokens_limit = max_tokens
+        self.min_samples = min_samples
+        self.window = window
+        self._samples = deque(maxlen=window)
+        # (completion number, tokens per unit) of recent truncations
+        self._truncations = deque()
+        self._lock = threading.Lock()
+        self.completions = 0
+        self.truncations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def per_unit(self) -> float:
+        """Tokens budgeted per unit: the configured value until min_samples completions were recorded."""
+        with self._lock:
+            while self._truncations and self._truncations[0][0] <= self.completions - self.window:
+                self._truncations.popleft()
+            floor = max((need for _, need in self._truncations), default=0.0)
+            if len(self._samples) < self.min_samples:
+                return max(self.tokens_per_unit, floor)
+            samples = sorted(self._samples)
+        return max(floor, samples[min(len(samples) - 1, int(len(samples) * 0.95))])
+
+    def max_tokens(self, units: int) -> int:
+        budget = math.ceil((self.base_tokens + self.per_unit() * units) * self.headroom)
+        return max(self.min_tokens, min(self.max_tokens_limit, budget))
+
+    def record(self, units: int, response: Any, max_tokens: int) -> None:
+        """Learn from the usage the provider reported for a completion given max_tokens."""
+        usage = getattr(response, 'usage', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if completion_tokens is None or units < 1:
+            return
+        choices = getattr(response, 'choices', None) or []
+        truncated = bool(choices) and getattr(choices[0], 'finish_reason', None) == 'length'
+        used = max(0, completion_tokens - self.base_tokens) / units
+        if truncated:
+            # The real need is unknown, only that it exceeded the budget
+            used *= 1.5
+            logger.warning(f"{self.name} completion truncated at {max_tokens} tokens for {units} units")
+        with self._lock:
+            self._samples.append(used)
+            self.completions += 1
+            self.truncations += truncated
+            if truncated:
+                self._truncations.append((self.completions, used))
+            self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+            self.completion_tokens += completion_tokens
+            completions = self.completions
+        if completions % STATS_LOG_INTERVAL == 0:
+            logger.info(f"Token budget stats: {self.stats()}")
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "completions": self.completions,
+            "truncations": self.truncations,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_unit": round(self.per_unit(), 1)
+        }
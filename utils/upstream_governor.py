@@ -0,0 +1,318 @@
+import os
+import time
+import random
+import threading
+import logging
+from typing import Any, Callable, List, Optional
+
+from utils.shared_store import get_shared_store
+from utils.token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream call could not be completed within the retry policy."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised when the upstream circuit is open and calls are short-circuited."""
+
+
+class UpstreamThrottledError(UpstreamError):
+    """Raised when no request/token budget became available in time."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Take amount tokens. Returns 0 on success, otherwise the seconds to wait."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Return (or, with a negative amount, additionally charge) tokens."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single probe through after reset_timeout."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._probe_thread: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            self._probe_thread = threading.get_ident()
+            return True
+
+    def release_probe(self) -> None:
+        """Give up this thread's probe without an outcome, so another call can probe instead."""
+        with self._lock:
+            if self._probe_in_flight and self._probe_thread == threading.get_ident():
+                self._probe_in_flight = False
+                self._probe_thread = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning("Upstream circuit opened after repeated failures")
+                self.opened_at = time.monotonic()
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and connection errors are worth retrying."""
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    name = type(error).__name__
+    return name in ('APIConnectionError', 'APITimeoutError') or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After delay (in seconds) the provider sent with an error, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class UpstreamGovernor:
+    """
+    Shared gate in front of every OpenAI call.
+    Enforces requests- and tokens-per-minute budgets, bounds concurrency,
+    retries throttled calls with jittered exponential backoff (honoring
+    Retry-After) and trips a circuit breaker when the provider keeps failing.
+    """
+
+    def __init__(self,
+                 requests_per_minute: float = 500,
+                 tokens_per_minute: float = 30000,
+                 max_concurrency: int = 8,
+                 max_retries: int = 3,
+                 base_delay: float = 1.0,
+                 max_delay: float = 20.0,
+                 acquire_timeout: float = 30.0,
+                 breaker: Optional[CircuitBreaker] = None,
+                 shared_store=None,
+                 name: str = 'openai'):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.acquire_timeout = acquire_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.shared_store = shared_store
+        self.name = name
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._usage_listeners: List[Callable[[int], None]] = []
+
+    def add_usage_listener(self, listener: Callable[[int], None]) -> None:
+        """Register a callback receiving total_tokens of every completed call."""
+        self._usage_listeners.append(listener)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _shared_wait(self, tokens: float) -> float:
+        """Charge the cross-process per-minute windows; returns the seconds to wait if over budget."""
+        if not self.shared_store:
+            return 0.0
+        window = int(time.time() // 60)
+        try:
+            used_requests = self.shared_store.incr(f"{self.name}:rpm:{window}", 1, ttl=120)
+            used_tokens = self.shared_store.incr(f"{self.name}:tpm:{window}", int(tokens), ttl=120)
+        except Exception as e:
+            logger.warning(f"Shared rate limit store unavailable: {str(e)}")
+            return 0.0
+        if used_requests > self.requests_per_minute or used_tokens > self.tokens_per_minute:
+            self.shared_store.incr(f"{self.name}:rpm:{window}", -1, ttl=120)
+            self.shared_store.incr(f"{self.name}:tpm:{window}", -int(tokens), ttl=120)
+            return (window + 1) * 60 - time.time()
+        return 0.0
+
+    def _acquire(self, tokens: float, deadline: float) -> None:
+        while True:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if not wait:
+                wait = self.request_bucket.try_acquire(1)
+                if not wait:
+                    wait = self.token_bucket.try_acquire(tokens)
+                    if wait:
+                        self.request_bucket.refund(1)
+                    else:
+                        wait = self._shared_wait(tokens)
+                        if not wait:
+                            return
+                        self.request_bucket.refund(1)
+                        self.token_bucket.refund(tokens)
+            if now + wait > deadline:
+                raise UpstreamThrottledError(f"{self.name} budget exhausted, retry in {wait:.1f}s")
+            time.sleep(wait)
+
+    def _settle(self, estimated_tokens: float, response: Any) -> None:
+        """Correct the token budget with the usage the provider actually reported."""
+        usage = getattr(response, 'usage', None)
+        used = getattr(usage, 'total_tokens', None)
+        if used is None:
+            return
+        self.token_bucket.refund(estimated_tokens - used)
+        for listener in self._usage_listeners:
+            try:
+                listener(used)
+            except Exception as e:
+                logger.error(f"Usage listener failed: {str(e)}")
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: float = 0) -> Any:
+        """
+        Run fn under the governor's budgets and retry policy.
+        Raises CircuitOpenError when the circuit is open, UpstreamThrottledError
+        when no budget is available in time and UpstreamError once retries
+        are exhausted. Non-retryable errors from fn propagate unchanged.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+
+        try:
+            deadline = time.monotonic() + self.acquire_timeout
+            last_error = None
+            for attempt in range(self.max_retries):
+                self._acquire(estimated_tokens, deadline)
+                if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    self.request_bucket.refund(1)
+                    self.token_bucket.refund(estimated_tokens)
+                    raise UpstreamThrottledError(f"Too many concurrent {self.name} calls")
+                try:
+                    response = fn()
+                except Exception as e:
+                    last_error = e
+                    if not is_retryable(e):
+                        # Client errors say nothing about upstream health
+                        self.breaker.record_success()
+                        raise
+                    self.breaker.record_failure()
+                    retry_after = get_retry_after(e)
+                    if retry_after:
+                        # Every caller in this process backs off, not just this one
+                        with self._lock:
+                            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+                    delay = retry_after or self._backoff(attempt)
+                    logger.warning(f"Retry {attempt + 1} after error: {str(e)} (waiting {delay:.1f}s)")
+                    if attempt == self.max_retries - 1:
+                        break
+                    if not self.breaker.allow():
+                        raise CircuitOpenError(f"{self.name} is temporarily unavailable") from e
+                    if time.monotonic() + delay > deadline:
+                        raise UpstreamThrottledError(f"{self.name} still throttled after {attempt + 1} attempts") from e
+                    if not retry_after:
+                        time.sleep(delay)
+                    continue
+                finally:
+                    self._semaphore.release()
+
+                self.breaker.record_success()
+                self._settle(estimated_tokens, response)
+                return response
+
+            raise UpstreamError(f"Failed to get response after {self.max_retries} attempts: {str(last_error)}")
+        finally:
+            # A probe that never reached fn (throttled, no free slot) must not keep the circuit shut
+            self.breaker.release_probe()
+
+
+def estimate_tokens(text: str, max_tokens: int = 0) -> int:
+    """Upper bound of prompt plus completion tokens; the prompt is counted locally."""
+    return count_tokens(text) + max_tokens
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_openai_governor() -> UpstreamGovernor:
+    """Return the process-wide governor for OpenAI calls, configured from the environment."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = UpstreamGovernor(
+                requests_per_minute=float(os.environ.get('OPENAI_REQUESTS_PER_MINUTE', 500)),
+                tokens_per_minute=float(os.environ.get('OPENAI_TOKENS_PER_MINUTE', 30000)),
+                max_concurrency=int(os.environ.get('OPENAI_MAX_CONCURRENCY', 8)),
+                max_retries=int(os.environ.get('OPENAI_MAX_RETRIES', 3)),
+                acquire_timeout=float(os.environ.get('OPENAI_ACQUIRE_TIMEOUT', 30)),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.environ.get('OPENAI_CIRCUIT_FAILURES', 5)),
+                    reset_timeout=float(os.environ.get('OPENAI_CIRCUIT_RESET_SECONDS', 30))),
+                shared_store=get_shared_store())
+        return _governor
@@ -0,0 +1,161 @@
+import os
+import math
+import time
+import logging
+from functools import wraps
+from typing import Optional
+
+from flask import g, has_request_context, jsonify, make_response, request
+from flask_login import current_user
+
+from utils.shared_store import InMemoryStore, get_shared_store
+from utils.upstream_governor import get_openai_governor
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter: two fixed-window counters per user, with the
+    previous window weighted by how much of it still overlaps the sliding
+    window. Constant memory per user and works on any store with incr/get.
+    """
+
+    def __init__(self, name: str, limit: float, window_seconds: int, store):
+        self.name = name
+        self.limit = limit
+        self.window = window_seconds
+        self.store = store
+
+    def _key(self, user_id, window_index: int) -> str:
+        return f"quota:{self.name}:{user_id}:{window_index}"
+
+    def _counts(self, user_id, now: float):
+        index = int(now // self.window)
+        current = float(self.store.get(self._key(user_id, index)) or 0)
+        previous = float(self.store.get(self._key(user_id, index - 1)) or 0)
+        elapsed = now - index * self.window
+        return index, current, previous, elapsed
+
+    def usage(self, user_id, now: Optional[float] = None) -> float:
+        """Estimated amount used in the sliding window ending at now."""
+        now = now or time.time()
+        _, current, previous, elapsed = self._counts(user_id, now)
+        return previous * (1 - elapsed / self.window) + current
+
+    def retry_after(self, user_id, cost: float = 1, now: Optional[float] = None) -> float:
+        """Seconds until cost more would fit in the window; 0 when it fits now."""
+        now = now or time.time()
+        _, current, previous, elapsed = self._counts(user_id, now)
+        return self._wait(current, previous, elapsed, cost)
+
+    def _wait(self, current: float, previous: float, elapsed: float, cost: float) -> float:
+        excess = previous * (1 - elapsed / self.window) + current + cost - self.limit
+        if excess <= 0:
+            return 0.0
+        if current + cost > self.limit:
+            # Wait for the rollover, then for the current count to decay as the previous window
+            decay = self.window * (1 - (self.limit - cost) / current) if current else 0.0
+            return self.window - elapsed + max(0.0, decay)
+        # The previous window's weight decays linearly over the current window
+        return excess / previous * self.window
+
+    def add(self, user_id, amount: float = 1, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        index = int(now // self.window)
+        self.store.incr(self._key(user_id, index), amount, ttl=self.window * 2)
+
+    def try_add(self, user_id, amount: float = 1, now: Optional[float] = None) -> float:
+        """
+        Add amount if it fits in the window. Returns 0 when added, otherwise
+        the Retry-After in seconds (nothing is counted). The amount is added
+        first and taken back when over the limit, so concurrent calls from
+        several workers see each other and cannot all slip under it.
+        """
+        now = now or time.time()
+        index = int(now // self.window)
+        key = self._key(user_id, index)
+        previous = float(self.store.get(self._key(user_id, index - 1)) or 0)
+        # incr is atomic, so the count it returns is this call's place in line: the first
+        # calls to fit are admitted however many arrive at once
+        current = float(self.store.incr(key, amount, ttl=self.window * 2)) - amount
+        wait = self._wait(current, previous, now - index * self.window, amount)
+        if wait:
+            self.store.incr(key, -amount, ttl=self.window * 2)
+        return wait
+
+
+class UserQuota:
+    """Per-user request and token quotas for the AI endpoints."""
+
+    def __init__(self, requests_per_window: float, request_window: int,
+                 tokens_per_window: float, token_window: int, store=None):
+        store = store or InMemoryStore()
+        self.requests = SlidingWindowLimiter('req', requests_per_window, request_window, store)
+        self.tokens = SlidingWindowLimiter('tok', tokens_per_window, token_window, store)
+
+    def acquire(self, user_id) -> float:
+        """
+        Count one AI request for the user.
+        Returns 0 when allowed, otherwise the Retry-After in seconds (nothing is counted).
+        """
+        now = time.time()
+        # Tokens are only known after the call, so their quota can be checked but not reserved
+        wait = self.tokens.retry_after(user_id, 0, now)
+        if wait:
+            return wait
+        return self.requests.try_add(user_id, 1, now)
+
+    def record_tokens(self, user_id, tokens: int) -> None:
+        self.tokens.add(user_id, tokens)
+
+
+user_quota = UserQuota(
+    requests_per_window=float(os.environ.get('AI_USER_REQUESTS_PER_MINUTE', 10)),
+    request_window=60,
+    tokens_per_window=float(os.environ.get('AI_USER_TOKENS_PER_HOUR', 60000)),
+    token_window=3600,
+    store=get_shared_store())
+
+
+def _charge_current_user(total_tokens: int) -> None:
+    """Governor usage listener: bill the tokens to the user who triggered the call."""
+    if has_request_context() and getattr(g, 'ai_quota_user_id', None) is not None:
+        user_quota.record_tokens(g.ai_quota_user_id, total_tokens)
+
+
+get_openai_governor().add_usage_listener(_charge_current_user)
+
+
+def check_ai_quota() -> float:
+    """
+    Count an AI request for the current user and attribute its token usage to them.
+    Returns 0 when allowed, otherwise the number of seconds to wait.
+    """
+    wait = user_quota.acquire(current_user.id)
+    if wait:
+        logger.info(f"AI quota exceeded for user {current_user.id}, retry in {wait:.0f}s")
+        return wait
+    g.ai_quota_user_id = current_user.id
+    return 0.0
+
+
+def quota_exceeded_response(retry_after: float):
+    response = make_response(jsonify({
+        'error': 'AI request limit reached. Please wait before trying again.',
+        'retry_after': math.ceil(retry_after)
+    }), 429)
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def ai_rate_limited(f):
+    """Reject AI calls over the per-user quota with 429 and Retry-After. Use after login_required."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'POST':
+            retry_after = check_ai_quota()
+            if retry_after:
+                return quota_exceeded_response(retry_after)
+        return f(*args, **kwargs)
+    return decorated_function
@@ -1,105 +1,248 @@
 import os
+import time
 import requests
+import numpy as np
 from typing import Dict, List, Optional, Union
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from weather_alerts import WeatherAlertService
+from utils.cache import SingleFlight, TTLCache
 
 logger = logging.getLogger(__name__)
 
+SECONDS_PER_DAY = 86400
+EPOCH = date(1970, 1, 1)
+
+
+def aggregate_daily_forecast(data: Dict, start: Optional[date] = None,
+                             days: int = 5) -> List[Dict]:
+    """
+    Aggregate a 3-hourly OpenWeatherMap forecast into per-day summaries.
+
+    The forecast list is converted to columnar arrays once and bucketed by
+    local date using the city's UTC offset. Per day it reports min/max/mean
+    temperature, the highest precipitation probability and the most frequent
+    condition, plus the 3-hour slots in local time.
+    """
+    items = data.get('list') or []
+    if not items:
+        return []
+
+    tz_offset = int((data.get('city') or {}).get('timezone') or 0)
+    n = len(items)
+    dt = np.fromiter((item['dt'] for item in items), dtype=np.int64, count=n)
+    order = np.argsort(dt, kind='stable')
+    dt = dt[order]
+    mains = [items[i]['main'] for i in order]
+    temp = np.fromiter((m['temp'] for m in mains), dtype=np.float64, count=n)
+    temp_min = np.fromiter((m.get('temp_min', m['temp']) for m in mains), dtype=np.float64, count=n)
+    temp_max = np.fromiter((m.get('temp_max', m['temp']) for m in mains), dtype=np.float64, count=n)
+    pop = np.fromiter((items[i].get('pop', 0) for i in order), dtype=np.float64, count=n) * 100
+    condition_names, condition_idx = np.unique(
+        np.array([(items[i].get('weather') or [{}])[0].get('main', 'Unknown') for i in order]),
+        return_inverse=True)
+
+    # Bucket slots by local calendar day (days since epoch in the city's timezone)
+    local = dt + tz_offset
+    day_number = local // SECONDS_PER_DAY
+    if start is None:
+        start_day = (int(time.time()) + tz_offset) // SECONDS_PER_DAY
+    else:
+        start_day = (start - EPOCH).days
+    selected = np.flatnonzero(day_number >= start_day)
+    if not selected.size:
+        return []
+    unique_days, day_idx = np.unique(day_number[selected], return_inverse=True)
+    keep = day_idx < days
+    selected, day_idx = selected[keep], day_idx[keep]
+    unique_days = unique_days[:days]
+    num_days = len(unique_days)
+
+    # Slots are sorted by time, so each day is a contiguous run
+    run_starts = np.flatnonzero(np.r_[True, np.diff(day_idx) != 0])
+    day_min = np.minimum.reduceat(temp_min[selected], run_starts)
+    day_max = np.maximum.reduceat(temp_max[selected], run_starts)
+    day_mean = np.bincount(day_idx, weights=temp[selected], minlength=num_days) / \
+        np.bincount(day_idx, minlength=num_days)
+    day_pop = np.maximum.reduceat(pop[selected], run_starts)
+    num_conditions = len(condition_names)
+    condition_counts = np.bincount(
+        day_idx * num_conditions + condition_idx[selected],
+        minlength=num_days * num_conditions).reshape(num_days, num_conditions)
+    dominant = condition_counts.argmax(axis=1)
+
+    seconds_of_day = local[selected] % SECONDS_PER_DAY
+    hours = seconds_of_day // 3600
+    minutes = (seconds_of_day % 3600) // 60
+    run_ends = np.r_[run_starts[1:], len(selected)]
+
+    weather_data = []
+    for d in range(num_days):
+        hourly = [{
+            'time': f"{hours[j]:02d}:{minutes[j]:02d}",
+            'dt': int(dt[selected[j]]),
+            'temperature': float(temp[selected[j]]),
+            'condition': str(condition_names[condition_idx[selected[j]]]),
+            'precipitation': round(float(pop[selected[j]]))
+        } for j in range(run_starts[d], run_ends[d])]
+        weather_data.append({
+            'date': (EPOCH + timedelta(days=int(unique_days[d]))).isoformat(),
+            'temperature': round(float(day_mean[d]), 1),
+            'temp_min': round(float(day_min[d]), 1),
+            'temp_max': round(float(day_max[d]), 1),
+            'temp_mean': round(float(day_mean[d]), 1),
+            'condition': str(condition_names[dominant[d]]),
+            'precipitation': round(float(day_pop[d])),
+            'hourly': hourly
+        })
+    return weather_data
+
+
+# Shared by every WeatherAPI instance in the process
+_geocode_cache = TTLCache(maxsize=4096, ttl=24 * 3600)
+_forecast_cache = TTLCache(maxsize=1024, ttl=600)
+_forecast_flight = SingleFlight()
+
+
+def validate_forecast_request(num_days: Optional[int] = None, start_date: Optional[str] = None,
+                              end_date: Optional[str] = None) -> Optional[str]:
+    """Return an error message for an invalid day count or date range, None when valid."""
+    if num_days is not None and (num_days < 1 or num_days > 14):
+        return 'Number of days must be between 1 and 14'
+    if start_date and end_date:
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d')
+            end = datetime.strptime(end_date, '%Y-%m-%d')
+        except ValueError:
+            return 'Invalid date format'
+        if end < start:
+            return 'End date must be after start date'
+        if (end - start).days > 14:
+            return 'Date range cannot exceed 14 days'
+    return None
+
+
+class LocationNotFoundError(ValueError):
+    """OpenWeatherMap does not know the location."""
+
+
+def error_status(error: Exception) -> int:
+    """HTTP status for a failed forecast: 404 for an unknown location, 503 when OpenWeatherMap rejects our key, 502 otherwise."""
+    if isinstance(error, LocationNotFoundError):
+        return 404
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status in (401, 403, 429):
+        return 503
+    return 502
+
+
 class WeatherAPI:
     BASE_URL = "http://api.openweathermap.org/data/2.5"
+    BATCH_MAX_WORKERS = 4
     
     def __init__(self):
         self.api_key = os.environ.get('OPENWEATHERMAP_API_KEY')
         if not self.api_key:
             raise ValueError("OpenWeatherMap API key not configured")
+        self.alert_service = WeatherAlertService(self.api_key)
 
     def validate_location(self, location: str) -> Optional[Dict]:
-        """Validate location exists and return coordinates."""
+        """Validate location exists and return coordinates (cached per location name)."""
+        key = ' '.join(location.lower().split())
+        cached = _geocode_cache.get(key)
+        if cached is not None:
+            return cached
+
         try:
             params = {
                 'q': location,
                 'appid': self.api_key,
                 'limit': 1
             }
-            response = requests.get(f"{self.BASE_URL}/weather", params=params)
+            response = requests.get(f"{self.BASE_URL}/weather", params=params, timeout=10)
+            if response.status_code == 404:
+                return None
             response.raise_for_status()
             data = response.json()
             
-            return {
+            location_data = {
                 'lat': data['coord']['lat'],
                 'lon': data['coord']['lon'],
                 'name': data['name'],
                 'country': data.get('sys', {}).get('country', '')
             }
+            _geocode_cache.set(key, location_data)
+            return location_data
         except requests.exceptions.RequestException as e:
+            # An outage is not an unknown location; let the caller report it as such
             logger.error(f"Error validating location: {str(e)}")
-            return None
+            raise
 
-    def get_weather_data(self, location: str, num_days: Optional[int] = None,
-                        start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
-        """Get weather forecast for a location."""
-        try:
-            # First validate the location
-            location_data = self.validate_location(location)
-            if not location_data:
-                raise ValueError(f"Invalid location: {location}")
-
-            # Determine date range
-            if start_date and end_date:
-                start = datetime.strptime(start_date, '%Y-%m-%d')
-                end = datetime.strptime(end_date, '%Y-%m-%d')
-                days = (end - start).days + 1
-            else:
-                days = min(num_days or 5, 14)  # Default to 5 days, max 14
-                start = datetime.now()
+    def get_forecast_data(self, lat: float, lon: float) -> Dict:
+        """Raw 5-day/3-hour forecast for coordinates, cached and fetched once under concurrency."""
+        key = f"{round(lat, 2)}:{round(lon, 2)}"
 
+        def fetch() -> Dict:
+            cached = _forecast_cache.get(key)
+            if cached is not None:
+                return cached
             params = {
-                'lat': location_data['lat'],
-                'lon': location_data['lon'],
+                'lat': lat,
+                'lon': lon,
                 'appid': self.api_key,
                 'units': 'imperial',  # Use imperial units (Fahrenheit)
                 'exclude': 'minutely,alerts'
             }
-
-            response = requests.get(f"{self.BASE_URL}/forecast", params=params)
+            response = requests.get(f"{self.BASE_URL}/forecast", params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
+            _forecast_cache.set(key, data)
+            return data
 
-            # Process and format the weather data
-            weather_data = []
-            current_date = start.date()
-            
-            # Group forecast data by day
-            daily_data = {}
-            for item in data['list']:
-                forecast_time = datetime.fromtimestamp(item['dt'])
-                if forecast_time.date() < current_date or len(daily_data) >= days:
-                    continue
-                
-                date_str = forecast_time.strftime('%Y-%m-%d')
-                if date_str not in daily_data:
-                    daily_data[date_str] = {
-                        'date': date_str,
-                        'temperature': item['main']['temp'],
-                        'condition': item['weather'][0]['main'],
-                        'precipitation': item['pop'] * 100,  # Convert to percentage
-                        'hourly': []
-                    }
-                
-                # Add hourly data
-                daily_data[date_str]['hourly'].append({
-                    'time': forecast_time.strftime('%H:%M'),
-                    'temperature': item['main']['temp'],
-                    'condition': item['weather'][0]['main'],
-                    'precipitation': item['pop'] * 100
-                })
-
-            # Convert to list and sort by date
-            weather_data = list(daily_data.values())
-            weather_data.sort(key=lambda x: x['date'])
-
-            return weather_data
+        cached = _forecast_cache.get(key)
+        if cached is not None:
+            return cached
+        return _forecast_flight.do(key, fetch)
+
+    def _resolve_location(self, location: str, include_alerts: bool = True) -> Dict:
+        """Geocode a location and load its forecast (and alerts) from the caches or upstream."""
+        location_data = self.validate_location(location)
+        if not location_data:
+            raise LocationNotFoundError(f"Invalid location: {location}")
+        forecast = self.get_forecast_data(location_data['lat'], location_data['lon'])
+        alerts = self.alert_service.get_alerts(location_data['lat'], location_data['lon']) \
+            if include_alerts else None
+        return {'location': location_data, 'forecast': forecast, 'alerts': alerts}
+
+    @staticmethod
+    def _build_forecast(resolved: Dict, num_days: Optional[int] = None,
+                        start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        # Determine date range
+        if start_date and end_date:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date()
+            days = (end - start).days + 1
+        else:
+            days = min(num_days or 5, 14)  # Default to 5 days, max 14
+            start = None  # Today in the location's timezone
+
+        # Group forecast data by local day
+        weather_data = aggregate_daily_forecast(resolved['forecast'], start, days)
+
+        if resolved['alerts'] is not None:
+            WeatherAlertService.attach_alerts(weather_data, resolved['alerts'])
+        return weather_data
+
+    def get_weather_data(self, location: str, num_days: Optional[int] = None,
+                        start_date: Optional[str] = None, end_date: Optional[str] = None,
+                        include_alerts: bool = True) -> List[Dict]:
+        """Get weather forecast for a location, with active weather alerts attached."""
+        try:
+            resolved = self._resolve_location(location, include_alerts)
+            return self._build_forecast(resolved, num_days, start_date, end_date)
+        except LocationNotFoundError:
+            raise
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching weather data: {str(e)}")
@@ -107,3 +250,53 @@ class WeatherAPI:
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             raise ValueError(f"Unexpected error: {str(e)}")
+
+    def get_weather_batch(self, items: List[Dict], include_alerts: bool = True) -> List[Dict]:
+        """
+        Get forecasts for many (location, date range) requests at once.
+
+        Each item has 'location' and optionally 'num_days' or 'start_date'/'end_date'.
+        Distinct locations are resolved once each, concurrently with bounded
+        parallelism. Returns one result per item, in order, holding either
+        'forecast' or 'error' with the HTTP 'status' it maps to.
+        """
+        keys = [' '.join(str(item.get('location') or '').lower().split()) for item in items]
+        errors = []
+        for key, item in zip(keys, items):
+            if not key:
+                errors.append('Location is required')
+                continue
+            if item.get('num_days') is not None and not isinstance(item['num_days'], int):
+                errors.append('Invalid number of days')
+                continue
+            errors.append(validate_forecast_request(
+                item.get('num_days'), item.get('start_date'), item.get('end_date')))
+        unique = {key: item['location'] for key, item, error in zip(keys, items, errors) if not error}
+
+        resolved: Dict[str, Dict] = {}
+        if unique:
+            workers = min(self.BATCH_MAX_WORKERS, len(unique))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {key: executor.submit(self._resolve_location, location, include_alerts)
+                           for key, location in unique.items()}
+                for key, future in futures.items():
+                    try:
+                        resolved[key] = future.result()
+                    except Exception as e:
+                        logger.error(f"Error fetching weather data for {unique[key]}: {str(e)}")
+                        resolved[key] = {'error': str(e) or type(e).__name__, 'status': error_status(e)}
+
+        results = []
+        for key, item, error in zip(keys, items, errors):
+            result = {'location': item.get('location')}
+            status = 400
+            if not error and 'error' in resolved[key]:
+                error, status = resolved[key]['error'], resolved[key]['status']
+            if error:
+                result['error'] = error
+                result['status'] = status
+            else:
+                result['forecast'] = self._build_forecast(
+                    resolved[key], item.get('num_days'), item.get('start_date'), item.get('end_date'))
+            results.append(result)
+        return results
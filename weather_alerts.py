@@ -0,0 +1,141 @@
+import os
+import re
+import logging
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+import requests
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Forecast slots cover the 3 hours starting at their 'dt'
+SLOT_SECONDS = 3 * 3600
+
+SEVERE_KEYWORDS = ['severe', 'extreme', 'danger', 'warning', 'hurricane', 'tornado']
+MODERATE_KEYWORDS = ['watch', 'advisory', 'moderate']
+
+# One alternation for both keyword lists; the named group tells which list matched
+_SEVERITY_PATTERN = re.compile(
+    '(?P<severe>{})|(?P<moderate>{})'.format(
+        '|'.join(map(re.escape, SEVERE_KEYWORDS)),
+        '|'.join(map(re.escape, MODERATE_KEYWORDS))))
+
+
+def classify_severity(event: str, description: str) -> str:
+    """Classify an alert as Severe, Moderate or Mild in a single scan of its text."""
+    moderate = False
+    for match in _SEVERITY_PATTERN.finditer(f"{event or ''}\n{description or ''}".lower()):
+        if match.lastgroup == 'severe':
+            return 'Severe'
+        moderate = True
+    return 'Moderate' if moderate else 'Mild'
+
+
+class AlertIndex:
+    """
+    Answers "which alerts are active at t" in O(log n).
+
+    The alert start/end times split the timeline into elementary pieces:
+    each boundary point and each open gap between consecutive boundaries.
+    The active set of every piece is precomputed, so a query is one bisect.
+    Intervals are closed, matching start <= t <= end.
+    """
+
+    def __init__(self, alerts: List[Dict]):
+        self.alerts = alerts
+        self._by_start = sorted(alerts, key=lambda a: a['start'])
+        self._starts = [a['start'] for a in self._by_start]
+        self.points = sorted({a['start'] for a in alerts} | {a['end'] for a in alerts})
+        self._at_point: List[List[Dict]] = []
+        self._after_point: List[List[Dict]] = []
+        for point in self.points:
+            self._at_point.append([a for a in alerts if a['start'] <= point <= a['end']])
+            self._after_point.append([a for a in alerts if a['start'] <= point < a['end']])
+
+    def active_at(self, timestamp) -> List[Dict]:
+        i = bisect_right(self.points, timestamp) - 1
+        if i < 0:
+            return []
+        if self.points[i] == timestamp:
+            return self._at_point[i]
+        return self._after_point[i]
+
+    def active_during(self, start, end) -> List[Dict]:
+        """Alerts overlapping the half-open range [start, end): active at start or starting inside it."""
+        active = self.active_at(start)
+        starting = self._by_start[bisect_right(self._starts, start):bisect_left(self._starts, end)]
+        return sorted(active + starting, key=lambda a: a['start']) if starting else active
+
+    def active_between(self, start, end) -> List[Dict]:
+        """Alerts overlapping the closed range [start, end]."""
+        return [a for a in self.alerts if a['start'] <= end and a['end'] >= start]
+
+
+class WeatherAlertService:
+    """Fetches government weather alerts from the One Call API and caches them per location."""
+
+    ONECALL_URL = "https://api.openweathermap.org/data/3.0/onecall"
+
+    # Shared by every service instance in the process
+    _cache = TTLCache(maxsize=2048, ttl=900)
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.environ.get('OPENWEATHERMAP_API_KEY')
+
+    def get_alerts(self, lat: float, lon: float) -> List[Dict]:
+        """Return the alerts for a location, each with a computed severity, sorted by start."""
+        key = f"{round(lat, 2)}:{round(lon, 2)}"
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            params = {
+                'lat': lat,
+                'lon': lon,
+                'appid': self.api_key,
+                'exclude': 'current,minutely,hourly,daily'
+            }
+            response = requests.get(self.ONECALL_URL, params=params, timeout=10)
+            response.raise_for_status()
+            raw_alerts = response.json().get('alerts') or []
+        except requests.exceptions.RequestException as e:
+            # Alerts are best effort (One Call needs its own subscription); don't retry every request
+            logger.warning(f"Error fetching weather alerts: {str(e)}")
+            self._cache.set(key, [])
+            return []
+
+        alerts = sorted(({
+            'event': alert.get('event', ''),
+            'description': alert.get('description', ''),
+            'sender': alert.get('sender_name', ''),
+            'start': alert.get('start', 0),
+            'end': alert.get('end', 0),
+            'severity': classify_severity(alert.get('event', ''), alert.get('description', ''))
+        } for alert in raw_alerts), key=lambda a: a['start'])
+        self._cache.set(key, alerts)
+        return alerts
+
+    @staticmethod
+    def attach_alerts(weather_data: List[Dict], alerts: List[Dict]) -> List[Dict]:
+        """
+        Add an 'alerts' list to every day and to every hourly slot the events
+        of the alerts active at any time during it. Slots are taken to cover
+        the 3 hours starting at their 'dt'.
+        """
+        index = AlertIndex(alerts)
+        for day in weather_data:
+            day_alerts = {}
+            for slot in day.get('hourly', []):
+                active = index.active_during(slot['dt'], slot['dt'] + SLOT_SECONDS) if alerts else []
+                slot['alerts'] = [a['event'] for a in active]
+                for alert in active:
+                    day_alerts[id(alert)] = alert
+            if alerts and day.get('hourly'):
+                # Alerts starting between slots still belong to the day
+                for alert in index.active_between(day['hourly'][0]['dt'], day['hourly'][-1]['dt'] + SLOT_SECONDS - 1):
+                    day_alerts[id(alert)] = alert
+            day['alerts'] = sorted(day_alerts.values(), key=lambda a: a['start'])
+        return weather_data
@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app import app, db
+from models import Trip
+from weather import WeatherAPI
+
+logger = logging.getLogger(__name__)
+
+# How long a stored forecast is served before it is refetched
+WEATHER_MAX_AGE = int(os.environ.get('WEATHER_REFRESH_INTERVAL', 3 * 3600))
+# The 5-day/3-hour forecast does not reach further than this
+FORECAST_HORIZON_DAYS = 5
+MAX_TRIP_DAYS = 30
+
+
+def trip_date_range(trip: Trip) -> Tuple[date, date]:
+    """Trips have no explicit dates; like the public trip page, day 1 is the creation date."""
+    start = (trip.created_at or datetime.utcnow()).date()
+    return start, start + timedelta(days=trip.num_days - 1)
+
+
+def forecast_window(trip: Trip, today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """The part of the trip covered by the forecast, or None when the trip is past or too far out."""
+    today = today or datetime.utcnow().date()
+    start, end = trip_date_range(trip)
+    window_start = max(start, today)
+    window_end = min(end, today + timedelta(days=FORECAST_HORIZON_DAYS - 1))
+    if window_start > window_end:
+        return None
+    return window_start, window_end
+
+
+def is_weather_stale(trip: Trip, max_age: int = WEATHER_MAX_AGE) -> bool:
+    weather = trip.weather_data
+    if not isinstance(weather, dict) or not weather.get('fetched_at'):
+        return True
+    try:
+        fetched_at = datetime.fromisoformat(weather['fetched_at'])
+    except (TypeError, ValueError):
+        return True
+    return (datetime.utcnow() - fetched_at).total_seconds() > max_age
+
+
+def weather_for_display(trip: Trip) -> Tuple[Optional[Dict], bool]:
+    """
+    Stored weather to render with the page, and whether the client should
+    refresh it. Outside the forecast window nothing newer can be fetched, so
+    the last stored forecast is served as it is, or an 'unavailable' marker
+    when there never was one.
+    """
+    weather = trip.weather_data if isinstance(trip.weather_data, dict) else None
+    has_forecast = bool(weather and weather.get('forecast'))
+    if forecast_window(trip) is None:
+        if has_forecast:
+            return weather, False
+        start, end = trip_date_range(trip)
+        return {
+            'unavailable': True,
+            'location': trip.destination,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'forecast': []
+        }, False
+    if not has_forecast:
+        return None, True
+    return weather, is_weather_stale(trip)
+
+
+def refresh_trips_weather(trips: List[Trip], weather_api: WeatherAPI) -> int:
+    """Fetch and store forecasts for the given trips in one batched lookup. Returns trips updated."""
+    today = datetime.utcnow().date()
+    pending = []
+    for trip in trips:
+        window = forecast_window(trip, today)
+        if window:
+            pending.append((trip, window))
+    if not pending:
+        return 0
+
+    results = weather_api.get_weather_batch([{
+        'location': trip.destination,
+        'start_date': window[0].isoformat(),
+        'end_date': window[1].isoformat()
+    } for trip, window in pending])
+
+    fetched_at = datetime.utcnow().isoformat()
+    updated = 0
+    for (trip, window), result in zip(pending, results):
+        if 'error' in result:
+            logger.warning(f"Weather refresh failed for trip {trip.id}: {result['error']}")
+            continue
+        trip.weather_data = {
+            'fetched_at': fetched_at,
+            'location': trip.destination,
+            'start_date': window[0].isoformat(),
+            'end_date': window[1].isoformat(),
+            'forecast': result['forecast']
+        }
+        updated += 1
+    db.session.commit()
+    return updated
+
+
+def refresh_upcoming_trips(weather_api: Optional[WeatherAPI] = None, max_age: int = WEATHER_MAX_AGE,
+                           batch_size: int = 50) -> int:
+    """Refresh stored forecasts of trips that are underway or start within the forecast horizon."""
+    weather_api = weather_api or WeatherAPI()
+    today = datetime.utcnow().date()
+    # Day 1 is the creation date, so only recently created trips can still be running
+    earliest = datetime.combine(today - timedelta(days=MAX_TRIP_DAYS), datetime.min.time())
+    candidates = Trip.query.filter(Trip.created_at >= earliest).order_by(Trip.id).all()
+    due = [trip for trip in candidates
+           if forecast_window(trip, today) and is_weather_stale(trip, max_age)]
+
+    updated = 0
+    for i in range(0, len(due), batch_size):
+        updated += refresh_trips_weather(due[i:i + batch_size], weather_api)
+    logger.info(f"Refreshed weather for {updated} of {len(due)} due trips")
+    return updated
+
+
+@app.cli.command('refresh-weather')
+def refresh_weather_command():
+    """Refresh stored weather for upcoming trips (run from cron or a scheduler)."""
+    updated = refresh_upcoming_trips()
+    print(f"Refreshed weather for {updated} trips")
+
+
+def start_weather_refresher(interval: int = WEATHER_MAX_AGE) -> threading.Thread:
+    """Run refresh_upcoming_trips every interval seconds in a daemon thread of this process."""
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    refresh_upcoming_trips()
+            except Exception as e:
+                logger.error(f"Weather refresh failed: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='weather-refresher', daemon=True)
+    thread.start()
+    return thread